@@ -34,7 +34,9 @@ import org.jetbrains.exposed.v1.jdbc.transactions.transaction
 import org.example.app.services.ChatMessages
 import org.example.app.services.UserChatDocuments
 import org.example.app.services.UserChats
+import org.example.app.services.UserDocumentJobs
 import org.example.app.services.UserDocuments
+import org.example.app.services.resumeDocumentJobs
 import io.ktor.http.encodeURLPath
 
 val dotenv: Dotenv = Dotenv.configure()
@@ -85,7 +87,7 @@ fun main(args: Array<String>) {
             password = rdsPassword
         )
         transaction {
-            SchemaUtils.create(UserDocuments, UserChats, UserChatDocuments, ChatMessages)
+            SchemaUtils.create(UserDocuments, UserChats, UserChatDocuments, ChatMessages, UserDocumentJobs)
         }
 
 
@@ -99,6 +101,9 @@ fun main(args: Array<String>) {
             }
         }
 
+        // Keep tracking uploads whose ingestion jobs were pending at the last shutdown
+        resumeDocumentJobs(this, client)
+
         val cleanupIntervalMillis = 60 * 60 * 1000L
         // Launch background cleanup job
         launch {
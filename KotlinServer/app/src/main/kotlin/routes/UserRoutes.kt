@@ -31,8 +31,11 @@ import org.example.app.services.AlbAuthPlugin
 import org.example.app.services.ChatMessages
 import org.example.app.services.UserChatDocuments
 import org.example.app.services.UserChats
+import org.example.app.services.UserDocumentJobs
 import org.example.app.services.UserDocuments
+import org.example.app.services.fetchRegisteredDocuments
 import org.example.app.services.getEffectiveUserId
+import org.example.app.services.trackDocumentJob
 import org.jetbrains.exposed.v1.core.SortOrder
 import org.jetbrains.exposed.v1.core.and
 import org.jetbrains.exposed.v1.core.eq
@@ -61,7 +64,9 @@ data class SessionResponse(
     val userId: String,
     val documents: List<String>,
     val chats: List<Chat>,
-    val isGuest: Boolean
+    val isGuest: Boolean,
+    // Documents still being ingested; they are also listed in documents
+    val pendingDocuments: List<String> = emptyList()
 )
 
 @Serializable
@@ -114,11 +119,23 @@ fun Route.userRoutes(client: HttpClient) {
 
                 // User is authenticated, proceed with session initialization
                 run {
-                    val documents: List<String> = transaction {
-                        val docs: List<String> = UserDocuments.selectAll().where { UserDocuments.userId eq effectiveUserId }
-                            .map { it[UserDocuments.documentName] }
-                        docs
+                    // Uploads still waiting in the Python server's queue are not in its registry yet
+                    val queuedDocuments: List<String> = transaction {
+                        UserDocumentJobs.selectAll().where { UserDocumentJobs.userId eq effectiveUserId }
+                            .map { it[UserDocumentJobs.documentName] }
                     }
+                    // The Python server's document registry is the source of truth; fall back to our own table if it is unreachable
+                    val registered = fetchRegisteredDocuments(client, effectiveUserId)
+                    val documents: List<String> = if (registered != null) {
+                        (registered.map { it.first } + queuedDocuments).distinct()
+                    } else {
+                        transaction {
+                            UserDocuments.selectAll().where { UserDocuments.userId eq effectiveUserId }
+                                .map { it[UserDocuments.documentName] }
+                        }
+                    }
+                    val pendingDocuments: List<String> =
+                        ((registered ?: emptyList()).filter { it.second != "ready" }.map { it.first } + queuedDocuments).distinct()
                     val chats: List<Map<String, String>> = transaction {
                         val ch: List<Map<String, String>> = UserChats.selectAll().where { UserChats.userId eq effectiveUserId }
                             .map { mapOf("thread_id" to it[UserChats.threadId], "chat_name" to it[UserChats.chatName]) }
@@ -147,6 +164,7 @@ fun Route.userRoutes(client: HttpClient) {
                         documents = documents,
                         chats = chatList,
                         isGuest = effectiveUserId.startsWith("guest_"),
+                        pendingDocuments = pendingDocuments,
                     )
 
                     call.respond(HttpStatusCode.OK, sessionResponse)
@@ -211,7 +229,25 @@ fun Route.userRoutes(client: HttpClient) {
                         }
                     )
 
-                    if (response.status.isSuccess()) {
+                    if (response.status == HttpStatusCode.Accepted) {
+                        // Ingestion runs in the background: record the document as pending until its job finishes
+                        val jobId = Json.parseToJsonElement(response.bodyAsText()).jsonObject["job_id"]!!.jsonPrimitive.content
+                        transaction {
+                            UserDocuments.insert {
+                                it[UserDocuments.userId] = authenticatedUserId
+                                it[UserDocuments.documentName] = source
+                            }
+                            UserDocumentJobs.insert {
+                                it[UserDocumentJobs.userId] = authenticatedUserId
+                                it[UserDocumentJobs.documentName] = source
+                                it[UserDocumentJobs.jobId] = jobId
+                            }
+                        }
+                        call.application.launch {
+                            trackDocumentJob(client, authenticatedUserId, source, jobId)
+                        }
+                        call.respond(HttpStatusCode.Accepted, "Document added and queued for processing")
+                    } else if (response.status.isSuccess()) {
                         transaction {
                             UserDocuments.insert {
                                 it[UserDocuments.userId] = authenticatedUserId
@@ -219,6 +255,8 @@ fun Route.userRoutes(client: HttpClient) {
                             }
                         }
                         call.respond(HttpStatusCode.Created, "Document added and upload successful")
+                    } else if (response.status == HttpStatusCode.Conflict) {
+                        call.respondText("Document already exists", status = HttpStatusCode.Conflict)
                     } else {
                         call.respondText("Upload failed", status = response.status)
                     }
@@ -246,12 +284,22 @@ fun Route.userRoutes(client: HttpClient) {
                         return@delete call.respond(HttpStatusCode.Forbidden, "Access denied")
                     }
 
+                    val isPending = transaction {
+                        UserDocumentJobs.selectAll().where {
+                            (UserDocumentJobs.userId eq authenticatedUserId) and (UserDocumentJobs.documentName eq docName)
+                        }.count() > 0
+                    }
+                    if (isPending) {
+                        return@delete call.respond(HttpStatusCode.Conflict, "Document is still processing")
+                    }
+
                     val response: HttpResponse = client.delete("$pythonServerUrl/delete-doc/") {
                         parameter("user_id", authenticatedUserId)
                         parameter("doc_name", docName)
                     }
 
-                    if (response.status.isSuccess()) {
+                    // A 404 means the Python server has nothing registered for the document, so it is already gone
+                    if (response.status.isSuccess() || response.status == HttpStatusCode.NotFound) {
                         transaction {
                             UserChatDocuments.deleteWhere {
                                 (UserChatDocuments.userId eq authenticatedUserId) and (UserChatDocuments.documentName eq docName)
@@ -263,6 +311,8 @@ fun Route.userRoutes(client: HttpClient) {
                             }
                         }
                         call.respond(HttpStatusCode.OK, "Document deleted successfully")
+                    } else if (response.status == HttpStatusCode.Conflict) {
+                        call.respond(HttpStatusCode.Conflict, "Document is still processing")
                     } else {
                         call.respond(HttpStatusCode.BadRequest, "Document not deleted")
                     }
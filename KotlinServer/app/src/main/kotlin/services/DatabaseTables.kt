@@ -37,4 +37,10 @@ object ChatMessages : Table("chat_messages") {
     val message = text("message")
     val timeSent = timestampWithTimeZone("time_sent").defaultExpression(CurrentTimestampWithTimeZone)
     override val primaryKey = PrimaryKey(id, name = "PK_ChatMessages")
-}
\ No newline at end of file
+}
+object UserDocumentJobs : Table("user_document_jobs") {
+    val userId = text("user_id")
+    val documentName = text("document_name")
+    val jobId = text("job_id")
+    override val primaryKey = PrimaryKey(userId, documentName, name = "PK_UserDocumentJobs")
+}
@@ -0,0 +1,103 @@
+package org.example.app.services
+
+import io.ktor.client.HttpClient
+import io.ktor.client.request.get
+import io.ktor.client.request.parameter
+import io.ktor.client.statement.bodyAsText
+import io.ktor.http.HttpStatusCode
+import io.ktor.http.isSuccess
+import kotlinx.coroutines.CoroutineScope
+import kotlinx.coroutines.delay
+import kotlinx.coroutines.launch
+import kotlinx.serialization.json.Json
+import kotlinx.serialization.json.jsonArray
+import kotlinx.serialization.json.jsonObject
+import kotlinx.serialization.json.jsonPrimitive
+import org.example.app.pythonServerUrl
+import org.jetbrains.exposed.v1.core.and
+import org.jetbrains.exposed.v1.core.eq
+import org.jetbrains.exposed.v1.jdbc.deleteWhere
+import org.jetbrains.exposed.v1.jdbc.selectAll
+import org.jetbrains.exposed.v1.jdbc.transactions.transaction
+import org.slf4j.LoggerFactory
+
+private val logger = LoggerFactory.getLogger("DocumentJobs")
+private const val jobPollIntervalMillis = 3000L
+
+// Reads a job's status from the Python server: "failed" when the job is unknown, null when it could not be read
+private suspend fun fetchJobStatus(client: HttpClient, jobId: String): String? {
+    return try {
+        val response = client.get("$pythonServerUrl/jobs/$jobId")
+        when {
+            response.status == HttpStatusCode.NotFound -> "failed"
+            response.status.isSuccess() ->
+                Json.parseToJsonElement(response.bodyAsText()).jsonObject["status"]?.jsonPrimitive?.content
+            else -> null
+        }
+    } catch (e: Exception) {
+        null
+    }
+}
+
+// Reads a user's documents and their status ("processing" or "ready") from the Python server's registry, null when it could not be read
+suspend fun fetchRegisteredDocuments(client: HttpClient, userId: String): List<Pair<String, String>>? {
+    return try {
+        val response = client.get("$pythonServerUrl/documents/") {
+            parameter("user_id", userId)
+        }
+        if (!response.status.isSuccess()) {
+            return null
+        }
+        val documents = Json.parseToJsonElement(response.bodyAsText()).jsonObject["documents"]?.jsonArray ?: return null
+        documents.map {
+            val document = it.jsonObject
+            document["source"]!!.jsonPrimitive.content to document["status"]!!.jsonPrimitive.content
+        }
+    } catch (e: Exception) {
+        logger.warn("[DOCUMENT_JOBS] Could not list documents from the Python server: ${e.message}")
+        null
+    }
+}
+
+// Polls an ingestion job until it finishes; a failed job's document is removed again
+suspend fun trackDocumentJob(client: HttpClient, userId: String, documentName: String, jobId: String) {
+    while (true) {
+        delay(jobPollIntervalMillis)
+        when (fetchJobStatus(client, jobId)) {
+            "succeeded" -> {
+                transaction {
+                    UserDocumentJobs.deleteWhere { UserDocumentJobs.jobId eq jobId }
+                }
+                return
+            }
+            "failed" -> {
+                transaction {
+                    // Only remove the document if it still belongs to this job
+                    val removed = UserDocumentJobs.deleteWhere { UserDocumentJobs.jobId eq jobId }
+                    if (removed > 0) {
+                        UserChatDocuments.deleteWhere {
+                            (UserChatDocuments.userId eq userId) and (UserChatDocuments.documentName eq documentName)
+                        }
+                        UserDocuments.deleteWhere {
+                            (UserDocuments.userId eq userId) and (UserDocuments.documentName eq documentName)
+                        }
+                    }
+                }
+                logger.info("[DOCUMENT_JOBS] Ingestion job $jobId failed, removed document '$documentName'")
+                return
+            }
+        }
+    }
+}
+
+// Resumes tracking the jobs that were still pending when the server stopped
+fun resumeDocumentJobs(scope: CoroutineScope, client: HttpClient) {
+    val pending = transaction {
+        UserDocumentJobs.selectAll().map {
+            Triple(it[UserDocumentJobs.userId], it[UserDocumentJobs.documentName], it[UserDocumentJobs.jobId])
+        }
+    }
+    for ((userId, documentName, jobId) in pending) {
+        scope.launch { trackDocumentJob(client, userId, documentName, jobId) }
+    }
+}
@@ -9,13 +9,21 @@ import org.jetbrains.exposed.v1.jdbc.selectAll
 import org.jetbrains.exposed.v1.core.eq
 import io.ktor.client.request.delete
 import io.ktor.client.request.parameter
+import io.ktor.client.request.post
+import io.ktor.client.request.setBody
+import io.ktor.http.ContentType
+import io.ktor.http.contentType
 import kotlinx.serialization.Serializable
+import kotlinx.serialization.json.Json
 
 var guestSessionList: java.util.ArrayList<GuestSession> = ArrayList()
 
 @Serializable
 data class GuestSession(val sessionId: String = "guest_" + UUID.randomUUID().toString(), val createdAt: Long = System.currentTimeMillis())
 
+@Serializable
+data class DeleteStatesRequest(val thread_ids: List<String>)
+
 suspend fun cleanupGuestSession(client: HttpClient, guestSession: GuestSession) {
     val sessionId = guestSession.sessionId
     val allDocs: List<String> = transaction {
@@ -31,6 +39,7 @@ suspend fun cleanupGuestSession(client: HttpClient, guestSession: GuestSession)
     // Delete guest uploads/documents and chat data from the database.
     transaction {
         UserDocuments.deleteWhere { UserDocuments.userId eq sessionId }
+        UserDocumentJobs.deleteWhere { UserDocumentJobs.userId eq sessionId }
         UserChats.deleteWhere { UserChats.userId eq sessionId }
     }
     // Delete associated files on the Python server.
@@ -40,9 +49,11 @@ suspend fun cleanupGuestSession(client: HttpClient, guestSession: GuestSession)
             parameter("doc_name", doc)
         }
     }
-    for (threadId in allThreadIds) {
-        client.delete("$pythonServerUrl/delete-state/") {
-            parameter("thread_id", threadId)
+    // Delete all of the guest's thread states in one request
+    if (allThreadIds.isNotEmpty()) {
+        client.post("$pythonServerUrl/delete-states/") {
+            contentType(ContentType.Application.Json)
+            setBody(Json.encodeToString(DeleteStatesRequest(allThreadIds)))
         }
     }
 }
\ No newline at end of file
@@ -15,6 +15,7 @@ import org.jetbrains.exposed.v1.jdbc.SchemaUtils
 import org.jetbrains.exposed.v1.jdbc.Database
 import routes.userRoutes
 import org.example.app.services.UserDocuments
+import org.example.app.services.UserDocumentJobs
 import org.example.app.services.UserChats
 import org.example.app.services.UserChatDocuments
 import org.example.app.services.ChatMessages
@@ -31,7 +32,7 @@ fun initTestDatabase() {
     Database.connect("jdbc:h2:mem:test;DB_CLOSE_DELAY=-1", driver = "org.h2.Driver")
     transaction {
         // Create tables used in your routes.
-        SchemaUtils.create(UserDocuments, UserChats, UserChatDocuments, ChatMessages)
+        SchemaUtils.create(UserDocuments, UserChats, UserChatDocuments, ChatMessages, UserDocumentJobs)
     }
 }
 
@@ -40,7 +41,13 @@ private fun createTestHttpClient(): HttpClient {
     val engine = MockEngine { request ->
         when {
             request.url.encodedPath.contains("/upload-pdf/") -> {
-                respond("Upload success", HttpStatusCode.OK, headersOf("Content-Type", "text/plain"))
+                respond("""{"job_id":"job1","status":"queued"}""", HttpStatusCode.Accepted, headersOf("Content-Type", "application/json"))
+            }
+            request.url.encodedPath.contains("/jobs/") -> {
+                respond("""{"job_id":"job1","status":"succeeded"}""", HttpStatusCode.OK, headersOf("Content-Type", "application/json"))
+            }
+            request.url.encodedPath.contains("/documents/") -> {
+                respond("""{"documents":[{"source":"doc1","status":"ready"},{"source":"doc2","status":"processing"}]}""", HttpStatusCode.OK, headersOf("Content-Type", "application/json"))
             }
             request.url.encodedPath.contains("/delete-doc/") -> {
                 respond("Delete doc success", HttpStatusCode.OK, headersOf("Content-Type", "text/plain"))
@@ -85,6 +92,18 @@ class UserRoutesTest {
         assertEquals(HttpStatusCode.OK, response.status)
     }
 
+    @Test
+    fun testSessionInitListsRegisteredDocuments() = testApplication {
+        application { testModule() }
+        val response = client.get("/chat-page/session-init") {
+            header(HttpHeaders.Accept, ContentType.Application.Json.toString())
+        }
+        assertEquals(HttpStatusCode.OK, response.status)
+        val body = response.bodyAsText()
+        assert(body.contains("\"documents\":[\"doc1\",\"doc2\"]"))
+        assert(body.contains("\"pendingDocuments\":[\"doc2\"]"))
+    }
+
     @Test
     fun testDocumentsPostMissingFormData() = testApplication {
         application { testModule() }
@@ -146,8 +165,8 @@ class UserRoutesTest {
             header(HttpHeaders.ContentType, "multipart/form-data; boundary=$boundary")
             setBody(content)
         }
-        assertEquals(HttpStatusCode.Created, response.status)
-        assert(response.bodyAsText().contains("Document added and upload successful"))
+        assertEquals(HttpStatusCode.Accepted, response.status)
+        assert(response.bodyAsText().contains("Document added and queued for processing"))
     }
 
     @Test
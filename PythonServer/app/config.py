@@ -4,11 +4,19 @@ from dotenv import load_dotenv
 # Load .env file
 load_dotenv()
 
+
+def _per_worker(total: int, workers: int) -> int:
+    """A worker's share of a size configured for all workers together (0 stays 0, which disables the cache)."""
+    return max(1, total // workers) if total > 0 else total
+
+
 class Config:
     # AWS Configuration
     REGION = os.getenv("REGION")
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")
     LLM_MODEL = os.getenv("LLM_MODEL")
+    BEDROCK_MAX_POOL_CONNECTIONS = int(os.getenv("BEDROCK_MAX_POOL_CONNECTIONS", "50"))
+    BEDROCK_MAX_ATTEMPTS = int(os.getenv("BEDROCK_MAX_ATTEMPTS", "3"))
 
     # LangSmith Configuration
     LANGCHAIN_TRACING_V2 = os.getenv("LANGCHAIN_TRACING_V2")
@@ -24,6 +32,114 @@ class Config:
     RDS_PASSWORD = os.getenv("RDS_PASSWORD")
     RDS_DB = os.getenv("RDS_DB")
 
+    # Serving Configuration (gunicorn.conf.py exports WEB_WORKERS so every worker sizes itself the same way)
+    WEB_WORKERS = max(1, int(os.getenv("WEB_WORKERS") or 1))
+    # Postgres connections for all workers together; empty = the server's max_connections less DB_RESERVED_CONNECTIONS, 0 = no cap
+    DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS")) if os.getenv("DB_MAX_CONNECTIONS") else None
+    DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", "10"))  # Left for other clients (the Kotlin server, psql)
+    SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "30"))
+    METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR") or None  # Workers share /metrics through snapshots here
+
+    # Embedding cache Configuration
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_LRU_SIZE = _per_worker(int(os.getenv("EMBEDDING_CACHE_LRU_SIZE", "20000")), WEB_WORKERS)
+
+    # SSE streaming Configuration (tokens are coalesced until either limit is reached)
+    SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", "48"))
+    SSE_FLUSH_MS = float(os.getenv("SSE_FLUSH_MS", "40"))
+
+    # Document grading Configuration (top similarity >= HIGH is relevant, < LOW is not, otherwise ask the LLM)
+    GRADE_SCORE_HIGH = float(os.getenv("GRADE_SCORE_HIGH", "0.75"))
+    GRADE_SCORE_LOW = float(os.getenv("GRADE_SCORE_LOW", "0.35"))
+    SPECULATIVE_GENERATION = os.getenv("SPECULATIVE_GENERATION", "false").lower() == "true"  # Generate while the LLM grader runs
+
+    # Context assembly Configuration (dedupe, merge neighbouring chunks and trim retrieved context before grading and generation)
+    CONTEXT_ASSEMBLY_ENABLED = os.getenv("CONTEXT_ASSEMBLY_ENABLED", "true").lower() == "true"
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # 0 = no budget
+    CONTEXT_DEDUPE_THRESHOLD = float(os.getenv("CONTEXT_DEDUPE_THRESHOLD", "0.8"))  # Share of a chunk's word shingles already in a kept chunk
+
+    # Batch question answering Configuration (/ask-batch/)
+    ASK_BATCH_MAX_QUESTIONS = int(os.getenv("ASK_BATCH_MAX_QUESTIONS", "100"))
+    ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "4"))  # Generations running at once per batch
+    ASK_BATCH_EMBED_CONCURRENCY = int(os.getenv("ASK_BATCH_EMBED_CONCURRENCY", "4"))  # Query embedding calls at once per worker
+
+    # Query embedding and retrieval result cache Configuration (sizes are for all workers together)
+    QUERY_EMBEDDING_CACHE_SIZE = _per_worker(int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "5000")), WEB_WORKERS)
+    RETRIEVAL_CACHE_SIZE = _per_worker(int(os.getenv("RETRIEVAL_CACHE_SIZE", "2000")), WEB_WORKERS)
+    RETRIEVAL_CACHE_TTL_SECONDS = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "60"))
+
+    # In-process hot vector index Configuration (the memory budget is for all workers together)
+    HOT_INDEX_ENABLED = os.getenv("HOT_INDEX_ENABLED", "true").lower() == "true"
+    HOT_INDEX_MAX_MB = float(os.getenv("HOT_INDEX_MAX_MB", "128")) / WEB_WORKERS
+    HOT_INDEX_MAX_CHUNKS = int(os.getenv("HOT_INDEX_MAX_CHUNKS", "20000"))  # Larger documents always use Postgres
+
+    # Answer cache Configuration (entries are for all workers together)
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_MAX_ENTRIES = _per_worker(int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000")), WEB_WORKERS)
+    ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+    ANSWER_CACHE_REPLAY_CHARS = int(os.getenv("ANSWER_CACHE_REPLAY_CHARS", "64"))
+
+    # PDF ingestion Configuration
+    CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "512"))
+    CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "20"))
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+    EMBED_MIN_BATCH_SIZE = int(os.getenv("EMBED_MIN_BATCH_SIZE", "4"))
+    EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+    EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+    EMBED_BACKOFF_SECONDS = float(os.getenv("EMBED_BACKOFF_SECONDS", "0.5"))
+    PDF_SPLIT_BUFFER_CHARS = int(os.getenv("PDF_SPLIT_BUFFER_CHARS", "16000"))
+
+    # PDF extraction process pool Configuration (defaults to this worker's share of the CPUs)
+    EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS") or max(1, (os.cpu_count() or 1) // WEB_WORKERS))
+    EXTRACTION_QUEUE_DEPTH = int(os.getenv("EXTRACTION_QUEUE_DEPTH", "32"))
+    EXTRACTION_SHARD_PAGES = int(os.getenv("EXTRACTION_SHARD_PAGES", "25"))
+    EXTRACTION_TMP_DIR = os.getenv("EXTRACTION_TMP_DIR") or None
+
+    # Ingestion job queue Configuration
+    INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+    INGESTION_QUEUE_MAX = int(os.getenv("INGESTION_QUEUE_MAX", "50"))  # Uploads beyond this get 429
+    INGESTION_SPOOL_DIR = os.getenv("INGESTION_SPOOL_DIR") or "/tmp/ingestion_jobs"  # Keep on a volume to resume jobs after restarts
+    INGESTION_PROGRESS_INTERVAL_SECONDS = float(os.getenv("INGESTION_PROGRESS_INTERVAL_SECONDS", "2"))
+    INGESTION_STALE_SECONDS = float(os.getenv("INGESTION_STALE_SECONDS", "120"))
+    INGESTION_OWNER = os.getenv("INGESTION_OWNER") or None  # Host name recorded on jobs; defaults to the hostname
+
+    # Vector store and index Configuration
+    VECTOR_COLLECTION = os.getenv("VECTOR_COLLECTION", "document_vectors")
+    EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+    VECTOR_INDEX_ON_STARTUP = os.getenv("VECTOR_INDEX_ON_STARTUP", "true").lower() == "true"
+    VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw").lower()  # hnsw | ivfflat | none
+    VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "full").lower()  # full | halfvec | binary (ANN index precision)
+    VECTOR_RERANK_CANDIDATES = int(os.getenv("VECTOR_RERANK_CANDIDATES", "80"))  # Compact-index candidates re-ranked on float32
+    VECTOR_EXACT_SCAN_MAX_CHUNKS = int(os.getenv("VECTOR_EXACT_SCAN_MAX_CHUNKS", "20000"))  # Before pgvector 0.8, smaller filters skip the ANN index
+    HNSW_M = int(os.getenv("HNSW_M", "16"))
+    HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+    HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+    IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+
+    # Conversation compaction and checkpoint maintenance Configuration
+    MESSAGE_WINDOW_TURNS = int(os.getenv("MESSAGE_WINDOW_TURNS", "10"))  # 0 keeps every turn
+    COMPACT_TOOL_OUTPUTS = os.getenv("COMPACT_TOOL_OUTPUTS", "true").lower() == "true"
+    CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "3"))  # 0 disables pruning
+    CHECKPOINT_VACUUM_INTERVAL_SECONDS = float(os.getenv("CHECKPOINT_VACUUM_INTERVAL_SECONDS", "3600"))
+    CHECKPOINT_VACUUM_BATCH = int(os.getenv("CHECKPOINT_VACUUM_BATCH", "500"))
+    THREAD_RETENTION_DAYS = float(os.getenv("THREAD_RETENTION_DAYS", "0"))  # 0 keeps idle threads forever
+    THREAD_GC_CHUNK = int(os.getenv("THREAD_GC_CHUNK", "200"))
+    MAX_BULK_DELETE_THREADS = int(os.getenv("MAX_BULK_DELETE_THREADS", "10000"))
+
+    # Startup warmup Configuration (failed components are retried until they are ready)
+    WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+
+    # Connection pool Configuration
+    DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+    CHECKPOINT_POOL_MIN_SIZE = int(os.getenv("CHECKPOINT_POOL_MIN_SIZE", "2"))
+    CHECKPOINT_POOL_MAX_SIZE = int(os.getenv("CHECKPOINT_POOL_MAX_SIZE", "20"))
+    VECTOR_POOL_SIZE = int(os.getenv("VECTOR_POOL_SIZE", "5"))
+    VECTOR_POOL_MAX_OVERFLOW = int(os.getenv("VECTOR_POOL_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+
     connection_kwargs = {
         "autocommit": True,
         "prepare_threshold": 0,
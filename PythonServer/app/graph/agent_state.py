@@ -11,4 +11,5 @@ class AgentState(TypedDict):
     user_id: str  # Store user ID for filtering results
     thread_id: str  # Store thread ID for multi-threaded conversation tracking
     rewrite_count: int  # Tracks how many times a query has been rewritten    
-    search_kwargs: dict 
\ No newline at end of file
+    search_kwargs: dict
+    retrieval_scores: list[float]  # Cosine similarities of the last retrieval, best first
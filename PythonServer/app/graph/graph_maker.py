@@ -2,22 +2,29 @@ from langgraph.graph import StateGraph, END, START
 from langgraph.prebuilt import tools_condition
 from app.graph.agent_state import AgentState
 import app.graph.nodes as nodes
-from app.config import Config
-from psycopg import AsyncConnection
+import app.services.db_service as db
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from app.services.metrics import CHECKPOINT_SECONDS
 from langchain_core.runnables import RunnableLambda
 import asyncio
 
 _graph=None
-_db_connection = None
 _lock = asyncio.Lock()  #Prevents race conditions when initializing the graph
 
-async def get_db_connection():
-    """Ensure we have a persistent database connection."""
-    global _db_connection
-    if _db_connection is None or _db_connection.closed:  #Check if closed
-        _db_connection = await AsyncConnection.connect(f"postgresql://{Config.RDS_USER}:{Config.RDS_PASSWORD}@{Config.RDS_HOST}:{Config.RDS_PORT}/{Config.RDS_DB}", **Config.connection_kwargs)
-    return _db_connection
+class TimedPostgresSaver(AsyncPostgresSaver):
+    """AsyncPostgresSaver that records checkpoint read and write latency."""
+
+    async def aget_tuple(self, config):
+        with CHECKPOINT_SECONDS.time(operation="get"):
+            return await super().aget_tuple(config)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        with CHECKPOINT_SECONDS.time(operation="put"):
+            return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        with CHECKPOINT_SECONDS.time(operation="put_writes"):
+            return await super().aput_writes(config, writes, task_id, task_path)
 
 async def agent_wrapper(state):
     return await nodes.agent(state)
@@ -30,8 +37,8 @@ async def make_graph():
             return  #Prevents duplicate initialization
 
         try:
-            conn = await get_db_connection()  #Use persistent connection
-            checkpointer = AsyncPostgresSaver(conn)  #Store checkpointing connection
+            pool = await db.get_checkpoint_pool()  #Shared connection pool
+            checkpointer = TimedPostgresSaver(pool)  #Concurrent threads checkpoint on separate connections
 
             # Ensure the checkpointing system is ready
             await checkpointer.setup()
@@ -45,6 +52,7 @@ async def make_graph():
             # Other workflow nodes
             workflow.add_node("rewrite", nodes.rewrite)
             workflow.add_node("generate", nodes.generate)
+            workflow.add_node("compact", nodes.compact)  # Bounds the stored message history
 
             # Graph edges
             workflow.add_edge(START, "agent")
@@ -53,14 +61,15 @@ async def make_graph():
                 tools_condition,
                 {
                     "tools": "retrieve",
-                    END: END,
+                    END: "compact",
                 },
             )
             workflow.add_conditional_edges(
                 "retrieve",
                 nodes.grade_documents,
             )
-            workflow.add_edge("generate", END)
+            workflow.add_edge("generate", "compact")
+            workflow.add_edge("compact", END)
             workflow.add_edge("rewrite", "agent")
 
             # Compile the graph with checkpointing
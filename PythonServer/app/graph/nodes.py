@@ -1,13 +1,24 @@
+import logging
+import time
 from typing import Literal
-from langchain_core.output_parsers import StrOutputParser
-from pydantic import BaseModel, Field
+from langchain_core.callbacks.manager import adispatch_custom_event
 from langsmith import traceable
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from langgraph.prebuilt import ToolNode
 from app.graph.agent_state import AgentState
+import app.graph.speculation as speculation
+from app.config import Config
 import app.services.prompts as PromptTemplate
-from app.services.llm_service import get_llm
+from app.services.llm_service import get_llm, get_llm_with_tools, get_grader_chain, get_generation_chain
 from app.services.pgvector_service import get_retriever_tool
+from app.services.vector_indexes import vector_search_settings
+from app.services.checkpoint_maintenance import compact_messages
+from app.services.metrics import GRADE_DECISIONS, GRAPH_NODE_SECONDS, GRAPH_REWRITES, timed
+
+logger = logging.getLogger(__name__)
+
+# Built once; ToolNode injects search_kwargs from state into the tool call
+_tool_node = ToolNode([get_retriever_tool()])
 
 
 def get_last_human_message(messages):
@@ -27,10 +38,16 @@ def increment_count(state: AgentState):
 ### Edges
 
 @traceable
-async def grade_documents(state) -> Literal["generate", "rewrite"]:
+@timed(GRAPH_NODE_SECONDS, node="grade_documents")
+async def grade_documents(state, config) -> Literal["generate", "rewrite"]:
     """
     Determines whether the retrieved documents are relevant to the question.
 
+    Clear-cut cases are decided from the retrieval similarity scores; only
+    scores between GRADE_SCORE_LOW and GRADE_SCORE_HIGH go to the LLM grader.
+    With SPECULATIVE_GENERATION the answer is generated while the LLM grader
+    runs and handed to the generate node, or discarded if the grade is "no".
+
     Args:
         state (messages): The current state
 
@@ -38,40 +55,69 @@ async def grade_documents(state) -> Literal["generate", "rewrite"]:
         str: A decision for whether the documents are relevant or not
     """
 
-    # Define LLM response schema
-    class Grade(BaseModel):
-        binary_score: str = Field(description="Relevance score 'yes' or 'no'")
+    messages = state["messages"]
+    rewrite_count = state.get("rewrite_count", 0)
 
-    llm = get_llm()
-    # Use async LLM call
-    llm_with_tool = llm.with_structured_output(Grade)
-    prompt = PromptTemplate.get_grader_prompt()
-    chain = prompt | llm_with_tool
+    # After one rewrite we generate regardless of the grade, so skip grading entirely
+    if rewrite_count >= 1:
+        logger.info("[GRADE] path=rewrite_limit decision=generate")
+        GRADE_DECISIONS.inc(path="rewrite_limit", decision="generate")
+        return "generate"
+
+    # Decide locally when the retrieval similarities are clearly high or clearly low
+    scores = state.get("retrieval_scores") or []
+    top_score = max(scores) if scores else None
+    if top_score is None or top_score < Config.GRADE_SCORE_LOW:
+        logger.info(f"[GRADE] path=score_low top_score={top_score} decision=rewrite")
+        GRADE_DECISIONS.inc(path="score_low", decision="rewrite")
+        return "rewrite"
+    if top_score >= Config.GRADE_SCORE_HIGH:
+        logger.info(f"[GRADE] path=score_high top_score={top_score:.3f} decision=generate")
+        GRADE_DECISIONS.inc(path="score_high", decision="generate")
+        return "generate"
+
+    # Ambiguous band: cached grader prompt | structured-output chain
+    chain = get_grader_chain()
 
-    messages = state["messages"]
     last_message = messages[-1]
 
     question = get_last_human_message(messages)
     docs = last_message.content
 
-    scored_result = await chain.ainvoke({"question": question, "context": docs})
+    # Buffered speculative answer; run without the graph's callbacks so no token reaches the client yet
+    thread_id = config.get("configurable", {}).get("thread_id")
+    speculative = Config.SPECULATIVE_GENERATION and thread_id is not None
+    if speculative:
+        speculation.start(thread_id, get_generation_chain().astream(
+            {"context": docs, "question": question},
+            config={"callbacks": [], "run_name": "speculative_generate"},
+        ))
+
+    start = time.perf_counter()
+    try:
+        scored_result = await chain.ainvoke({"question": question, "context": docs})
+    except BaseException:
+        if speculative:
+            speculation.discard(thread_id)
+        raise
     score = scored_result.binary_score
 
-    rewrite_count = state.get("rewrite_count", 0)
-
-    if score == "yes" or rewrite_count >= 1:
-        return "generate"
-    else:
-        return "rewrite"
+    decision = "generate" if score == "yes" else "rewrite"
+    if speculative and decision == "rewrite":
+        speculation.reject(thread_id)
+    logger.info(f"[GRADE] path=llm top_score={top_score:.3f} grade={score} decision={decision} latency_ms={(time.perf_counter() - start) * 1000:.0f}")
+    GRADE_DECISIONS.inc(path="llm", decision=decision)
+    return decision
 
 
 ### Nodes
 
 @traceable
+@timed(GRAPH_NODE_SECONDS, node="agent")
 async def agent(state):
     """
     Invokes the agent model to generate a response based on the current state.
-    Dynamically decides whether to retrieve data using search_kwargs.
+    Decides whether to call the retriever tool, which filters with the state's search_kwargs.
 
     Args:
         state (dict): The current state containing messages and retrieval settings.
@@ -81,15 +127,9 @@ async def agent(state):
     """
 
     messages = state["messages"]
-    search_kwargs = state.get("search_kwargs")  # Extract user-specific retrieval settings
-
-    llm = get_llm()
-
-    #Dynamically create retriever tool for this request
-    retriever_tool = await get_retriever_tool(search_kwargs)
 
-    #Bind tools dynamically (retriever tool per request)
-    model = llm.bind_tools([retriever_tool])
+    #Shared retriever tool; the request's search_kwargs are injected from state when it runs
+    model = get_llm_with_tools([get_retriever_tool()])
 
     # Select the appropriate prompt
     if isinstance(messages[-1], AIMessage):
@@ -109,6 +149,7 @@ async def agent(state):
     }
 
 @traceable
+@timed(GRAPH_NODE_SECONDS, node="rewrite")
 async def rewrite(state):
     """
     Transform the query to produce a better question.
@@ -135,6 +176,7 @@ async def rewrite(state):
     ]
 
     llm = get_llm()
+    GRAPH_REWRITES.inc()
 
     # Use async invoke for LLM call
     response = await llm.ainvoke(msg)
@@ -142,9 +184,11 @@ async def rewrite(state):
     return {"messages": [response], "rewrite_count": state.get("rewrite_count") + 1}
 
 @traceable
-async def generate(state):
+@timed(GRAPH_NODE_SECONDS, node="generate")
+async def generate(state, config):
     """
-    Generate answer
+    Generate answer. If grade_documents started a speculative generation for
+    this thread, its buffered tokens are released as custom events instead.
 
     Args:
         state (messages): The current state
@@ -157,24 +201,50 @@ async def generate(state):
     last_message = messages[-1]
     docs = last_message.content
 
-    prompt = PromptTemplate.get_generate_prompt()
+    thread_id = config.get("configurable", {}).get("thread_id")
+    pending = speculation.take(thread_id) if thread_id is not None else None
+    if pending is not None:
+        async def emit(token):
+            await adispatch_custom_event(speculation.TOKEN_EVENT, {"token": token}, config=config)
 
-    llm = get_llm()
+        response = await pending.release(emit)
+        return {"messages": [AIMessage(content=response)], "rewrite_count": 0}
 
     # Use async invoke for LLM call
-    rag_chain = prompt | llm | StrOutputParser()
+    rag_chain = get_generation_chain()
     response = await rag_chain.ainvoke({"context": docs, "question": question})
 
-    return {"messages": [response], "rewrite_count": 0}
+    # Stored as the model's turn; a bare string would be added as a HumanMessage
+    return {"messages": [AIMessage(content=response)], "rewrite_count": 0}
 
 @traceable
+@timed(GRAPH_NODE_SECONDS, node="retrieve")
 async def retrieve(state):
     """
-    Custom retrieve node that creates a filtered retriever tool based on
-    the current request's search_kwargs. This ensures per-request document
-    filtering instead of using a static unfiltered retriever.
+    Custom retrieve node that runs the shared retriever tool. The tool reads
+    the current request's search_kwargs from state, so documents are still
+    filtered per request without rebuilding the retriever.
     """
     search_kwargs = state.get("search_kwargs") or {}
-    retriever_tool = await get_retriever_tool(search_kwargs)
-    tool_node = ToolNode([retriever_tool])
-    return await tool_node.ainvoke(state)
\ No newline at end of file
+    with vector_search_settings(search_kwargs.get("ef_search")):
+        result = await _tool_node.ainvoke(state)
+
+    # Carry the similarity scores from the tool output into state for grade_documents
+    scores = []
+    for message in result["messages"]:
+        if isinstance(message, ToolMessage) and message.artifact:
+            scores.extend(message.artifact)
+    result["retrieval_scores"] = sorted(scores, reverse=True)
+    return result
+
+@traceable
+@timed(GRAPH_NODE_SECONDS, node="compact")
+async def compact(state):
+    """
+    Runs at the end of each turn so the checkpointed message list stays bounded:
+    old turns are dropped and earlier tool outputs are replaced with a stub.
+    """
+    updates = compact_messages(state["messages"])
+    if not updates:
+        return {}
+    return {"messages": updates}
\ No newline at end of file
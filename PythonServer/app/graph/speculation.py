@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+from app.services.metrics import SPECULATIVE_GENERATIONS, SPECULATIVE_HEAD_START_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Custom event the generate node dispatches for each released token
+TOKEN_EVENT = "speculative_token"
+
+# Speculative generations handed from grade_documents to the generate node, by thread_id
+_pending = {}
+
+
+class Speculation:
+    """
+    An answer generated in the background while the grader runs.
+
+    Tokens are buffered until the generate node takes the speculation over
+    and releases them; a "no" grade cancels it and nothing is sent.
+    """
+
+    def __init__(self, token_stream):
+        self.tokens = []
+        self.started = time.perf_counter()
+        self._updated = asyncio.Event()
+        self.task = asyncio.create_task(self._run(token_stream))
+
+    async def _run(self, token_stream):
+        try:
+            async for token in token_stream:
+                if token:
+                    self.tokens.append(token)
+                    self._updated.set()
+        finally:
+            self._updated.set()
+
+    def cancel(self):
+        self.task.cancel()
+
+    async def release(self, emit) -> str:
+        """Sends the buffered tokens, then the rest as they arrive, through `emit`. Returns the full answer."""
+        SPECULATIVE_HEAD_START_SECONDS.observe(time.perf_counter() - self.started)
+        sent = 0
+        while True:
+            while sent < len(self.tokens):
+                await emit(self.tokens[sent])
+                sent += 1
+            if self.task.done():
+                break
+            self._updated.clear()
+            await self._updated.wait()
+        self.task.result()  # Raises if the generation failed
+        return "".join(self.tokens)
+
+
+def start(thread_id: str, token_stream) -> Speculation:
+    """Starts consuming `token_stream` in the background, replacing any speculation left for the thread."""
+    discard(thread_id)
+    speculation = Speculation(token_stream)
+    _pending[thread_id] = speculation
+    return speculation
+
+
+def take(thread_id: str):
+    """Hands the thread's speculation to the generate node, or returns None if there is none."""
+    speculation = _pending.pop(thread_id, None)
+    if speculation is not None:
+        SPECULATIVE_GENERATIONS.inc(outcome="used")
+    return speculation
+
+
+def reject(thread_id: str):
+    """Cancels the thread's speculation after a "no" grade."""
+    speculation = _pending.pop(thread_id, None)
+    if speculation is not None:
+        speculation.cancel()
+        SPECULATIVE_GENERATIONS.inc(outcome="discarded")
+
+
+def discard(thread_id: str):
+    """Cancels a speculation the run never used, e.g. when the client disconnected first."""
+    speculation = _pending.pop(thread_id, None)
+    if speculation is not None:
+        speculation.cancel()
+        SPECULATIVE_GENERATIONS.inc(outcome="abandoned")
+        logger.info(f"[SPECULATION] Abandoned speculative generation for thread {thread_id}")
@@ -1,13 +1,45 @@
+import time
+
+_import_started = time.perf_counter()
+
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.routes.api import router
+import app.services.db_service as db
+import app.services.checkpoint_maintenance as checkpoint_maintenance
+import app.services.document_events as document_events
+import app.services.ingestion_jobs as ingestion_jobs
+import app.services.metrics as metrics
+import app.services.warmup as warmup
+import app.services.shutdown as shutdown
 
 # Set logging level to DEBUG
 logging.basicConfig(level=logging.DEBUG)
 
-app = FastAPI()
+warmup.record_import_time(time.perf_counter() - _import_started)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pools, vector store, graph, Bedrock clients and tokenizer are warmed in parallel
+    # in the background; /ready reports 503 until they are all up
+    shutdown.install_signal_handlers()  # SIGTERM drains in-flight SSE streams before workers exit
+    warmup.start_warmup()
+    document_events.start_listening()  # Cache invalidations from other workers and instances
+    checkpoint_maintenance.start_vacuum_task()
+    metrics.start_snapshot_task()  # Lets whichever worker serves /metrics report every worker
+    yield
+    await warmup.stop_warmup()
+    await document_events.stop_listening()
+    await ingestion_jobs.stop_workers()
+    await checkpoint_maintenance.stop_vacuum_task()
+    await metrics.stop_snapshot_task()
+    await db.close_pools()
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(router)
 
 if __name__ == "__main__":
+    # Development server; production runs gunicorn with gunicorn.conf.py
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,14 +1,25 @@
 from fastapi import APIRouter, Query, UploadFile, File, Form, Request
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from app.graph.graph_maker import get_graph
-from app.services.pdf_processing import upload_text
-from psycopg import AsyncConnection
+import app.graph.speculation as speculation
+import app.services.ingestion_jobs as ingestion_jobs
 from app.config import Config
-from app.services.pgvector_service import get_vector_store
+import app.services.db_service as db
+import app.services.document_registry as registry
+import app.services.checkpoint_maintenance as checkpoint_maintenance
+from app.services.vector_indexes import explain_retrieval
+from app.services.document_events import notify_document_changed
+from app.services.answer_cache import get_answer_cache, make_key
+from app.services.pgvector_service import embed_query
+import app.services.metrics as metrics
+import app.services.warmup as warmup
+import app.services.batch_answers as batch_answers
+import app.services.shutdown as shutdown
+from app.services.sse import DONE_FRAME, STREAM_END, cancel_on_disconnect, coalesce_token_frames, event_frame, token_frame
+from langchain_core.messages import AIMessage, HumanMessage
 import traceback
-import asyncpg
-import json
 import time
+import json
 import asyncio
 import logging
 
@@ -21,28 +32,82 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+MAX_MESSAGE_LENGTH = 4000
+
 @router.post("/upload-pdf/")
 async def upload_pdf(
     file: UploadFile = File(...),
     user_id: str = Form(...),
     source: str = Form(...)
 ):
+    """
+    Queues a PDF for ingestion and returns 202 with a job id.
+
+    Progress is available from /jobs/{job_id}. Returns 409 when the document
+    already exists or is being processed, and 429 when the ingestion queue is full.
+    """
+    if shutdown.is_draining():
+        return _draining_response()
+
     file.file.seek(0)
-    """Processes a PDF file and uploads text to the vector database."""
     if file.content_type != "application/pdf":
         return JSONResponse(content={"message": "Invalid file type. Please upload a PDF."}, status_code=400)
 
     try:
-        doc_metadata = {"user_id": user_id, "source": source}
-        await upload_text(file.file, doc_metadata)
+        job = await ingestion_jobs.submit_job(file.file, user_id, source, filename=file.filename)
+    except ingestion_jobs.DuplicateDocumentError:
+        logger.info(f"[UPLOAD_PDF] Document '{source}' already exists for user {user_id[:8] if user_id else 'None'}..., upload skipped")
+        return JSONResponse(
+            content={"message": f"Document from source '{source}' already exists. Upload skipped."},
+            status_code=409
+        )
+    except ingestion_jobs.QueueFullError:
+        logger.warning(f"[UPLOAD_PDF] Ingestion queue full, rejecting upload for user {user_id[:8] if user_id else 'None'}...")
+        return JSONResponse(
+            content={"message": "The server is busy processing other uploads. Please try again shortly."},
+            status_code=429,
+            headers={"Retry-After": "30"}
+        )
     except Exception as e:
         error_details = traceback.format_exc()
         # SECURITY: Log full error details server-side, but send generic message to client
-        logger.error(f"[UPLOAD_PDF] Error processing PDF for user {user_id[:8] if user_id else 'None'}...: {str(e)}")
+        logger.error(f"[UPLOAD_PDF] Error queueing PDF for user {user_id[:8] if user_id else 'None'}...: {str(e)}")
         logger.error(f"[UPLOAD_PDF] FULL TRACEBACK: {error_details}")
         return JSONResponse(content={"message": "Failed to process PDF. Please try again."}, status_code=500)
 
-    return JSONResponse(content={"filename": file.filename, "message": "PDF processed and graph stored successfully."})
+    return JSONResponse(
+        content={"filename": file.filename, "message": "PDF queued for processing.", **job},
+        status_code=202
+    )
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Reports an ingestion job's status, stage, pages processed, chunks embedded and error."""
+    try:
+        job = await ingestion_jobs.get_job(job_id)
+        if job is None:
+            return JSONResponse(content={"message": "Job not found."}, status_code=404)
+
+        return {
+            "job_id": job["job_id"],
+            "source": job["source"],
+            "filename": job["filename"],
+            "status": job["status"],
+            "stage": job["stage"],
+            "pages_total": job["pages_total"],
+            "pages_processed": job["pages_processed"],
+            "chunks_embedded": job["chunks_embedded"],
+            "error": job["error"],
+            "created_at": job["created_at"].isoformat(),
+            "updated_at": job["updated_at"].isoformat(),
+        }
+
+    except Exception as e:
+        error_details = traceback.format_exc()
+        # SECURITY: Log full error details server-side, but send generic message to client
+        logger.error(f"[GET_JOB] Error reading job {job_id}: {str(e)}")
+        logger.error(f"[GET_JOB] FULL TRACEBACK: {error_details}")
+        return JSONResponse(content={"message": "Failed to read job. Please try again."}, status_code=500)
 
 @router.post("/ask-stream/")
 async def ask_question_stream(request: Request):
@@ -64,12 +129,16 @@ async def ask_question_stream(request: Request):
     """
     start_time = time.time()
 
+    if shutdown.is_draining():
+        return _draining_response()
+
     try:
         body = await request.json()
         query = body.get("query")
         thread_id = body.get("thread_id")
         user_id = body.get("user_id")
         document_names = body.get("document_names", [])
+        ef_search = body.get("ef_search")
 
         # Validate document_names
         if not isinstance(document_names, list):
@@ -85,6 +154,13 @@ async def ask_question_stream(request: Request):
         # Filter out any non-string or empty values
         document_names = [d for d in document_names if isinstance(d, str) and d.strip()]
 
+        # Validate optional per-request HNSW search breadth
+        if ef_search is not None and (isinstance(ef_search, bool) or not isinstance(ef_search, int) or not 1 <= ef_search <= 1000):
+            return JSONResponse(
+                content={"error": "ef_search must be an integer between 1 and 1000"},
+                status_code=400
+            )
+
         logger.info(f"[ASK_STREAM] Starting request - User: {user_id[:8] if user_id else 'None'}..., Thread: {thread_id}, Query length: {len(query) if query else 0}, Document count: {len(document_names)}")
 
         # Validate required parameters
@@ -96,7 +172,6 @@ async def ask_question_stream(request: Request):
             )
 
         # Validate message length
-        MAX_MESSAGE_LENGTH = 4000
         if len(query) > MAX_MESSAGE_LENGTH:
             logger.error(f"[ASK_STREAM] Query too long - Thread: {thread_id}, Length: {len(query)}")
             return JSONResponse(
@@ -112,20 +187,8 @@ async def ask_question_stream(request: Request):
         logger.info(f"[ASK_STREAM] Initializing AI graph for thread {thread_id}")
         graph = await get_graph()
 
-        # Calculate k dynamically: (5 * number of documents) but cap at 20
-        num_docs = len(document_names)
-        k = min(5 * num_docs, 20) if num_docs > 0 else 5  # Default to 5 if no docs are specified
-
-        # Construct search filters
-        search_kwargs = {
-            "k": k,
-            "filter": {
-                "user_id": user_id,
-                "source": {"$in": document_names}  # Filter by document names
-            }
-        }
-
-        logger.info(f"[ASK_STREAM] Prepared search kwargs: k={k}, documents count={len(document_names)}")
+        search_kwargs = _build_search_kwargs(user_id, document_names, ef_search)
+        logger.info(f"[ASK_STREAM] Prepared search kwargs: k={search_kwargs['k']}, documents count={len(document_names)}")
 
         inputs = {
             "messages": [
@@ -136,76 +199,151 @@ async def ask_question_stream(request: Request):
 
         config = {"configurable": {"thread_id": thread_id}}
 
-        async def event_generator():
-            """Generate SSE events from LangGraph stream"""
+        # Repeated first questions over the same document set can reuse a cached answer
+        cache_key = query_embedding = cached_answer = None
+        if Config.ANSWER_CACHE_ENABLED and document_names:
             try:
-                logger.info(f"[ASK_STREAM] Starting event stream for thread {thread_id}")
-                token_count = 0
-
-                # Stream events from LangGraph with 5-minute timeout
-                STREAM_TIMEOUT_SECONDS = 300  # 5 minutes
-
-                try:
-                    # Stream all LLM tokens from the graph
-                    async with asyncio.timeout(STREAM_TIMEOUT_SECONDS):
-                        event_count = 0
-
-                        async for event in graph.astream_events(inputs, config, version="v2"):
-                            # Check if client disconnected
-                            if await request.is_disconnected():
-                                logger.info(f"[ASK_STREAM] Client disconnected for thread {thread_id}")
-                                return
-
-                            event_count += 1
-                            event_type = event.get("event")
-
-                            # Log first few events for debugging
-                            if event_count <= 10:
-                                logger.info(f"[ASK_STREAM] Event #{event_count}: type={event_type}, keys={list(event.keys())}")
-
-                            # Only process streaming events from LLM calls
-                            if event_type == "on_chat_model_stream":
-                                # Only stream tokens from the generate and agent nodes.
-                                # Exclude rewrite (query reformulation) and grade_documents
-                                # (relevance scoring) since those are internal graph steps.
-                                node_name = event.get("metadata", {}).get("langgraph_node")
-                                if node_name in ("rewrite", "grade_documents"):
-                                    continue
-
-                                chunk = event.get("data", {}).get("chunk", {})
-
-                                # Extract content using hasattr for proper attribute access
-                                if hasattr(chunk, "content"):
-                                    content = chunk.content
-
-                                    # Only stream string content (skip tool calls)
-                                    if isinstance(content, str) and content:
-                                        token_count += 1
-                                        if token_count <= 5:
-                                            logger.debug(f"[ASK_STREAM] Yielding token #{token_count}")
-                                        yield f"data: {json.dumps({'token': content})}\n\n"
+                cache_key, query_embedding, cached_answer = await _lookup_cached_answer(graph, config, user_id, document_names, query)
+            except Exception as e:
+                logger.warning(f"[ANSWER_CACHE] Lookup failed for thread {thread_id}, answering without cache: {str(e)}")
+                cache_key = None
 
-                except asyncio.TimeoutError:
-                    logger.error(f"[ASK_STREAM] Timeout after {STREAM_TIMEOUT_SECONDS}s for thread {thread_id} - Tokens generated: {token_count}")
-                    yield f"data: {json.dumps({'error': 'Stream timeout. The response took too long to generate. Please try a shorter question.'})}\n\n"
-                    return
+        async def cached_answer_generator():
+            """Replay a cached answer as SSE token events"""
+            try:
+                # Record the turn so follow-up questions on this thread see it
+                await graph.aupdate_state(
+                    config,
+                    {
+                        "messages": [HumanMessage(content=query), AIMessage(content=cached_answer)],
+                        "search_kwargs": search_kwargs
+                    },
+                    as_node="compact"
+                )
+                checkpoint_maintenance.schedule_prune(thread_id)
+
+                step = max(1, Config.ANSWER_CACHE_REPLAY_CHARS)
+                metrics.ASK_STREAM_TTFT_SECONDS.observe(time.time() - start_time)
+                for i in range(0, len(cached_answer), step):
+                    yield token_frame(cached_answer[i:i + step])
 
                 elapsed_time = time.time() - start_time
-                logger.info(f"[ASK_STREAM] Stream completed for thread {thread_id} - Tokens: {token_count}, Duration: {elapsed_time:.2f}s")
-
-                # Send completion signal
-                yield f"data: {json.dumps({'done': True})}\n\n"
+                metrics.ASK_STREAM_REQUESTS.inc(outcome="cached")
+                metrics.ASK_STREAM_DURATION_SECONDS.observe(elapsed_time)
+                logger.info(f"[ASK_STREAM] Served cached answer for thread {thread_id} - Duration: {elapsed_time:.2f}s, Cache: {get_answer_cache().stats()}")
+                yield event_frame({'done': True, 'cached': True})
 
             except Exception as e:
-                elapsed_time = time.time() - start_time
                 error_details = traceback.format_exc()
                 # SECURITY: Log full error details server-side, but send generic message to client
-                logger.error(f"[ASK_STREAM] ERROR in event generator - Thread: {thread_id}, Duration: {elapsed_time:.2f}s, Error: {str(e)}")
+                metrics.ASK_STREAM_REQUESTS.inc(outcome="error")
+                logger.error(f"[ASK_STREAM] ERROR replaying cached answer - Thread: {thread_id}, Error: {str(e)}")
                 logger.error(f"[ASK_STREAM] FULL TRACEBACK: {error_details}")
-                yield f"data: {json.dumps({'error': 'An error occurred processing your request. Please try again.'})}\n\n"
+                yield event_frame({'error': 'An error occurred processing your request. Please try again.'})
+
+        # Stream events from LangGraph with 5-minute timeout
+        STREAM_TIMEOUT_SECONDS = 300  # 5 minutes
+        answer_parts = []
+
+        async def run_graph(tokens: asyncio.Queue):
+            """Run the graph and feed answer tokens to the stream"""
+            async with asyncio.timeout(STREAM_TIMEOUT_SECONDS):
+                async for event in graph.astream_events(inputs, config, version="v2"):
+                    # Tokens of a speculative answer, released by generate once the grade is "yes"
+                    if event["event"] == "on_custom_event":
+                        if event["name"] == speculation.TOKEN_EVENT:
+                            answer_parts.append(event["data"]["token"])
+                            tokens.put_nowait(event["data"]["token"])
+                        continue
+
+                    # Only process streaming events from LLM calls
+                    if event["event"] != "on_chat_model_stream":
+                        continue
+
+                    # Only stream tokens from the generate and agent nodes.
+                    # Exclude rewrite (query reformulation) and grade_documents
+                    # (relevance scoring) since those are internal graph steps.
+                    if event["metadata"].get("langgraph_node") in ("rewrite", "grade_documents"):
+                        continue
+
+                    content = getattr(event["data"].get("chunk"), "content", None)
+
+                    # Only stream string content (skip tool calls)
+                    if isinstance(content, str) and content:
+                        answer_parts.append(content)
+                        tokens.put_nowait(content)
+
+        async def event_generator():
+            """Generate SSE events from LangGraph stream"""
+            with shutdown.track_stream():
+                tokens = asyncio.Queue()
+                run = asyncio.create_task(run_graph(tokens))
+                run.add_done_callback(lambda _: tokens.put_nowait(STREAM_END))
+                # Cancels the graph run (and its Bedrock calls) as soon as the client goes away,
+                # or when a shutdown drain runs out of time
+                watcher = asyncio.create_task(cancel_on_disconnect(request, run))
+                drain_watcher = asyncio.create_task(shutdown.cancel_on_drain(run))
+                try:
+                    logger.info(f"[ASK_STREAM] Starting event stream for thread {thread_id}")
+
+                    first_token_time = None
+                    async for frame in coalesce_token_frames(tokens):
+                        if first_token_time is None:
+                            first_token_time = time.time()
+                            metrics.ASK_STREAM_TTFT_SECONDS.observe(first_token_time - start_time)
+                        yield frame
+
+                    if run.cancelled() and drain_watcher.done() and not drain_watcher.cancelled():
+                        metrics.ASK_STREAM_REQUESTS.inc(outcome="drained")
+                        logger.warning(f"[ASK_STREAM] Shutdown drain timed out for thread {thread_id} after {len(answer_parts)} tokens")
+                        yield event_frame({'error': 'The server is restarting. Please ask again.', 'retry': True})
+                        return
+                    if run.cancelled():
+                        metrics.ASK_STREAM_REQUESTS.inc(outcome="disconnected")
+                        logger.info(f"[ASK_STREAM] Client disconnected for thread {thread_id} - Graph run cancelled after {len(answer_parts)} tokens")
+                        return
+                    if run.exception() is not None:
+                        raise run.exception()
+
+                    elapsed_time = time.time() - start_time
+                    metrics.ASK_STREAM_REQUESTS.inc(outcome="completed")
+                    metrics.ASK_STREAM_DURATION_SECONDS.observe(elapsed_time)
+                    if first_token_time is not None and len(answer_parts) > 1 and time.time() > first_token_time:
+                        metrics.ASK_STREAM_TOKENS_PER_SECOND.observe((len(answer_parts) - 1) / (time.time() - first_token_time))
+                    logger.info(f"[ASK_STREAM] Stream completed for thread {thread_id} - Tokens: {len(answer_parts)}, Duration: {elapsed_time:.2f}s")
+
+                    if cache_key is not None:
+                        get_answer_cache().store(cache_key, query_embedding, "".join(answer_parts))
+                    checkpoint_maintenance.schedule_prune(thread_id)
+
+                    # Send completion signal
+                    yield DONE_FRAME
+
+                except asyncio.TimeoutError:
+                    metrics.ASK_STREAM_REQUESTS.inc(outcome="timeout")
+                    logger.error(f"[ASK_STREAM] Timeout after {STREAM_TIMEOUT_SECONDS}s for thread {thread_id} - Tokens generated: {len(answer_parts)}")
+                    yield event_frame({'error': 'Stream timeout. The response took too long to generate. Please try a shorter question.'})
+
+                except Exception as e:
+                    elapsed_time = time.time() - start_time
+                    error_details = traceback.format_exc()
+                    # SECURITY: Log full error details server-side, but send generic message to client
+                    metrics.ASK_STREAM_REQUESTS.inc(outcome="error")
+                    logger.error(f"[ASK_STREAM] ERROR in event generator - Thread: {thread_id}, Duration: {elapsed_time:.2f}s, Error: {str(e)}")
+                    logger.error(f"[ASK_STREAM] FULL TRACEBACK: {error_details}")
+                    yield event_frame({'error': 'An error occurred processing your request. Please try again.'})
+
+                finally:
+                    watcher.cancel()
+                    drain_watcher.cancel()
+                    if not run.done():
+                        run.cancel()
+                        logger.info(f"[ASK_STREAM] Stream closed for thread {thread_id} - Graph run cancelled")
+                    await asyncio.gather(run, watcher, drain_watcher, return_exceptions=True)
+                    speculation.discard(thread_id)  # In case the run ended between grading and generate
 
         return StreamingResponse(
-            event_generator(),
+            cached_answer_generator() if cached_answer is not None else event_generator(),
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
@@ -229,25 +367,173 @@ async def ask_question_stream(request: Request):
         )
 
 
+@router.post("/ask-batch/")
+async def ask_batch(request: Request):
+    """
+    Answers a list of questions over one user's document set, streamed as NDJSON.
+
+    Query embeddings are requested together, retrievals run concurrently and
+    at most ASK_BATCH_CONCURRENCY generations run at once. Each question is
+    answered on its own from its retrieved context: there is no agent step, no
+    rewrite and no thread, and nothing is checkpointed.
+
+    Args:
+        request (Request): FastAPI request containing JSON body with:
+            - questions (list[str]): The questions to answer
+            - user_id (str): User identifier for filtering documents
+            - document_names (list[str]): List of document names to search within
+            - ef_search (int, optional): HNSW search breadth
+
+    Returns:
+        StreamingResponse: One JSON object per line as each question completes,
+        with its index in `questions`, then a final line with "done": true
+    """
+    start_time = time.time()
+
+    if shutdown.is_draining():
+        return _draining_response()
+
+    try:
+        body = await request.json()
+        questions = body.get("questions")
+        user_id = body.get("user_id")
+        document_names = body.get("document_names", [])
+        ef_search = body.get("ef_search")
+
+        if not user_id or not isinstance(questions, list) or not questions:
+            return JSONResponse(content={"error": "questions (a non-empty list) and user_id are required"}, status_code=400)
+        if len(questions) > Config.ASK_BATCH_MAX_QUESTIONS:
+            return JSONResponse(
+                content={"error": f"Too many questions. Maximum is {Config.ASK_BATCH_MAX_QUESTIONS}."},
+                status_code=400
+            )
+        if not all(isinstance(q, str) and q.strip() and len(q) <= MAX_MESSAGE_LENGTH for q in questions):
+            return JSONResponse(
+                content={"error": f"Every question must be a non-empty string of at most {MAX_MESSAGE_LENGTH} characters."},
+                status_code=400
+            )
+        if not isinstance(document_names, list) or len(document_names) > 100:
+            return JSONResponse(content={"error": "document_names must be a list of at most 100 names"}, status_code=400)
+        document_names = [d for d in document_names if isinstance(d, str) and d.strip()]
+        if ef_search is not None and (isinstance(ef_search, bool) or not isinstance(ef_search, int) or not 1 <= ef_search <= 1000):
+            return JSONResponse(content={"error": "ef_search must be an integer between 1 and 1000"}, status_code=400)
+
+        search_kwargs = _build_search_kwargs(user_id, document_names, ef_search)
+        logger.info(f"[ASK_BATCH] Starting batch - User: {user_id[:8]}..., Questions: {len(questions)}, Document count: {len(document_names)}")
+
+        async def ndjson_generator():
+            """Yield each result as one JSON line as soon as it completes"""
+            with shutdown.track_stream():
+                results = asyncio.Queue()
+                run = asyncio.create_task(batch_answers.answer_batch(user_id, document_names, questions, search_kwargs, results))
+                run.add_done_callback(lambda _: results.put_nowait(STREAM_END))
+                # Cancels the remaining questions when the client goes away or a shutdown drain runs out of time
+                watcher = asyncio.create_task(cancel_on_disconnect(request, run))
+                drain_watcher = asyncio.create_task(shutdown.cancel_on_drain(run))
+                answered = set()
+                errors = 0
+                try:
+                    while (result := await results.get()) is not STREAM_END:
+                        answered.add(result["index"])
+                        errors += "error" in result
+                        yield json.dumps(result) + "\n"
+
+                    if run.cancelled() and drain_watcher.done() and not drain_watcher.cancelled():
+                        logger.warning(f"[ASK_BATCH] Shutdown drain timed out with {len(questions) - len(answered)} questions unanswered")
+                        for index in range(len(questions)):
+                            if index not in answered:
+                                yield json.dumps({"index": index, "error": "The server is restarting. Please ask again.", "retry": True}) + "\n"
+                        return
+                    if run.cancelled():
+                        logger.info(f"[ASK_BATCH] Client disconnected after {len(answered)} of {len(questions)} questions")
+                        return
+                    if run.exception() is not None:
+                        raise run.exception()
+
+                    elapsed_time = time.time() - start_time
+                    logger.info(f"[ASK_BATCH] Batch completed - Questions: {len(questions)}, Errors: {errors}, Duration: {elapsed_time:.2f}s")
+                    yield json.dumps({"done": True, "count": len(answered), "errors": errors, "seconds": round(elapsed_time, 3)}) + "\n"
+
+                except Exception as e:
+                    error_details = traceback.format_exc()
+                    # SECURITY: Log full error details server-side, but send generic message to client
+                    logger.error(f"[ASK_BATCH] ERROR in batch - User: {user_id[:8]}..., Error: {str(e)}")
+                    logger.error(f"[ASK_BATCH] FULL TRACEBACK: {error_details}")
+                    yield json.dumps({"error": "An error occurred processing your request. Please try again."}) + "\n"
+
+                finally:
+                    watcher.cancel()
+                    drain_watcher.cancel()
+                    if not run.done():
+                        run.cancel()
+                    await asyncio.gather(run, watcher, drain_watcher, return_exceptions=True)
+
+        return StreamingResponse(
+            ndjson_generator(),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    except Exception as e:
+        elapsed_time = time.time() - start_time
+        error_details = traceback.format_exc()
+        # SECURITY: Log full error details server-side, but send generic message to client
+        logger.error(f"[ASK_BATCH] ERROR - Duration: {elapsed_time:.2f}s, Error: {str(e)}")
+        logger.error(f"[ASK_BATCH] FULL TRACEBACK: {error_details}")
+        return JSONResponse(content={"error": "An error occurred. Please try again."}, status_code=500)
+
+
+def _build_search_kwargs(user_id: str, document_names: list[str], ef_search: int = None) -> dict:
+    """Builds the retrieval filters for a question over the user's documents."""
+    # Calculate k dynamically: (5 * number of documents) but cap at 20
+    num_docs = len(document_names)
+    k = min(5 * num_docs, 20) if num_docs > 0 else 5  # Default to 5 if no docs are specified
+
+    search_kwargs = {
+        "k": k,
+        "filter": {
+            "user_id": user_id,
+            "source": {"$in": document_names}  # Filter by document names
+        }
+    }
+    if ef_search is not None:
+        search_kwargs["ef_search"] = ef_search
+    return search_kwargs
+
+
+def _draining_response():
+    return JSONResponse(
+        content={"error": "The server is restarting. Please try again."},
+        status_code=503,
+        headers={"Retry-After": "5"}
+    )
+
+
+async def _lookup_cached_answer(graph, config: dict, user_id: str, document_names: list[str], query: str):
+    """
+    Looks up a cached answer for the first question on a thread.
+
+    Returns (cache_key, query_embedding, answer). The key is None when the
+    answer must not be cached: the thread already has history, or one of the
+    documents is not ready. The answer is None on a cache miss.
+    """
+    state, versions = await asyncio.gather(
+        graph.aget_state(config),
+        registry.get_document_versions(user_id, document_names),
+    )
+    if state.values.get("messages") or not set(document_names) <= versions.keys():
+        return None, None, None
+
+    cache_key = make_key(user_id, document_names, versions)
+    query_embedding = await embed_query(query)  # Shared with the retriever's query embedding cache
+    return cache_key, query_embedding, get_answer_cache().lookup(cache_key, query_embedding)
+
+
 @router.delete("/delete-state/")
 async def delete_state(thread_id: str):
     """Deletes all records related to a given thread ID from relevant tables."""
-    conn = None
     try:
-        conn = await asyncpg.connect(
-            database=Config.RDS_DB,
-            user=Config.RDS_USER,
-            password=Config.RDS_PASSWORD,
-            host=Config.RDS_HOST,
-            port=int(Config.RDS_PORT)
-        )
-
-        async with conn.transaction():
-            # Delete from related tables first
-            await conn.execute("DELETE FROM checkpoint_blobs WHERE thread_id = $1", thread_id)
-            await conn.execute("DELETE FROM checkpoint_writes WHERE thread_id = $1", thread_id)
-            # Finally, delete from checkpoints
-            await conn.execute("DELETE FROM checkpoints WHERE thread_id = $1", thread_id)
+        await checkpoint_maintenance.delete_threads([thread_id])
 
         return {"response": f"State for thread_id {thread_id} deleted successfully."}
 
@@ -257,55 +543,158 @@ async def delete_state(thread_id: str):
         logger.error(f"[DELETE_STATE] Error deleting state for thread {thread_id}: {str(e)}")
         logger.error(f"[DELETE_STATE] FULL TRACEBACK: {error_details}")
         return JSONResponse(content={"message": "Failed to delete state. Please try again."}, status_code=500)
-    finally:
-        if conn:
-            await conn.close()
+
+@router.post("/delete-states/")
+async def delete_states(request: Request):
+    """
+    Deletes the state of many threads in one transaction.
+
+    Expects a JSON body {"thread_ids": [...]} and reports the rows and bytes removed per table.
+    """
+    try:
+        body = await request.json()
+        thread_ids = body.get("thread_ids")
+        if not isinstance(thread_ids, list) or not all(isinstance(t, str) and t for t in thread_ids):
+            return JSONResponse(content={"message": "thread_ids must be a list of non-empty strings"}, status_code=400)
+        if len(thread_ids) > Config.MAX_BULK_DELETE_THREADS:
+            return JSONResponse(
+                content={"message": f"Too many thread_ids. Maximum is {Config.MAX_BULK_DELETE_THREADS}."},
+                status_code=400
+            )
+        if not thread_ids:
+            return {"threads": 0, "rows": {}, "bytes": {}}
+
+        report = await checkpoint_maintenance.delete_threads(thread_ids)
+        logger.info(f"[DELETE_STATES] Deleted {report['threads']} threads: {report['rows']}")
+        return report
+
+    except Exception as e:
+        error_details = traceback.format_exc()
+        # SECURITY: Log full error details server-side, but send generic message to client
+        logger.error(f"[DELETE_STATES] Error deleting thread states: {str(e)}")
+        logger.error(f"[DELETE_STATES] FULL TRACEBACK: {error_details}")
+        return JSONResponse(content={"message": "Failed to delete states. Please try again."}, status_code=500)
+
+@router.post("/gc-threads/")
+async def gc_threads(retention_days: float = None):
+    """Runs the idle-thread GC now and reports the threads, rows and bytes reclaimed."""
+    retention_days = Config.THREAD_RETENTION_DAYS if retention_days is None else retention_days
+    if retention_days <= 0:
+        return JSONResponse(content={"message": "retention_days must be greater than 0"}, status_code=400)
+    try:
+        return await checkpoint_maintenance.gc_idle_threads(retention_days)
+
+    except Exception as e:
+        error_details = traceback.format_exc()
+        # SECURITY: Log full error details server-side, but send generic message to client
+        logger.error(f"[THREAD_GC] Error collecting idle threads: {str(e)}")
+        logger.error(f"[THREAD_GC] FULL TRACEBACK: {error_details}")
+        return JSONResponse(content={"message": "Failed to collect idle threads."}, status_code=500)
 
 @router.delete("/delete-doc/")
 async def delete_document(user_id: str, doc_name: str):
-    """Deletes a document from the vector store by filtering on metadata."""
+    """
+    Deletes a document's chunks and registry entry. Succeeds when the document
+    is not registered, so retries are safe; returns 409 while it is still being ingested.
+    """
     try:
-        # Get the vector store instance
-        vector_store = await get_vector_store()
-        if vector_store is None:
-            raise RuntimeError("Vector store is not initialized.")
-
-        # First check if the document exists (use async method)
-        existing_docs = await vector_store.asimilarity_search(
-            query="check_exists",
-            k=1,
-            filter={"user_id": user_id, "source": doc_name}
-        )
-        if not existing_docs:
-            return JSONResponse(content={"message": "Document not found. Nothing to delete."}, status_code=404)
-
-        # Delete vectors by metadata filter using raw SQL via the connection
-        # pgvector's PGVector class uses a collection-based approach
-        # We need to delete directly from the langchain_pg_embedding table
-        conn = await asyncpg.connect(
-            database=Config.RDS_DB,
-            user=Config.RDS_USER,
-            password=Config.RDS_PASSWORD,
-            host=Config.RDS_HOST,
-            port=int(Config.RDS_PORT)
-        )
-        try:
-            # Delete from langchain's embedding table where metadata matches
-            await conn.execute(
-                """
-                DELETE FROM langchain_pg_embedding
-                WHERE cmetadata->>'user_id' = $1 AND cmetadata->>'source' = $2
-                """,
-                user_id, doc_name
-            )
-        finally:
-            await conn.close()
+        if await ingestion_jobs.has_active_job(user_id, doc_name):
+            raise registry.DocumentProcessingError()
+        # Registry lookup and chunk delete happen in one transaction
+        deleted = await registry.delete_document(user_id, doc_name, processing_ok=False)
+        if not deleted:
+            return {"response": f"Document '{doc_name}' for user '{user_id}' was not registered. Nothing to delete."}
+        await notify_document_changed(user_id, doc_name)
 
         return {"response": f"Document '{doc_name}' for user '{user_id}' deleted successfully."}
 
+    except registry.DocumentProcessingError:
+        return JSONResponse(
+            content={"message": f"Document '{doc_name}' is still being processed. Try again once it is ready."},
+            status_code=409
+        )
     except Exception as e:
         error_details = traceback.format_exc()
         # SECURITY: Log full error details server-side, but send generic message to client
         logger.error(f"[DELETE_DOC] Error deleting document '{doc_name}' for user {user_id[:8] if user_id else 'None'}...: {str(e)}")
         logger.error(f"[DELETE_DOC] FULL TRACEBACK: {error_details}")
-        return JSONResponse(content={"message": "Failed to delete document. Please try again."}, status_code=500)
\ No newline at end of file
+        return JSONResponse(content={"message": "Failed to delete document. Please try again."}, status_code=500)
+
+@router.get("/documents/")
+async def list_documents(user_id: str):
+    """Lists a user's documents from the document registry."""
+    try:
+        documents = await registry.list_documents(user_id)
+        return {
+            "documents": [
+                {
+                    "source": doc["source"],
+                    "status": doc["status"],
+                    "chunk_count": doc["chunk_count"],
+                    "byte_size": doc["byte_size"],
+                    "content_hash": doc["content_hash"],
+                    "created_at": doc["created_at"].isoformat(),
+                    "updated_at": doc["updated_at"].isoformat(),
+                }
+                for doc in documents
+            ]
+        }
+
+    except Exception as e:
+        error_details = traceback.format_exc()
+        # SECURITY: Log full error details server-side, but send generic message to client
+        logger.error(f"[LIST_DOCS] Error listing documents for user {user_id[:8] if user_id else 'None'}...: {str(e)}")
+        logger.error(f"[LIST_DOCS] FULL TRACEBACK: {error_details}")
+        return JSONResponse(content={"message": "Failed to list documents. Please try again."}, status_code=500)
+
+@router.get("/vector-index-check/")
+async def vector_index_check(
+    user_id: str,
+    document_names: list[str] = Query(default=[]),
+    k: int = 5,
+    ef_search: int = None
+):
+    """EXPLAINs the filtered retrieval query to confirm the ANN and metadata indexes are used."""
+    try:
+        return await explain_retrieval(user_id, document_names, k=k, ef_search=ef_search)
+
+    except Exception as e:
+        error_details = traceback.format_exc()
+        # SECURITY: Log full error details server-side, but send generic message to client
+        logger.error(f"[INDEX_CHECK] Error explaining retrieval query: {str(e)}")
+        logger.error(f"[INDEX_CHECK] FULL TRACEBACK: {error_details}")
+        return JSONResponse(content={"message": "Failed to check vector indexes."}, status_code=500)
+
+@router.get("/db-health/")
+async def db_health():
+    """Checks every database pool and reports pool sizes and wait metrics."""
+    health = await db.check_health()
+    status_code = 200 if all(check["ok"] for check in health.values()) else 503
+    return JSONResponse(content={"health": health, "pools": db.pool_stats()}, status_code=status_code)
+
+@router.get("/checkpoint-stats/")
+async def checkpoint_stats():
+    """Reports message compaction, checkpoint pruning and vacuum metrics with current table sizes."""
+    try:
+        return {
+            "maintenance": checkpoint_maintenance.get_stats(),
+            "table_bytes": await checkpoint_maintenance.get_table_sizes(),
+        }
+
+    except Exception as e:
+        error_details = traceback.format_exc()
+        # SECURITY: Log full error details server-side, but send generic message to client
+        logger.error(f"[CHECKPOINT_STATS] Error reading checkpoint stats: {str(e)}")
+        logger.error(f"[CHECKPOINT_STATS] FULL TRACEBACK: {error_details}")
+        return JSONResponse(content={"message": "Failed to read checkpoint stats."}, status_code=500)
+
+@router.get("/ready")
+async def ready():
+    """Readiness probe: 200 once startup warmup finished, with each component's status and timing."""
+    report = {**warmup.get_report(), **shutdown.get_stats()}
+    return JSONResponse(content=report, status_code=200 if report["ready"] and not report["draining"] else 503)
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    """Exports latency histograms, counters and cache gauges in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,162 @@
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+from app.config import Config
+from app.services.document_events import register_document_listener
+from app.services.metrics import register_gauge
+
+logger = logging.getLogger(__name__)
+
+_answer_cache = None
+
+
+def make_key(user_id: str, document_names: list[str], versions: dict, namespace: str = "ask") -> tuple:
+    """
+    Builds the cache key for a question over a document set.
+
+    `versions` maps each source to its registry updated_at, so a re-uploaded
+    document never matches answers cached for its previous content, even on
+    another app instance that did not see the upload. `namespace` keeps
+    answers from different endpoints apart.
+    """
+    sources = tuple(sorted(set(document_names)))
+    return (
+        user_id,
+        sources,
+        tuple(versions[source].timestamp() for source in sources),
+        namespace,
+    )
+
+
+class _Entry:
+    __slots__ = ("vector", "answer", "expires_at")
+
+    def __init__(self, vector, answer: str, expires_at: float):
+        self.vector = vector
+        self.answer = answer
+        self.expires_at = expires_at
+
+
+class AnswerCache:
+    """
+    Caches generated answers per (user, document set, document versions).
+
+    Within a document set, a question matches a cached one when the cosine
+    similarity of their query embeddings is at least `similarity_threshold`.
+    The cache holds at most `max_entries` answers; the least recently used
+    document set loses its oldest answer first. Entries expire after
+    `ttl_seconds`.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._sets = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop_expired(self, key, now: float):
+        entries = self._sets.get(key)
+        if not entries:
+            return []
+        live = [entry for entry in entries if entry.expires_at > now]
+        expired = len(entries) - len(live)
+        if expired:
+            self.expirations += expired
+            self._size -= expired
+            if live:
+                self._sets[key] = live
+            else:
+                del self._sets[key]
+        return live
+
+    def lookup(self, key: tuple, embedding):
+        """Returns the cached answer closest to `embedding`, or None if nothing is similar enough."""
+        vector = self._normalize(embedding)
+        with self._lock:
+            entries = self._drop_expired(key, time.monotonic())
+            if entries:
+                similarities = np.stack([entry.vector for entry in entries]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    self._sets.move_to_end(key)
+                    self.hits += 1
+                    return entries[best].answer
+            self.misses += 1
+            return None
+
+    def store(self, key: tuple, embedding, answer: str):
+        if self.max_entries == 0 or not answer:
+            return
+        entry = _Entry(self._normalize(embedding), answer, time.monotonic() + self.ttl_seconds)
+        with self._lock:
+            self._sets.setdefault(key, []).append(entry)
+            self._sets.move_to_end(key)
+            self._size += 1
+            while self._size > self.max_entries:
+                oldest_key, entries = next(iter(self._sets.items()))
+                entries.pop(0)
+                if not entries:
+                    del self._sets[oldest_key]
+                self._size -= 1
+                self.evictions += 1
+
+    def invalidate_document(self, user_id: str, source: str):
+        """Drops every cached answer for a document set that includes (user_id, source)."""
+        with self._lock:
+            stale = [key for key in self._sets if key[0] == user_id and source in key[1]]
+            for key in stale:
+                removed = len(self._sets.pop(key))
+                self._size -= removed
+                self.invalidations += removed
+        if stale:
+            logger.info(f"[ANSWER_CACHE] Invalidated {len(stale)} document sets for source '{source}'")
+
+    def clear(self):
+        with self._lock:
+            self._sets.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": self._size,
+                "document_sets": len(self._sets),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+def get_answer_cache() -> AnswerCache:
+    """Returns the process-wide answer cache, registering it for document change events."""
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache(
+            max_entries=Config.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=Config.ANSWER_CACHE_TTL_SECONDS,
+            similarity_threshold=Config.ANSWER_CACHE_SIMILARITY,
+        )
+        register_document_listener(_answer_cache.invalidate_document)
+        register_gauge("answer_cache_hit_ratio", "Hit ratio of the semantic answer cache.", lambda: _answer_cache.stats()["hit_rate"])
+        register_gauge("answer_cache_entries", "Answers held in the semantic answer cache.", lambda: _answer_cache.stats()["size"])
+    return _answer_cache
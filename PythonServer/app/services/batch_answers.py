@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+import traceback
+from app.config import Config
+import app.services.document_registry as registry
+from app.services.answer_cache import get_answer_cache, make_key
+from app.services.context_assembly import assemble_context
+from app.services.llm_service import get_generation_chain
+from app.services.metrics import ASK_BATCH_QUESTIONS
+from app.services.pgvector_service import embed_queries, embed_query, search_with_scores
+from app.services.vector_indexes import vector_search_settings
+
+logger = logging.getLogger(__name__)
+
+
+async def _answer(index: int, query: str, search_kwargs: dict, cache_key, embedding, generations: asyncio.Semaphore) -> dict:
+    """Retrieves, assembles and generates the answer to one question of a batch."""
+    start = time.perf_counter()
+    result = {"index": index, "query": query}
+    try:
+        if embedding is None:
+            # The batch embedding failed for this question; embed it on its own
+            embedding = await embed_query(query)
+        cached = get_answer_cache().lookup(cache_key, embedding) if cache_key is not None else None
+        if cached is not None:
+            ASK_BATCH_QUESTIONS.inc(outcome="cached")
+            return {**result, "answer": cached, "cached": True, "seconds": round(time.perf_counter() - start, 3)}
+
+        with vector_search_settings(search_kwargs.get("ef_search")):
+            results = await search_with_scores(query, search_kwargs)
+        similarities = [1.0 - distance for _, distance in results]
+        context, stats = assemble_context([(doc, similarity) for (doc, _), similarity in zip(results, similarities)])
+
+        async with generations:
+            answer = await get_generation_chain().ainvoke({"context": context, "question": query})
+
+        if cache_key is not None:
+            get_answer_cache().store(cache_key, embedding, answer)
+        ASK_BATCH_QUESTIONS.inc(outcome="answered")
+        return {
+            **result,
+            "answer": answer,
+            "cached": False,
+            "top_score": round(max(similarities), 4) if similarities else None,
+            "context_tokens": stats["tokens_out"],
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+    except asyncio.CancelledError:
+        ASK_BATCH_QUESTIONS.inc(outcome="cancelled")
+        raise
+    except Exception as e:
+        error_details = traceback.format_exc()
+        # SECURITY: Log full error details server-side, but send generic message to client
+        ASK_BATCH_QUESTIONS.inc(outcome="error")
+        logger.error(f"[ASK_BATCH] Question {index} failed: {str(e)}")
+        logger.error(f"[ASK_BATCH] FULL TRACEBACK: {error_details}")
+        return {**result, "error": "An error occurred answering this question."}
+
+
+async def answer_batch(user_id: str, document_names: list[str], queries: list[str], search_kwargs: dict, results: asyncio.Queue):
+    """
+    Answers every question over the same document set and puts each result on `results` as it completes.
+
+    All query embeddings are requested in one round and the retrievals run
+    concurrently; at most ASK_BATCH_CONCURRENCY generations run at once. No
+    graph is run and nothing is checkpointed. Answers go through the answer
+    cache, under their own keys so they never answer /ask-stream/ questions.
+    """
+    cache_keys = [None] * len(queries)
+    embeddings = await embed_queries(queries)
+    if Config.ANSWER_CACHE_ENABLED and document_names:
+        versions = await registry.get_document_versions(user_id, document_names)
+        if set(document_names) <= versions.keys():
+            cache_keys = [make_key(user_id, document_names, versions, namespace="batch")] * len(queries)
+
+    generations = asyncio.Semaphore(Config.ASK_BATCH_CONCURRENCY)
+
+    async def run(index: int):
+        result = await _answer(index, queries[index], search_kwargs, cache_keys[index], embeddings[index], generations)
+        results.put_nowait(result)
+
+    await asyncio.gather(*(run(index) for index in range(len(queries))))
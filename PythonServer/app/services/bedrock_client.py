@@ -0,0 +1,26 @@
+from app.config import Config
+
+_client = None
+
+
+def get_bedrock_client():
+    """
+    Returns the process-wide bedrock-runtime client shared by the LLM and embeddings.
+
+    boto3 clients are thread-safe, so one client (and its connection pool) serves
+    every request instead of a new client per call.
+    """
+    global _client
+    if _client is None:
+        import boto3
+        from botocore.config import Config as BotoConfig
+
+        _client = boto3.client(
+            "bedrock-runtime",
+            region_name=Config.REGION,
+            config=BotoConfig(
+                max_pool_connections=Config.BEDROCK_MAX_POOL_CONNECTIONS,
+                retries={"max_attempts": Config.BEDROCK_MAX_ATTEMPTS, "mode": "adaptive"},
+            ),
+        )
+    return _client
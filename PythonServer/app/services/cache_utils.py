@@ -0,0 +1,87 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU cache with hit/miss counters.
+
+    Used by the in-process caches that sit in front of Bedrock and Postgres.
+    With `ttl_seconds` set, entries also expire that long after they were put.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float = None):
+        self.maxsize = max(0, int(maxsize))
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._expires = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _expired(self, key) -> bool:
+        if self.ttl_seconds is None or self._expires[key] > time.monotonic():
+            return False
+        del self._data[key]
+        del self._expires[key]
+        return True
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data and not self._expired(key):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.ttl_seconds is not None:
+                self._expires[key] = time.monotonic() + self.ttl_seconds
+            while len(self._data) > self.maxsize:
+                oldest, _ = self._data.popitem(last=False)
+                self._expires.pop(oldest, None)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            self._expires.pop(key, None)
+            return self._data.pop(key, default)
+
+    def invalidate(self, predicate) -> int:
+        """Removes every entry whose key matches `predicate`; returns how many were removed."""
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+                self._expires.pop(key, None)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data and not self._expired(key)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
@@ -0,0 +1,353 @@
+import asyncio
+import logging
+import time
+from langchain_core.messages import HumanMessage, RemoveMessage, ToolMessage
+from app.config import Config
+import app.services.db_service as db
+
+logger = logging.getLogger(__name__)
+
+COMPACTED_TOOL_OUTPUT = "[Retrieved context from an earlier turn was removed to keep the conversation compact.]"
+
+_vacuum_task = None
+_prune_tasks = {}
+
+_stats = {
+    "messages_removed": 0,
+    "tool_outputs_compacted": 0,
+    "tool_output_chars_saved": 0,
+    "threads_pruned": 0,
+    "checkpoints_pruned": 0,
+    "writes_pruned": 0,
+    "blobs_pruned": 0,
+    "blob_bytes_reclaimed": 0,
+    "gc_threads_deleted": 0,
+    "gc_rows_deleted": 0,
+    "gc_bytes_reclaimed": 0,
+    "vacuum_runs": 0,
+    "last_vacuum_seconds": None,
+}
+
+
+### Message window
+
+def compact_messages(messages: list) -> list:
+    """
+    Returns add_messages updates that keep a thread's message list bounded.
+
+    Turns older than the last MESSAGE_WINDOW_TURNS human messages are removed,
+    and tool outputs from turns before the latest one are replaced with a short
+    stub, since only the current turn's retrieval is ever graded or answered from.
+    """
+    human_positions = [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+    if not human_positions:
+        return []
+
+    updates = []
+    window = Config.MESSAGE_WINDOW_TURNS
+    cutoff = 0
+    if window > 0 and len(human_positions) > window:
+        # Cut on a human message so tool calls and their results stay paired
+        cutoff = human_positions[-window]
+        updates.extend(RemoveMessage(id=message.id) for message in messages[:cutoff])
+        _stats["messages_removed"] += cutoff
+
+    if Config.COMPACT_TOOL_OUTPUTS:
+        for message in messages[cutoff:human_positions[-1]]:
+            if isinstance(message, ToolMessage) and message.content != COMPACTED_TOOL_OUTPUT:
+                _stats["tool_outputs_compacted"] += 1
+                _stats["tool_output_chars_saved"] += len(str(message.content))
+                # Same id, so add_messages replaces the stored message in place
+                updates.append(message.model_copy(update={"content": COMPACTED_TOOL_OUTPUT, "artifact": None}))
+
+    return updates
+
+
+### Checkpoint pruning
+
+async def prune_thread(thread_id: str, keep: int = None) -> dict:
+    """
+    Deletes all but the latest `keep` checkpoints of a thread, their pending
+    writes, and the channel blobs no remaining checkpoint references.
+
+    A blob is only deleted if its version is older than the newest version of
+    its channel, so blobs written for a checkpoint that is being saved right
+    now are never touched.
+    """
+    keep = Config.CHECKPOINT_KEEP_LAST if keep is None else keep
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            pruned = await conn.fetch(
+                """
+                WITH ranked AS (
+                    SELECT checkpoint_ns, checkpoint_id,
+                           row_number() OVER (PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC) AS position
+                    FROM checkpoints
+                    WHERE thread_id = $1
+                )
+                DELETE FROM checkpoints c
+                USING ranked r
+                WHERE c.thread_id = $1
+                  AND c.checkpoint_ns = r.checkpoint_ns
+                  AND c.checkpoint_id = r.checkpoint_id
+                  AND r.position > $2
+                RETURNING c.checkpoint_ns, c.checkpoint_id
+                """,
+                thread_id, keep
+            )
+            if not pruned:
+                return {"checkpoints": 0, "writes": 0, "blobs": 0, "blob_bytes": 0}
+
+            writes = await conn.execute(
+                """
+                DELETE FROM checkpoint_writes
+                WHERE thread_id = $1 AND (checkpoint_ns, checkpoint_id) IN (
+                    SELECT * FROM unnest($2::text[], $3::text[])
+                )
+                """,
+                thread_id,
+                [row["checkpoint_ns"] for row in pruned],
+                [row["checkpoint_id"] for row in pruned]
+            )
+            blobs = await conn.fetch(
+                """
+                DELETE FROM checkpoint_blobs b
+                WHERE b.thread_id = $1
+                  AND NOT EXISTS (
+                      SELECT 1 FROM checkpoints c
+                      WHERE c.thread_id = b.thread_id
+                        AND c.checkpoint_ns = b.checkpoint_ns
+                        AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version
+                  )
+                  AND b.version < (
+                      SELECT max(c.checkpoint -> 'channel_versions' ->> b.channel)
+                      FROM checkpoints c
+                      WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns
+                  )
+                RETURNING coalesce(octet_length(b.blob), 0) AS size
+                """,
+                thread_id
+            )
+
+    result = {
+        "checkpoints": len(pruned),
+        "writes": int(writes.split()[-1]),
+        "blobs": len(blobs),
+        "blob_bytes": sum(row["size"] for row in blobs),
+    }
+    _stats["threads_pruned"] += 1
+    _stats["checkpoints_pruned"] += result["checkpoints"]
+    _stats["writes_pruned"] += result["writes"]
+    _stats["blobs_pruned"] += result["blobs"]
+    _stats["blob_bytes_reclaimed"] += result["blob_bytes"]
+    return result
+
+
+def schedule_prune(thread_id: str):
+    """Prunes a thread in the background after a turn; at most one prune per thread runs at a time."""
+    if Config.CHECKPOINT_KEEP_LAST <= 0 or thread_id in _prune_tasks:
+        return
+
+    async def run():
+        try:
+            result = await prune_thread(thread_id)
+            if result["checkpoints"]:
+                logger.debug(f"[CHECKPOINT_PRUNE] Thread {thread_id}: {result}")
+        except Exception as e:
+            logger.warning(f"[CHECKPOINT_PRUNE] Failed to prune thread {thread_id}: {str(e)}")
+        finally:
+            _prune_tasks.pop(thread_id, None)
+
+    _prune_tasks[thread_id] = asyncio.create_task(run())
+
+
+### Thread deletion and idle-thread GC
+
+async def _delete_thread_rows(conn, thread_ids: list[str]) -> dict:
+    """Set-based delete of every checkpoint row for the given threads; returns rows and bytes per table."""
+    report = {"rows": {}, "bytes": {}}
+    for table, size in (
+        ("checkpoint_blobs", "coalesce(octet_length(blob), 0)"),
+        ("checkpoint_writes", "octet_length(blob)"),
+        ("checkpoints", "pg_column_size(checkpoint) + pg_column_size(metadata)"),
+    ):
+        row = await conn.fetchrow(
+            f"""
+            WITH deleted AS (
+                DELETE FROM {table} WHERE thread_id = ANY($1::text[])
+                RETURNING {size} AS size
+            )
+            SELECT count(*) AS rows, coalesce(sum(size), 0) AS bytes FROM deleted
+            """,
+            thread_ids
+        )
+        report["rows"][table] = row["rows"]
+        report["bytes"][table] = int(row["bytes"])
+    return report
+
+
+async def delete_threads(thread_ids: list[str]) -> dict:
+    """Deletes all state for many threads in one transaction."""
+    thread_ids = list(dict.fromkeys(thread_ids))
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            report = await _delete_thread_rows(conn, thread_ids)
+    return {"threads": len(thread_ids), **report}
+
+
+async def gc_idle_threads(retention_days: float = None, chunk_size: int = None) -> dict:
+    """
+    Deletes threads whose latest checkpoint is older than the retention window.
+
+    Idle threads are found with one pass over the checkpoints in thread_id
+    order, THREAD_GC_CHUNK at a time (a keyset cursor, so no page rescans
+    the threads before it). Each page is deleted in its own short
+    transaction, outside the scan; threads written to since the scan saw
+    them are skipped.
+    """
+    retention_days = Config.THREAD_RETENTION_DAYS if retention_days is None else retention_days
+    chunk_size = chunk_size or Config.THREAD_GC_CHUNK
+    start = time.perf_counter()
+    totals = {"threads": 0, "rows": 0, "bytes": 0}
+
+    async with db.acquire() as conn:
+        cutoff = await conn.fetchval("SELECT now() - make_interval(secs => $1)", retention_days * 86400)
+    after = ""
+    while True:
+        async with db.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT thread_id FROM checkpoints
+                WHERE thread_id > $1
+                GROUP BY thread_id
+                HAVING max((checkpoint->>'ts')::timestamptz) < $2
+                ORDER BY thread_id
+                LIMIT $3
+                """,
+                after, cutoff, chunk_size
+            )
+        if not rows:
+            break
+        after = rows[-1]["thread_id"]
+
+        async with db.acquire() as conn:
+            async with conn.transaction():
+                active = await conn.fetch(
+                    """
+                    SELECT thread_id FROM checkpoints
+                    WHERE thread_id = ANY($1::text[])
+                    GROUP BY thread_id
+                    HAVING max((checkpoint->>'ts')::timestamptz) >= $2
+                    """,
+                    [row["thread_id"] for row in rows], cutoff
+                )
+                active_ids = {row["thread_id"] for row in active}
+                idle_ids = [row["thread_id"] for row in rows if row["thread_id"] not in active_ids]
+                report = await _delete_thread_rows(conn, idle_ids)
+
+        totals["threads"] += len(idle_ids)
+        totals["rows"] += sum(report["rows"].values())
+        totals["bytes"] += sum(report["bytes"].values())
+        if len(rows) < chunk_size:
+            break
+        await asyncio.sleep(0)  # Let request traffic in between chunks
+
+    _stats["gc_threads_deleted"] += totals["threads"]
+    _stats["gc_rows_deleted"] += totals["rows"]
+    _stats["gc_bytes_reclaimed"] += totals["bytes"]
+    totals["duration_seconds"] = round(time.perf_counter() - start, 3)
+    return totals
+
+
+### Background vacuum
+
+async def vacuum_once() -> dict:
+    """
+    Runs one maintenance pass: deletes idle threads (when THREAD_RETENTION_DAYS
+    is set), prunes every thread with more than CHECKPOINT_KEEP_LAST
+    checkpoints, then VACUUMs the checkpoint tables so the freed space can be reused.
+
+    The pass holds an advisory lock, so only one worker or app instance runs it
+    at a time; the others skip it and get None.
+    """
+    # VACUUM cannot run inside a transaction block and can take a while, so use a dedicated connection
+    conn = await db.connect()
+    try:
+        if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext('checkpoint_maintenance'))"):
+            return None
+        try:
+            start = time.perf_counter()
+            if Config.THREAD_RETENTION_DAYS > 0:
+                gc = await gc_idle_threads()
+                logger.info(f"[THREAD_GC] Deleted {gc['threads']} idle threads, {gc['rows']} rows, {gc['bytes']} bytes in {gc['duration_seconds']}s")
+
+            threads = 0
+            async with db.acquire() as pooled:
+                thread_ids = await pooled.fetch(
+                    """
+                    SELECT thread_id FROM checkpoints
+                    GROUP BY thread_id
+                    HAVING count(*) > $1
+                    LIMIT $2
+                    """,
+                    max(Config.CHECKPOINT_KEEP_LAST, 1), Config.CHECKPOINT_VACUUM_BATCH
+                )
+            for row in thread_ids:
+                await prune_thread(row["thread_id"])
+                threads += 1
+
+            await conn.execute("VACUUM (ANALYZE) checkpoints, checkpoint_writes, checkpoint_blobs")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext('checkpoint_maintenance'))")
+    finally:
+        await conn.close()
+
+    _stats["vacuum_runs"] += 1
+    _stats["last_vacuum_seconds"] = round(time.perf_counter() - start, 3)
+    return {"threads_pruned": threads, "duration_seconds": _stats["last_vacuum_seconds"]}
+
+
+def start_vacuum_task():
+    """Starts the periodic idle-thread GC + prune + vacuum loop (no-op if CHECKPOINT_VACUUM_INTERVAL_SECONDS is 0)."""
+    global _vacuum_task
+    if _vacuum_task is not None or Config.CHECKPOINT_VACUUM_INTERVAL_SECONDS <= 0:
+        return
+
+    async def loop():
+        while True:
+            await asyncio.sleep(Config.CHECKPOINT_VACUUM_INTERVAL_SECONDS)
+            try:
+                result = await vacuum_once()
+                if result is None:
+                    logger.debug("[CHECKPOINT_VACUUM] Skipped, another process is running maintenance")
+                    continue
+                logger.info(f"[CHECKPOINT_VACUUM] {result}, totals: {get_stats()}")
+            except Exception as e:
+                logger.error(f"[CHECKPOINT_VACUUM] Vacuum run failed: {str(e)}")
+
+    _vacuum_task = asyncio.create_task(loop())
+
+
+async def stop_vacuum_task():
+    global _vacuum_task
+    if _vacuum_task is not None:
+        _vacuum_task.cancel()
+        await asyncio.gather(_vacuum_task, return_exceptions=True)
+        _vacuum_task = None
+
+
+async def get_table_sizes() -> dict:
+    """Total on-disk size of each checkpoint table, in bytes."""
+    async with db.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT relname, pg_total_relation_size(oid) AS size
+            FROM pg_class
+            WHERE relname IN ('checkpoints', 'checkpoint_writes', 'checkpoint_blobs') AND relkind = 'r'
+            """
+        )
+        return {row["relname"]: row["size"] for row in rows}
+
+
+def get_stats() -> dict:
+    return dict(_stats)
@@ -0,0 +1,131 @@
+import re
+import numpy as np
+import tiktoken
+from app.config import Config
+
+# Same encoding RecursiveCharacterTextSplitter.from_tiktoken_encoder uses by default,
+# so CHUNK_SIZE and CHUNK_OVERLAP keep their meaning
+ENCODING_NAME = "gpt2"
+
+# Split points in order of preference, matched on the UTF-8 bytes of the text.
+# Each pattern matches the whitespace a chunk may end before.
+_BOUNDARIES = (
+    re.compile(rb"\n[ \t]*\n\s*"),  # Paragraph
+    re.compile(rb"(?<=[.!?])[\"')\]]*\s+"),  # Sentence
+    re.compile(rb"\n\s*"),  # Line
+    re.compile(rb"\s+"),  # Word
+)
+_WHITESPACE = re.compile(rb"\s+")
+
+_encoding = None
+_token_lengths = {}
+
+
+def get_encoding():
+    """Returns the process-wide tokenizer, loaded on first use."""
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding(ENCODING_NAME)
+    return _encoding
+
+
+def _get_token_lengths(encoding) -> np.ndarray:
+    """Byte length of every token id, built once per encoding so offsets never need a decode."""
+    lengths = _token_lengths.get(encoding.name)
+    if lengths is None:
+        lengths = np.zeros(encoding.n_vocab, dtype=np.int64)
+        for token in range(encoding.n_vocab):
+            try:
+                lengths[token] = len(encoding.decode_single_token_bytes(token))
+            except KeyError:
+                pass  # Gaps in the vocabulary
+        _token_lengths[encoding.name] = lengths
+    return lengths
+
+
+class TokenChunker:
+    """
+    Splits text into chunks of at most `chunk_size` tokens with `chunk_overlap` tokens of overlap.
+
+    The text is encoded once and token byte offsets come from a per-encoding
+    length table. Each chunk ends at the last paragraph break in its window,
+    or else the last sentence end, line break or space, as long as the chunk
+    stays at least `min_fill` full. Chunks are decoded from byte slices of the
+    text at those offsets.
+    """
+
+    def __init__(self, chunk_size: int = None, chunk_overlap: int = None, min_fill: float = 0.5, encoding=None):
+        self.chunk_size = max(1, Config.CHUNK_SIZE if chunk_size is None else chunk_size)
+        self.chunk_overlap = max(0, min(Config.CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap, self.chunk_size - 1))
+        self.min_tokens = max(1, int(self.chunk_size * min_fill))
+        self.encoding = encoding
+
+    @staticmethod
+    def _char_start(data: bytes, offsets: np.ndarray, index: int, floor: int) -> int:
+        # Byte-level tokens can split a multi-byte character; back up to the token that starts it
+        while index > floor and index < len(offsets) - 1 and 0x80 <= data[offsets[index]] < 0xC0:
+            index -= 1
+        return index
+
+    def _choose_end(self, data: bytes, offsets: np.ndarray, start: int, limit: int) -> int:
+        first = start + self.min_tokens
+        window_start, window_end = int(offsets[first]), int(offsets[limit])
+        for pattern in _BOUNDARIES:
+            last = None
+            for last in pattern.finditer(data, window_start, window_end):
+                pass
+            if last is None:
+                continue
+            # First token that starts inside the separator (BPE tokens usually carry the leading space)
+            index = int(np.searchsorted(offsets, last.start()))
+            if first <= index <= limit and offsets[index] <= last.end():
+                return index
+        return self._char_start(data, offsets, limit, first)
+
+    def _overlap_start(self, data: bytes, offsets: np.ndarray, start: int, end: int) -> int:
+        """Start of the next chunk: the first word boundary within chunk_overlap tokens before `end`."""
+        lowest = max(end - self.chunk_overlap, start + 1)
+        match = _WHITESPACE.search(data, int(offsets[lowest]), int(offsets[end]))
+        if match is not None:
+            index = int(np.searchsorted(offsets, match.start()))
+            if index < end and offsets[index] <= match.end():
+                return index
+        return end
+
+    def split_text(self, text: str) -> list[str]:
+        encoding = self.encoding or get_encoding()
+        tokens = encoding.encode_ordinary(text)
+        total = len(tokens)
+        if total <= self.chunk_size:
+            chunk = text.strip()
+            return [chunk] if chunk else []
+
+        data = text.encode("utf-8")
+        offsets = np.zeros(total + 1, dtype=np.int64)
+        np.cumsum(_get_token_lengths(encoding)[np.asarray(tokens)], out=offsets[1:])
+
+        chunks = []
+        start = 0
+        while start < total:
+            limit = start + self.chunk_size
+            end = total if limit >= total else self._choose_end(data, offsets, start, limit)
+            chunk = data[offsets[start]:offsets[end]].decode("utf-8", errors="replace").strip()
+            if chunk:
+                chunks.append(chunk)
+            if end >= total:
+                break
+            next_start = self._overlap_start(data, offsets, start, end) if self.chunk_overlap else end
+            start = max(next_start, start + 1)
+        return chunks
+
+
+_chunker = None
+
+
+def get_chunker() -> TokenChunker:
+    """Returns the process-wide chunker configured with CHUNK_SIZE and CHUNK_OVERLAP."""
+    global _chunker
+    if _chunker is None:
+        _get_token_lengths(get_encoding())
+        _chunker = TokenChunker()
+    return _chunker
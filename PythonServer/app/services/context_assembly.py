@@ -0,0 +1,160 @@
+import logging
+import re
+from langchain_core.documents import Document
+from app.config import Config
+from app.services.chunker import TokenChunker, get_encoding
+from app.services.metrics import CONTEXT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Words per shingle for near-duplicate detection
+_SHINGLE_WORDS = 3
+# Chunks without a chunk_index are treated as neighbours when one's tail starts the other with at least this many characters
+_MIN_OVERLAP_CHARS = 40
+# A passage cut to fit the budget must keep at least this many tokens
+_MIN_PASSAGE_TOKENS = 64
+_WORD = re.compile(r"\w+")
+
+
+class Passage:
+    """One or more neighbouring chunks of a source, merged into a single piece of context."""
+
+    __slots__ = ("source", "first", "last", "text", "score", "shingles")
+
+    def __init__(self, doc: Document, score: float, shingles: set):
+        self.source = doc.metadata.get("source")
+        self.first = self.last = doc.metadata.get("chunk_index")
+        self.text = doc.page_content.strip()
+        self.score = score
+        self.shingles = shingles
+
+
+def _shingles(text: str) -> set:
+    words = _WORD.findall(text.casefold())
+    if len(words) < _SHINGLE_WORDS:
+        return {tuple(words)}
+    return set(zip(*(words[i:] for i in range(_SHINGLE_WORDS))))
+
+
+def _overlap(head: str, tail: str) -> int:
+    """Length of the longest suffix of `head` that starts `tail`, searched within the chunk overlap."""
+    window = max(_MIN_OVERLAP_CHARS, Config.CHUNK_OVERLAP * 16)
+    seed = tail[:_MIN_OVERLAP_CHARS]
+    if len(seed) < _MIN_OVERLAP_CHARS:
+        return 0
+    position = head.find(seed, max(0, len(head) - window))
+    while position != -1:
+        if tail.startswith(head[position:]):
+            return len(head) - position
+        position = head.find(seed, position + 1)
+    return 0
+
+
+def _join(first: Passage, second: Passage, overlap: int):
+    """Appends `second` to `first`, dropping the text they share."""
+    separator = "" if overlap else "\n"
+    first.text = first.text + separator + second.text[overlap:]
+    first.last = second.last
+    first.score = max(first.score, second.score)
+    first.shingles |= second.shingles
+
+
+def _dedupe(results: list[tuple[Document, float]]) -> list[Passage]:
+    """Keeps chunks in score order, dropping any mostly contained in a chunk already kept."""
+    kept = []
+    for doc, score in sorted(results, key=lambda result: result[1], reverse=True):
+        shingles = _shingles(doc.page_content)
+        if any(len(shingles & passage.shingles) >= Config.CONTEXT_DEDUPE_THRESHOLD * len(shingles) for passage in kept):
+            continue
+        kept.append(Passage(doc, score, shingles))
+    return kept
+
+
+def _merge(passages: list[Passage]) -> list[Passage]:
+    """Merges chunks of the same source that were next to each other in the document."""
+    by_source = {}
+    for passage in passages:
+        by_source.setdefault(passage.source, []).append(passage)
+
+    merged = []
+    for group in by_source.values():
+        # Chunks stored with their position merge on consecutive indexes
+        indexed = sorted((p for p in group if p.first is not None), key=lambda p: p.first)
+        for passage in indexed:
+            previous = merged[-1] if merged else None
+            if previous is not None and previous.source == passage.source and previous.last is not None and passage.first == previous.last + 1:
+                _join(previous, passage, _overlap(previous.text, passage.text))
+            else:
+                merged.append(passage)
+
+        # Older chunks have no position; merge them where one's tail is the next one's overlap
+        unindexed = [p for p in group if p.first is None]
+        joined = True
+        while joined:
+            joined = False
+            for first in unindexed:
+                for second in unindexed:
+                    if first is not second:
+                        overlap = _overlap(first.text, second.text)
+                        if overlap:
+                            _join(first, second, overlap)
+                            unindexed.remove(second)
+                            joined = True
+                            break
+                if joined:
+                    break
+        merged.extend(unindexed)
+    return merged
+
+
+def _fit(passages: list[Passage], budget: int) -> list[str]:
+    """Takes passages in order until `budget` tokens are used; the first one that does not fit is cut at a sentence."""
+    encoding = get_encoding()
+    texts = []
+    remaining = budget
+    for passage in passages:
+        tokens = len(encoding.encode_ordinary(passage.text))
+        if tokens <= remaining:
+            texts.append(passage.text)
+            remaining -= tokens
+            continue
+        if remaining >= _MIN_PASSAGE_TOKENS or not texts:
+            head = TokenChunker(chunk_size=max(1, remaining), chunk_overlap=0, encoding=encoding).split_text(passage.text)
+            if head:
+                texts.append(head[0])
+        break
+    return texts
+
+
+def assemble_context(results: list[tuple[Document, float]]) -> tuple[str, dict]:
+    """
+    Builds the context for the grader and generator from (Document, similarity) pairs.
+
+    Near-duplicate chunks are dropped, neighbouring chunks of a source are
+    merged into one passage, passages are ordered by their best similarity,
+    and the list is cut to CONTEXT_TOKEN_BUDGET tokens. Returns the context
+    and token counts before and after.
+    """
+    encoding = get_encoding()
+    original = "\n\n".join(doc.page_content for doc, _ in results)
+    stats = {"chunks": len(results), "tokens_in": len(encoding.encode_ordinary(original))}
+    if not Config.CONTEXT_ASSEMBLY_ENABLED or not results:
+        stats.update(passages=len(results), tokens_out=stats["tokens_in"])
+        return original, stats
+
+    passages = _merge(_dedupe(results))
+    passages.sort(key=lambda passage: passage.score, reverse=True)
+    if Config.CONTEXT_TOKEN_BUDGET > 0:
+        texts = _fit(passages, Config.CONTEXT_TOKEN_BUDGET)
+    else:
+        texts = [passage.text for passage in passages]
+
+    context = "\n\n".join(texts)
+    stats.update(passages=len(texts), tokens_out=len(encoding.encode_ordinary(context)))
+    CONTEXT_TOKENS.inc(stats["tokens_in"], stage="retrieved")
+    CONTEXT_TOKENS.inc(stats["tokens_out"], stage="assembled")
+    logger.info(
+        f"[CONTEXT] chunks={stats['chunks']} passages={stats['passages']} "
+        f"tokens={stats['tokens_in']}->{stats['tokens_out']} saved={stats['tokens_in'] - stats['tokens_out']}"
+    )
+    return context, stats
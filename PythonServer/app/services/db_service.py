@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import quote_plus
+import asyncpg
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# One set of pools per process, opened in the app lifespan (or lazily on first use):
+#   asyncpg pool      -> admin endpoints, registry, caches, maintenance SQL
+#   psycopg pool      -> AsyncPostgresSaver checkpointer
+#   SQLAlchemy engine -> PGVector
+_asyncpg_pool = None
+_checkpoint_pool = None
+_engine = None
+_lock = asyncio.Lock()
+# Postgres connections for all workers together, resolved when the pools open (0 = no cap)
+_connection_budget = None
+
+_wait_stats = {
+    "acquisitions": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+    "timeouts": 0,
+}
+
+
+def get_conninfo(driver: str = "postgresql") -> str:
+    """Build a PostgreSQL URL with a URL-encoded password."""
+    encoded_password = quote_plus(Config.RDS_PASSWORD) if Config.RDS_PASSWORD else ""
+    return f"{driver}://{Config.RDS_USER}:{encoded_password}@{Config.RDS_HOST}:{Config.RDS_PORT}/{Config.RDS_DB}"
+
+
+async def connect():
+    """Open a new, unpooled asyncpg connection (for long-running maintenance work)."""
+    return await asyncpg.connect(
+        database=Config.RDS_DB,
+        user=Config.RDS_USER,
+        password=Config.RDS_PASSWORD,
+        host=Config.RDS_HOST,
+        port=int(Config.RDS_PORT)
+    )
+
+
+async def _resolve_connection_budget() -> int:
+    """DB_MAX_CONNECTIONS, or when it is not set the server's max_connections less the reserved connections."""
+    if Config.DB_MAX_CONNECTIONS is not None:
+        return Config.DB_MAX_CONNECTIONS
+    conn = await connect()
+    try:
+        max_connections = int(await conn.fetchval("SHOW max_connections"))
+        superuser_reserved = int(await conn.fetchval("SHOW superuser_reserved_connections"))
+    finally:
+        await conn.close()
+    budget = max(1, max_connections - superuser_reserved - Config.DB_RESERVED_CONNECTIONS)
+    logger.info(f"[DB_POOL] Server allows {max_connections} connections; budget for {Config.WEB_WORKERS} workers is {budget}")
+    return budget
+
+
+def connection_budget() -> int:
+    """Postgres connections for all workers together (0 = no cap, also before the server's limit is known)."""
+    if _connection_budget is not None:
+        return _connection_budget
+    return Config.DB_MAX_CONNECTIONS or 0
+
+
+def pool_sizes() -> dict:
+    """
+    Maximum connections for each pool in this process.
+
+    The connection budget (DB_MAX_CONNECTIONS, or derived from the server's
+    max_connections) is split evenly across WEB_WORKERS processes. Each process
+    keeps one connection for listening to document changes and two for
+    unpooled maintenance work (checkpoint maintenance and job recovery), and
+    shares the rest between its pools in proportion to their configured
+    maxima, so all workers together never exceed the budget.
+    """
+    sizes = {
+        "asyncpg": Config.DB_POOL_MAX_SIZE,
+        "checkpoints": Config.CHECKPOINT_POOL_MAX_SIZE,
+        "vector_store": Config.VECTOR_POOL_SIZE + Config.VECTOR_POOL_MAX_OVERFLOW,
+    }
+    total_budget = connection_budget()
+    if total_budget <= 0:
+        return sizes
+
+    budget = total_budget // Config.WEB_WORKERS - 3
+    if budget < len(sizes):
+        logger.warning(f"[DB_POOL] A budget of {total_budget} connections is too low for {Config.WEB_WORKERS} workers; using one connection per pool")
+        return {name: 1 for name in sizes}
+    total = sum(sizes.values())
+    if total <= budget:
+        return sizes
+    return {name: max(1, size * budget // total) for name, size in sizes.items()}
+
+
+async def open_pools():
+    """Creates the shared pools. Safe to call more than once."""
+    global _asyncpg_pool, _checkpoint_pool, _engine, _connection_budget
+
+    async with _lock:
+        if _connection_budget is None:
+            _connection_budget = await _resolve_connection_budget()
+        sizes = pool_sizes()
+        if _asyncpg_pool is None:
+            _asyncpg_pool = await asyncpg.create_pool(
+                database=Config.RDS_DB,
+                user=Config.RDS_USER,
+                password=Config.RDS_PASSWORD,
+                host=Config.RDS_HOST,
+                port=int(Config.RDS_PORT),
+                min_size=min(Config.DB_POOL_MIN_SIZE, sizes["asyncpg"]),
+                max_size=sizes["asyncpg"],
+                max_inactive_connection_lifetime=Config.DB_POOL_MAX_IDLE,
+            )
+
+        if _checkpoint_pool is None:
+            pool = AsyncConnectionPool(
+                get_conninfo(),
+                min_size=min(Config.CHECKPOINT_POOL_MIN_SIZE, sizes["checkpoints"]),
+                max_size=sizes["checkpoints"],
+                kwargs={**Config.connection_kwargs, "row_factory": dict_row},
+                check=AsyncConnectionPool.check_connection,  # Health check on checkout
+                timeout=Config.DB_POOL_TIMEOUT,
+                max_idle=Config.DB_POOL_MAX_IDLE,
+                name="checkpoints",
+                open=False,
+            )
+            await pool.open(wait=True)
+            _checkpoint_pool = pool
+
+        if _engine is None:
+            from sqlalchemy.ext.asyncio import create_async_engine  # Deferred: heavy import
+
+            _engine = create_async_engine(
+                get_conninfo("postgresql+psycopg"),
+                pool_size=min(Config.VECTOR_POOL_SIZE, sizes["vector_store"]),
+                max_overflow=sizes["vector_store"] - min(Config.VECTOR_POOL_SIZE, sizes["vector_store"]),
+                pool_timeout=Config.DB_POOL_TIMEOUT,
+                pool_recycle=Config.DB_POOL_MAX_IDLE,
+                pool_pre_ping=True,  # Health check on checkout
+            )
+
+        logger.info(f"[DB_POOL] Pools ready: {pool_stats()}")
+
+
+async def close_pools():
+    global _asyncpg_pool, _checkpoint_pool, _engine
+
+    async with _lock:
+        if _asyncpg_pool is not None:
+            await _asyncpg_pool.close()
+            _asyncpg_pool = None
+        if _checkpoint_pool is not None:
+            await _checkpoint_pool.close()
+            _checkpoint_pool = None
+        if _engine is not None:
+            await _engine.dispose()
+            _engine = None
+
+
+async def get_checkpoint_pool() -> AsyncConnectionPool:
+    if _checkpoint_pool is None:
+        await open_pools()
+    return _checkpoint_pool
+
+
+async def get_engine():
+    if _engine is None:
+        await open_pools()
+    return _engine
+
+
+@asynccontextmanager
+async def acquire():
+    """Borrows a connection from the shared asyncpg pool, recording how long the wait was."""
+    if _asyncpg_pool is None:
+        await open_pools()
+
+    start = time.perf_counter()
+    try:
+        conn = await _asyncpg_pool.acquire(timeout=Config.DB_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        _wait_stats["timeouts"] += 1
+        raise
+    waited = time.perf_counter() - start
+    _wait_stats["acquisitions"] += 1
+    _wait_stats["wait_seconds_total"] += waited
+    _wait_stats["wait_seconds_max"] = max(_wait_stats["wait_seconds_max"], waited)
+
+    try:
+        yield conn
+    finally:
+        await _asyncpg_pool.release(conn)
+
+
+def pool_stats() -> dict:
+    """Returns size and wait metrics for each pool, and this worker's connection limits."""
+    stats = {}
+    sizes = pool_sizes()
+    if _asyncpg_pool is not None:
+        stats["asyncpg"] = {
+            "size": _asyncpg_pool.get_size(),
+            "idle": _asyncpg_pool.get_idle_size(),
+            "min_size": _asyncpg_pool.get_min_size(),
+            "max_size": _asyncpg_pool.get_max_size(),
+            **_wait_stats,
+        }
+    if connection_budget() > 0:
+        stats["budget"] = {
+            "max_connections": connection_budget(),
+            "web_workers": Config.WEB_WORKERS,
+            "per_worker": sum(sizes.values()),
+        }
+    if _checkpoint_pool is not None:
+        stats["checkpoints"] = _checkpoint_pool.get_stats()
+    if _engine is not None:
+        pool = _engine.pool
+        stats["vector_store"] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_size": sizes["vector_store"],
+        }
+    return stats
+
+
+async def check_health() -> dict:
+    """Runs a trivial query through every pool."""
+    results = {}
+
+    async def check(name, probe):
+        try:
+            start = time.perf_counter()
+            await probe()
+            results[name] = {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+        except Exception as e:
+            results[name] = {"ok": False, "error": str(e)}
+
+    async def probe_asyncpg():
+        async with acquire() as conn:
+            await conn.fetchval("SELECT 1")
+
+    async def probe_checkpoints():
+        pool = await get_checkpoint_pool()
+        async with pool.connection() as conn:
+            await conn.execute("SELECT 1")
+
+    async def probe_vector_store():
+        from sqlalchemy import text
+        engine = await get_engine()
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await check("asyncpg", probe_asyncpg)
+    await check("checkpoints", probe_checkpoints)
+    await check("vector_store", probe_vector_store)
+    return results
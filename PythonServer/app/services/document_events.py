@@ -0,0 +1,127 @@
+import asyncio
+import inspect
+import json
+import logging
+import uuid
+import app.services.db_service as db
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel that carries document changes between workers and app instances
+_CHANNEL = "document_changed"
+# Tags this process's notifications so it does not handle its own events twice
+_ORIGIN = uuid.uuid4().hex
+_HEALTH_CHECK_SECONDS = 10
+_RECONNECT_SECONDS = 5
+
+# Callbacks run after a document is uploaded or deleted: fn(user_id, source)
+_listeners = []
+# Callbacks run when events from other processes may have been missed: fn()
+_reset_listeners = []
+_listen_task = None
+_listening = False
+
+
+def register_document_listener(listener):
+    """Registers a (sync or async) callback that is told when a user's document changes."""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def register_reset_listener(listener):
+    """Registers a callback that drops everything it caches, run whenever document events may have been missed."""
+    if listener not in _reset_listeners:
+        _reset_listeners.append(listener)
+
+
+async def _dispatch(user_id: str, source: str):
+    for listener in list(_listeners):
+        try:
+            result = listener(user_id, source)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"[DOC_EVENTS] Listener {getattr(listener, '__name__', listener)} failed: {str(e)}")
+
+
+async def notify_document_changed(user_id: str, source: str):
+    """
+    Tells every listener in every process that (user_id, source) was uploaded or deleted.
+
+    Listeners in this process run directly; other workers and app instances
+    are told through Postgres NOTIFY. Errors are logged and swallowed so a
+    broken cache cannot fail an upload or delete that has already been committed.
+    """
+    await _dispatch(user_id, source)
+    try:
+        async with db.acquire() as conn:
+            await conn.execute(
+                "SELECT pg_notify($1, $2)",
+                _CHANNEL, json.dumps({"origin": _ORIGIN, "user_id": user_id, "source": source})
+            )
+    except Exception as e:
+        logger.error(f"[DOC_EVENTS] Failed to notify other processes about source '{source}': {str(e)}")
+
+
+def _on_notification(conn, pid, channel, payload):
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        logger.warning(f"[DOC_EVENTS] Ignoring malformed notification: {payload[:200]}")
+        return
+    if event.get("origin") != _ORIGIN:
+        asyncio.ensure_future(_dispatch(event["user_id"], event["source"]))
+
+
+def _reset():
+    for listener in list(_reset_listeners):
+        try:
+            listener()
+        except Exception as e:
+            logger.error(f"[DOC_EVENTS] Reset listener {getattr(listener, '__name__', listener)} failed: {str(e)}")
+
+
+async def _listen():
+    global _listening
+    while True:
+        conn = None
+        try:
+            conn = await db.connect()
+            await conn.add_listener(_CHANNEL, _on_notification)
+            # Anything cached before now may have changed without us hearing about it
+            _reset()
+            _listening = True
+            logger.info("[DOC_EVENTS] Listening for document changes from other processes")
+            # A dropped connection is only noticed on use, so check it periodically
+            while True:
+                await asyncio.sleep(_HEALTH_CHECK_SECONDS)
+                await conn.fetchval("SELECT 1")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[DOC_EVENTS] Document change listener disconnected: {str(e)}")
+        finally:
+            _listening = False
+            if conn is not None:
+                conn.terminate()
+        await asyncio.sleep(_RECONNECT_SECONDS)
+
+
+def is_listening() -> bool:
+    """True while changes made by other workers and app instances are being received."""
+    return _listening
+
+
+def start_listening():
+    """Starts listening for document changes from other processes (reconnects until stopped)."""
+    global _listen_task
+    if _listen_task is None:
+        _listen_task = asyncio.create_task(_listen())
+
+
+async def stop_listening():
+    global _listen_task
+    if _listen_task is not None:
+        _listen_task.cancel()
+        await asyncio.gather(_listen_task, return_exceptions=True)
+        _listen_task = None
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import app.services.db_service as db
+
+logger = logging.getLogger(__name__)
+
+_table_ready = False
+_lock = asyncio.Lock()
+
+STATUS_PROCESSING = "processing"
+STATUS_READY = "ready"
+
+
+
+class DocumentProcessingError(Exception):
+    """Raised when a document cannot be deleted because it is still being processed."""
+
+
+_COLUMNS = "user_id, source, status, chunk_count, byte_size, content_hash, created_at, updated_at"
+
+
+async def ensure_registry_table():
+    """
+    Creates the document_registry table if it does not exist.
+
+    The first time the table is created it is backfilled from the chunks that
+    are already stored in langchain_pg_embedding.
+    """
+    global _table_ready
+
+    async with _lock:
+        if _table_ready:
+            return
+
+        async with db.acquire() as conn:
+            async with conn.transaction():
+                exists = await conn.fetchval("SELECT to_regclass('document_registry') IS NOT NULL")
+                await conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS document_registry (
+                        user_id TEXT NOT NULL,
+                        source TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        chunk_count INTEGER NOT NULL DEFAULT 0,
+                        byte_size BIGINT,
+                        content_hash TEXT,
+                        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                        PRIMARY KEY (user_id, source)
+                    )
+                    """
+                )
+                has_embeddings = await conn.fetchval("SELECT to_regclass('langchain_pg_embedding') IS NOT NULL")
+                if not exists and has_embeddings:
+                    result = await conn.execute(
+                        """
+                        INSERT INTO document_registry (user_id, source, status, chunk_count)
+                        SELECT cmetadata->>'user_id', cmetadata->>'source', $1, count(*)
+                        FROM langchain_pg_embedding
+                        WHERE cmetadata->>'user_id' IS NOT NULL AND cmetadata->>'source' IS NOT NULL
+                        GROUP BY 1, 2
+                        ON CONFLICT (user_id, source) DO NOTHING
+                        """,
+                        STATUS_READY
+                    )
+                    logger.info(f"[DOC_REGISTRY] Backfilled registry from existing embeddings: {result}")
+        _table_ready = True
+
+
+async def claim_document(user_id: str, source: str) -> bool:
+    """
+    Registers a document as processing.
+
+    Returns False if a document with this (user_id, source) is already
+    registered, so concurrent uploads of the same document cannot both run.
+    """
+    await ensure_registry_table()
+    async with db.acquire() as conn:
+        row = await conn.fetchrow(
+            """
+            INSERT INTO document_registry (user_id, source, status)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (user_id, source) DO NOTHING
+            RETURNING user_id
+            """,
+            user_id, source, STATUS_PROCESSING
+        )
+        return row is not None
+
+
+async def mark_ready(user_id: str, source: str, chunk_count: int, byte_size: int = None, content_hash: str = None):
+    await ensure_registry_table()
+    async with db.acquire() as conn:
+        await conn.execute(
+            """
+            UPDATE document_registry
+            SET status = $3, chunk_count = $4, byte_size = $5, content_hash = $6, updated_at = now()
+            WHERE user_id = $1 AND source = $2
+            """,
+            user_id, source, STATUS_READY, chunk_count, byte_size, content_hash
+        )
+
+
+async def get_document(user_id: str, source: str):
+    """Returns the registry entry for a document, or None if it is not registered."""
+    await ensure_registry_table()
+    async with db.acquire() as conn:
+        row = await conn.fetchrow(
+            f"SELECT {_COLUMNS} FROM document_registry WHERE user_id = $1 AND source = $2",
+            user_id, source
+        )
+        return dict(row) if row else None
+
+
+async def list_documents(user_id: str) -> list[dict]:
+    """Returns all registered documents for a user, oldest first."""
+    await ensure_registry_table()
+    async with db.acquire() as conn:
+        rows = await conn.fetch(
+            f"SELECT {_COLUMNS} FROM document_registry WHERE user_id = $1 ORDER BY created_at, source",
+            user_id
+        )
+        return [dict(row) for row in rows]
+
+
+async def get_document_versions(user_id: str, sources: list[str]) -> dict:
+    """
+    Returns {source: updated_at} for the given documents that are ready.
+
+    Documents that are missing or still processing are left out.
+    """
+    await ensure_registry_table()
+    async with db.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT source, updated_at FROM document_registry
+            WHERE user_id = $1 AND source = ANY($2::text[]) AND status = $3
+            """,
+            user_id, list(sources), STATUS_READY
+        )
+        return {row["source"]: row["updated_at"] for row in rows}
+
+
+async def count_chunks(user_id: str, sources: list[str] = None) -> int:
+    """Total chunks of a user's registered documents, or of just `sources`."""
+    await ensure_registry_table()
+    async with db.acquire() as conn:
+        if sources is None:
+            return await conn.fetchval(
+                "SELECT COALESCE(sum(chunk_count), 0) FROM document_registry WHERE user_id = $1",
+                user_id
+            )
+        return await conn.fetchval(
+            "SELECT COALESCE(sum(chunk_count), 0) FROM document_registry WHERE user_id = $1 AND source = ANY($2::text[])",
+            user_id, list(sources)
+        )
+
+
+async def delete_document(user_id: str, source: str, processing_ok: bool = True) -> bool:
+    """
+    Removes a document's registry entry and its chunks in one transaction.
+
+    Returns False if the document was not registered. With `processing_ok`
+    off, a document that is still processing is left alone and
+    DocumentProcessingError is raised, since its ingestion would keep
+    storing chunks after the delete.
+    """
+    await ensure_registry_table()
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            status = await conn.fetchval(
+                "SELECT status FROM document_registry WHERE user_id = $1 AND source = $2 FOR UPDATE",
+                user_id, source
+            )
+            if status is None:
+                return False
+            if status == STATUS_PROCESSING and not processing_ok:
+                raise DocumentProcessingError()
+
+            await conn.execute(
+                "DELETE FROM document_registry WHERE user_id = $1 AND source = $2",
+                user_id, source
+            )
+
+            # Delete from langchain's embedding table where metadata matches
+            await conn.execute(
+                """
+                DELETE FROM langchain_pg_embedding
+                WHERE cmetadata->>'user_id' = $1 AND cmetadata->>'source' = $2
+                """,
+                user_id, source
+            )
+        return True
@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import logging
+from langchain_core.embeddings import Embeddings
+from app.config import Config
+from app.services.cache_utils import LRUCache
+import app.services.db_service as db
+from app.services.metrics import register_gauge
+
+logger = logging.getLogger(__name__)
+
+# Process-wide memory tier, shared by every CachedEmbeddings instance
+_memory_cache = LRUCache(Config.EMBEDDING_CACHE_LRU_SIZE)
+_stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0}
+_table_ready = False
+_lock = asyncio.Lock()
+
+
+def content_hash(text: str) -> str:
+    """Hash of the chunk text used as the cache key."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_cache_stats() -> dict:
+    """Returns hit/miss counters for the embedding cache."""
+    lookups = sum(_stats.values())
+    hits = _stats["memory_hits"] + _stats["persistent_hits"]
+    return {
+        **_stats,
+        "hit_rate": (hits / lookups) if lookups else 0.0,
+        "memory_size": len(_memory_cache),
+    }
+
+
+register_gauge("embedding_cache_hit_ratio", "Hit ratio of the chunk embedding cache.", lambda: get_cache_stats()["hit_rate"])
+
+
+async def ensure_cache_table():
+    """Creates the embedding_cache table if it does not exist."""
+    global _table_ready
+
+    async with _lock:
+        if _table_ready:
+            return
+
+        async with db.acquire() as conn:
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    content_hash TEXT NOT NULL,
+                    model_id TEXT NOT NULL,
+                    embedding REAL[] NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    PRIMARY KEY (content_hash, model_id)
+                )
+                """
+            )
+        _table_ready = True
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed cache in front of an embeddings client.
+
+    Chunks are keyed by (sha256(text), model_id). Lookups go to the in-process
+    LRU first, then to the embedding_cache table, and only the remaining texts
+    are sent to the wrapped client. Failures in the persistent tier are logged
+    and treated as misses so ingestion never fails because of the cache.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_id: str, persistent: bool = True):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.persistent = persistent
+
+    def _memory_key(self, digest: str):
+        return (self.model_id, digest)
+
+    async def _load_persisted(self, digests: list) -> dict:
+        if not self.persistent or not digests:
+            return {}
+        try:
+            await ensure_cache_table()
+            async with db.acquire() as conn:
+                rows = await conn.fetch(
+                    """
+                    SELECT content_hash, embedding FROM embedding_cache
+                    WHERE model_id = $1 AND content_hash = ANY($2::text[])
+                    """,
+                    self.model_id, digests
+                )
+            return {row["content_hash"]: list(row["embedding"]) for row in rows}
+        except Exception as e:
+            logger.warning(f"[EMBED_CACHE] Persistent lookup failed, treating as miss: {e}")
+            return {}
+
+    async def _store_persisted(self, entries: dict):
+        if not self.persistent or not entries:
+            return
+        try:
+            await ensure_cache_table()
+            async with db.acquire() as conn:
+                await conn.executemany(
+                    """
+                    INSERT INTO embedding_cache (content_hash, model_id, embedding)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (content_hash, model_id) DO NOTHING
+                    """,
+                    [(digest, self.model_id, vector) for digest, vector in entries.items()]
+                )
+        except Exception as e:
+            logger.warning(f"[EMBED_CACHE] Persistent store failed: {e}")
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        digests = [content_hash(text) for text in texts]
+        results = {}
+
+        for digest in set(digests):
+            vector = _memory_cache.get(self._memory_key(digest))
+            if vector is not None:
+                results[digest] = vector
+
+        missing = [d for d in set(digests) if d not in results]
+        persisted = await self._load_persisted(missing)
+        for digest, vector in persisted.items():
+            _memory_cache.put(self._memory_key(digest), vector)
+            results[digest] = vector
+
+        # Embed each distinct uncached text once
+        to_embed = {}
+        for text, digest in zip(texts, digests):
+            if digest not in results and digest not in to_embed:
+                to_embed[digest] = text
+
+        if to_embed:
+            vectors = await self.embeddings.aembed_documents(list(to_embed.values()))
+            fresh = dict(zip(to_embed.keys(), vectors))
+            for digest, vector in fresh.items():
+                _memory_cache.put(self._memory_key(digest), vector)
+                results[digest] = vector
+            await self._store_persisted(fresh)
+
+        for digest in digests:
+            if digest in to_embed:
+                _stats["misses"] += 1
+            elif digest in persisted:
+                _stats["persistent_hits"] += 1
+            else:
+                _stats["memory_hits"] += 1
+
+        logger.debug(f"[EMBED_CACHE] Batch of {len(texts)}: {len(to_embed)} embedded remotely, stats={get_cache_stats()}")
+        return [results[digest] for digest in digests]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        # Sync path only uses the memory tier; ingestion runs through the async path
+        digests = [content_hash(text) for text in texts]
+        results = {}
+        for digest in digests:
+            vector = _memory_cache.get(self._memory_key(digest))
+            if vector is not None:
+                results[digest] = vector
+
+        to_embed = {}
+        for text, digest in zip(texts, digests):
+            if digest not in results and digest not in to_embed:
+                to_embed[digest] = text
+        if to_embed:
+            vectors = self.embeddings.embed_documents(list(to_embed.values()))
+            for digest, vector in zip(to_embed.keys(), vectors):
+                _memory_cache.put(self._memory_key(digest), vector)
+                results[digest] = vector
+
+        return [results[digest] for digest in digests]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await self.embeddings.aembed_query(text)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings.embed_query(text)
+
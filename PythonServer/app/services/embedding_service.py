@@ -1,4 +1,19 @@
-from langchain_aws import BedrockEmbeddings
+from app.config import Config
+from app.services.bedrock_client import get_bedrock_client
+from app.services.embedding_cache import CachedEmbeddings
+
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v1"
+
+_embeddings = None
 
 def get_embeddings():
-    return BedrockEmbeddings(model_id="amazon.titan-embed-text-v1")
\ No newline at end of file
+    """Returns the process-wide embeddings client."""
+    global _embeddings
+    if _embeddings is None:
+        from langchain_aws import BedrockEmbeddings  # Deferred to first use or startup warmup
+
+        embeddings = BedrockEmbeddings(client=get_bedrock_client(), model_id=EMBEDDING_MODEL_ID)
+        if Config.EMBEDDING_CACHE_ENABLED:
+            embeddings = CachedEmbeddings(embeddings, model_id=EMBEDDING_MODEL_ID)
+        _embeddings = embeddings
+    return _embeddings
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import random
+from contextlib import aclosing
+from langchain_core.documents import Document
+from app.config import Config
+from app.services.metrics import EMBEDDING_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_THROTTLING_ERRORS = (
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+    "Too many requests",
+)
+
+
+def is_throttling_error(exc: Exception) -> bool:
+    """True if the exception is a Bedrock throttling/overload error (raw boto or wrapped by langchain)."""
+    code = (getattr(exc, "response", None) or {}).get("Error", {}).get("Code", "")
+    if code in _THROTTLING_ERRORS:
+        return True
+    message = str(exc)
+    return any(name in message for name in _THROTTLING_ERRORS)
+
+
+def backoff_delay(attempt: int, backoff_seconds: float = None) -> float:
+    """Jittered exponential backoff before retry number `attempt + 1`."""
+    backoff_seconds = Config.EMBED_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+    return backoff_seconds * (2 ** attempt) * (0.5 + random.random())
+
+
+async def retry_throttled(call, max_retries: int = None, backoff_seconds: float = None):
+    """
+    Awaits `call()`, retrying Bedrock throttling errors with the same backoff EmbeddingWriter uses.
+
+    Other errors, and the throttling error after `max_retries` retries, are raised.
+    """
+    max_retries = Config.EMBED_MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            if not is_throttling_error(e) or attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt, backoff_seconds)
+            attempt += 1
+            logger.warning(f"[EMBED_RETRY] Throttled, retry {attempt}/{max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+class EmbeddingWriter:
+    """
+    Embeds and inserts document chunks in concurrent, adaptively sized batches.
+
+    Chunks are grouped into batches of `batch_size` and up to `max_concurrency`
+    batches are embedded at once. Each batch is inserted into the vector store
+    as soon as its embeddings arrive. On a throttling error the batch size and
+    the number of concurrent embedding calls are halved (down to
+    `min_batch_size` and 1) and the batch is retried with jittered exponential
+    backoff; after a run of successful calls both grow back towards their
+    configured maximums.
+    """
+
+    def __init__(
+        self,
+        vector_store,
+        embeddings=None,
+        batch_size: int = None,
+        max_concurrency: int = None,
+        min_batch_size: int = None,
+        max_retries: int = None,
+        backoff_seconds: float = None,
+        progress: dict = None,
+    ):
+        self.vector_store = vector_store
+        self.embeddings = embeddings or vector_store.embeddings
+        self.max_batch_size = batch_size or Config.EMBED_BATCH_SIZE
+        self.min_batch_size = min(min_batch_size or Config.EMBED_MIN_BATCH_SIZE, self.max_batch_size)
+        self.max_concurrency = max_concurrency or Config.EMBED_MAX_CONCURRENCY
+        self.max_retries = Config.EMBED_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_seconds = Config.EMBED_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+        self.progress = progress  # Optional dict kept up to date with chunks_embedded
+
+        self.batch_size = self.max_batch_size
+        self.concurrency = self.max_concurrency
+        self.written = 0
+        self.throttled = 0
+        self._successes = 0
+        self._active = 0
+        self._slot_changed = asyncio.Condition()
+
+    def _on_throttled(self):
+        self.throttled += 1
+        self._successes = 0
+        self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        self.concurrency = max(1, self.concurrency // 2)
+
+    def _on_success(self):
+        self._successes += 1
+        if self._successes >= self.concurrency:
+            self._successes = 0
+            self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+    async def _call_embeddings(self, texts: list[str]) -> list[list[float]]:
+        # Only `self.concurrency` embedding calls run at once; the limit adapts to throttling
+        async with self._slot_changed:
+            await self._slot_changed.wait_for(lambda: self._active < self.concurrency)
+            self._active += 1
+        try:
+            with EMBEDDING_SECONDS.time(kind="documents"):
+                return await self.embeddings.aembed_documents(texts)
+        finally:
+            async with self._slot_changed:
+                self._active -= 1
+                self._slot_changed.notify_all()
+
+    async def _embed(self, texts: list[str]) -> list[list[float]]:
+        attempt = 0
+        while True:
+            try:
+                vectors = await self._call_embeddings(texts)
+                self._on_success()
+                return vectors
+            except Exception as e:
+                if not is_throttling_error(e) or attempt >= self.max_retries:
+                    raise
+                self._on_throttled()
+                delay = backoff_delay(attempt, self.backoff_seconds)
+                attempt += 1
+                logger.warning(f"[EMBED_WRITER] Throttled, retry {attempt}/{self.max_retries} in {delay:.2f}s with batch size {self.batch_size}, concurrency {self.concurrency}")
+                await asyncio.sleep(delay)
+
+                # Re-split the batch if it is now larger than the allowed size
+                if len(texts) > self.batch_size:
+                    vectors = []
+                    for i in range(0, len(texts), self.batch_size):
+                        vectors.extend(await self._embed(texts[i:i + self.batch_size]))
+                    return vectors
+
+    async def _write_batch(self, batch: list[Document]):
+        texts = [doc.page_content for doc in batch]
+        vectors = await self._embed(texts)
+        await self.vector_store.aadd_embeddings(
+            texts=texts,
+            embeddings=vectors,
+            metadatas=[doc.metadata for doc in batch],
+        )
+        self.written += len(batch)
+        if self.progress is not None:
+            self.progress["chunks_embedded"] = self.written
+
+    async def write(self, documents) -> int:
+        """
+        Consumes an (async) iterable of Documents and writes them all.
+
+        Returns the number of chunks written. The first non-retryable error
+        cancels the batches still in flight and is re-raised.
+        """
+        slots = asyncio.Semaphore(self.max_concurrency)
+        tasks = set()
+        errors = []
+
+        async def run(batch):
+            try:
+                await self._write_batch(batch)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                slots.release()
+
+        async def submit(batch):
+            # Waiting for a free slot also pauses the upstream extraction
+            await slots.acquire()
+            if errors:
+                slots.release()
+                return
+            task = asyncio.ensure_future(run(batch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        try:
+            batch = []
+            async with aclosing(_aiter(documents)) as stream:
+                async for doc in stream:
+                    if errors:
+                        break
+                    batch.append(doc)
+                    if len(batch) >= self.batch_size:
+                        await submit(batch)
+                        batch = []
+            if batch and not errors:
+                await submit(batch)
+
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            pending = list(tasks)
+            for task in pending:
+                task.cancel()
+            # Wait until cancelled batches stop, so the caller's cleanup never races a batch still committing
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        if errors:
+            raise errors[0]
+
+        logger.debug(f"[EMBED_WRITER] Wrote {self.written} chunks, throttled {self.throttled} times, final batch size {self.batch_size}, concurrency {self.concurrency}")
+        return self.written
+
+
+async def _aiter(documents):
+    if hasattr(documents, "__aiter__"):
+        try:
+            async for doc in documents:
+                yield doc
+        finally:
+            if hasattr(documents, "aclose"):
+                await documents.aclose()
+    else:
+        for doc in documents:
+            yield doc
@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import time
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from app.config import Config
+from app.services.chunker import get_chunker
+from app.services.metrics import PDF_EXTRACTION_SECONDS_PER_PAGE, PDF_PAGES_EXTRACTED
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_queue_slots = None
+
+
+### Worker side (runs inside the pool processes)
+
+def _init_worker():
+    # Load the tokenizer and PyMuPDF once per worker instead of once per shard
+    import pymupdf  # noqa: F401
+    get_chunker()
+
+def _warm_worker() -> int:
+    return os.getpid()
+
+def iter_pdf_pages(doc, start: int = 0, end: int = None):
+    """Yields the text of each page in [start, end), one page in memory at a time."""
+    end = doc.page_count if end is None else min(end, doc.page_count)
+    for page_number in range(start, end):
+        yield doc.load_page(page_number).get_text()
+
+def iter_text_chunks(pages, splitter=None):
+    """
+    Splits a stream of page texts incrementally.
+
+    The last chunk of each split is carried into the next one, so chunks that
+    span a page boundary are produced whole and keep their overlap.
+    """
+    splitter = splitter or get_chunker()
+    buffer = ""
+    for page_text in pages:
+        buffer += page_text + "\n"
+        if len(buffer) < Config.PDF_SPLIT_BUFFER_CHARS:
+            continue
+        chunks = splitter.split_text(buffer)
+        for chunk in chunks[:-1]:
+            yield chunk
+        buffer = chunks[-1] if chunks else ""
+
+    if buffer.strip():
+        yield from splitter.split_text(buffer)
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> list[str]:
+    """Extracts and splits pages [start, end) of the PDF at pdf_path."""
+    import pymupdf
+    with pymupdf.open(pdf_path) as doc:
+        return list(iter_text_chunks(iter_pdf_pages(doc, start, end)))
+
+def count_pages(pdf_path: str) -> int:
+    import pymupdf  # Deferred: the API process only needs it once an upload arrives
+    with pymupdf.open(pdf_path) as doc:
+        return doc.page_count
+
+
+### Engine side (runs in the API process)
+
+def get_extraction_pool():
+    """Returns the process pool used for PDF extraction, or None when disabled."""
+    global _executor
+    if Config.EXTRACTION_WORKERS <= 0:
+        return None
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=Config.EXTRACTION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+    return _executor
+
+async def warm_extraction_pool() -> int:
+    """Starts every pool worker (running the initializer) ahead of the first upload. Returns the worker count."""
+    pool = get_extraction_pool()
+    if pool is None:
+        return 0
+    loop = asyncio.get_running_loop()
+    pids = await asyncio.gather(*(loop.run_in_executor(pool, _warm_worker) for _ in range(Config.EXTRACTION_WORKERS)))
+    return len(set(pids))
+
+def shutdown_extraction_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def _get_queue_slots():
+    global _queue_slots
+    if _queue_slots is None:
+        _queue_slots = asyncio.Semaphore(Config.EXTRACTION_QUEUE_DEPTH)
+    return _queue_slots
+
+def _spool_to_disk(pdf_input):
+    """
+    Copies the upload to a named temp file in fixed-size blocks so worker processes can open it.
+
+    Returns the path, the byte size and the sha256 of the file.
+    """
+    pdf_input.seek(0)
+    digest = hashlib.sha256()
+    byte_size = 0
+    with tempfile.NamedTemporaryFile(suffix=".pdf", dir=Config.EXTRACTION_TMP_DIR, delete=False) as tmp:
+        while block := pdf_input.read(1024 * 1024):
+            digest.update(block)
+            byte_size += len(block)
+            tmp.write(block)
+        return tmp.name, byte_size, digest.hexdigest()
+
+def _describe_file(pdf_path: str):
+    """Returns the byte size and sha256 of a PDF that is already on disk."""
+    digest = hashlib.sha256()
+    byte_size = 0
+    with open(pdf_path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+            byte_size += len(block)
+    return byte_size, digest.hexdigest()
+
+async def _run_shard(pdf_path: str, start: int, end: int) -> list[str]:
+    async with _get_queue_slots():
+        started = time.perf_counter()
+        pool = get_extraction_pool()
+        if pool is None:
+            chunks = await asyncio.to_thread(extract_page_range, pdf_path, start, end)
+        else:
+            loop = asyncio.get_running_loop()
+            chunks = await loop.run_in_executor(pool, extract_page_range, pdf_path, start, end)
+        if end > start:
+            PDF_EXTRACTION_SECONDS_PER_PAGE.observe((time.perf_counter() - started) / (end - start))
+            PDF_PAGES_EXTRACTED.inc(end - start)
+        return chunks
+
+async def iter_pdf_chunks(pdf_input, file_info: dict = None):
+    """
+    Asynchronously yields text chunks from a PDF, in document order.
+
+    The document is sharded into page ranges of EXTRACTION_SHARD_PAGES that are
+    extracted and split on the process pool. At most EXTRACTION_WORKERS shards
+    per document run ahead of the consumer, and EXTRACTION_QUEUE_DEPTH caps the
+    shards in flight across all uploads. As in iter_text_chunks, the last
+    chunk of each shard is held back and re-split with the first chunk of the
+    next shard, so chunks that span a shard boundary keep their overlap.
+
+    `pdf_input` is a file-like object, which is spooled to a temp file, or the
+    path of a PDF already on disk, which is read in place and left alone.
+
+    If `file_info` is given it is filled with byte_size, content_hash and
+    page_count as soon as they are known, and pages_processed as shards finish.
+    """
+    if isinstance(pdf_input, (str, os.PathLike)):
+        pdf_path, owns_file = os.fspath(pdf_input), False
+        byte_size, digest = await asyncio.to_thread(_describe_file, pdf_path)
+    else:
+        owns_file = True
+        pdf_path, byte_size, digest = await asyncio.to_thread(_spool_to_disk, pdf_input)
+    pending = deque()
+    try:
+        page_count = await asyncio.to_thread(count_pages, pdf_path)
+        if file_info is not None:
+            file_info.update(byte_size=byte_size, content_hash=digest, page_count=page_count)
+        shard_pages = max(1, Config.EXTRACTION_SHARD_PAGES)
+        shards = deque((start, min(start + shard_pages, page_count)) for start in range(0, page_count, shard_pages))
+        window = max(1, Config.EXTRACTION_WORKERS)
+        splitter = get_chunker()
+        carry = None
+        logger.debug(f"[EXTRACTION] {page_count} pages in {len(shards)} shards")
+
+        while shards or pending:
+            while shards and len(pending) < window:
+                start, end = shards.popleft()
+                pending.append((end, asyncio.ensure_future(_run_shard(pdf_path, start, end))))
+
+            end, task = pending.popleft()
+            chunks = await task
+            if file_info is not None:
+                file_info["pages_processed"] = end
+            if not chunks:
+                continue
+            if carry is not None:
+                chunks = splitter.split_text(carry + "\n" + chunks[0]) + chunks[1:]
+            for chunk in chunks[:-1]:
+                yield chunk
+            carry = chunks[-1]
+
+        if carry is not None:
+            yield carry
+    finally:
+        for _, task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*(task for _, task in pending), return_exceptions=True)
+        if owns_file:
+            os.unlink(pdf_path)
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+import numpy as np
+from langchain_core.documents import Document
+from app.config import Config
+import app.services.db_service as db
+from app.services.document_events import register_document_listener, register_reset_listener
+
+logger = logging.getLogger(__name__)
+
+# Per-process tier: (user_id, source) -> _Segment, least recently used first
+_segments = OrderedDict()
+_loading = {}
+_generations = {}
+_too_large = set()
+_size_bytes = 0
+_stats = {"hits": 0, "misses": 0, "loads": 0, "evictions": 0, "invalidations": 0}
+
+
+class _Segment:
+    """One document's chunks with their unit-normalized embeddings as a contiguous float32 matrix."""
+    __slots__ = ("ids", "texts", "metadatas", "matrix", "nbytes")
+
+    def __init__(self, ids: list, texts: list[str], metadatas: list[dict], matrix):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.matrix = matrix
+        self.nbytes = matrix.nbytes + sum(len(text) for text in texts)
+
+
+def _max_bytes() -> int:
+    return int(Config.HOT_INDEX_MAX_MB * 1024 * 1024)
+
+
+def _source_list(pgvector_filter: dict):
+    """Returns (user_id, sources) if the filter is one the hot tier can answer, else None."""
+    if set(pgvector_filter) != {"user_id", "source"}:
+        return None
+    user_id = pgvector_filter["user_id"]
+    source_filter = pgvector_filter["source"]
+    if isinstance(source_filter, dict):
+        if set(source_filter) != {"$in"}:
+            return None
+        sources = source_filter["$in"]
+    else:
+        sources = [source_filter]
+    if not isinstance(user_id, str) or not all(isinstance(source, str) for source in sources):
+        return None
+    return user_id, sorted(set(sources))
+
+
+async def _fetch_segment(user_id: str, source: str):
+    async with db.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT e.id, e.document, e.cmetadata::text AS cmetadata, e.embedding::real[] AS embedding
+            FROM langchain_pg_embedding e
+            JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+            WHERE c.name = $1
+              AND e.cmetadata->>'user_id' = $2
+              AND e.cmetadata->>'source' = $3
+            LIMIT $4
+            """,
+            Config.VECTOR_COLLECTION, user_id, source, Config.HOT_INDEX_MAX_CHUNKS + 1
+        )
+    if len(rows) > Config.HOT_INDEX_MAX_CHUNKS:
+        return None
+
+    matrix = np.array([row["embedding"] for row in rows], dtype=np.float32).reshape(len(rows), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1, norms)
+    return _Segment(
+        ids=[row["id"] for row in rows],
+        texts=[row["document"] for row in rows],
+        metadatas=[json.loads(row["cmetadata"]) for row in rows],
+        matrix=matrix,
+    )
+
+
+def _insert(key, segment: _Segment):
+    global _size_bytes
+    _segments[key] = segment
+    _size_bytes += segment.nbytes
+    while _size_bytes > _max_bytes() and len(_segments) > 1:
+        _, evicted = _segments.popitem(last=False)
+        _size_bytes -= evicted.nbytes
+        _stats["evictions"] += 1
+
+
+async def _load(key):
+    generation = _generations.get(key, 0)
+    try:
+        segment = await _fetch_segment(*key)
+        # Skip the result if the document changed while it was loading
+        if _generations.get(key, 0) != generation:
+            return
+        if segment is None or segment.nbytes > _max_bytes():
+            _too_large.add(key)
+            logger.info(f"[HOT_INDEX] Source '{key[1]}' is too large for the hot tier, using Postgres")
+            return
+        _insert(key, segment)
+        _stats["loads"] += 1
+        logger.debug(f"[HOT_INDEX] Loaded {len(segment.texts)} chunks for source '{key[1]}', {get_stats()}")
+    except Exception as e:
+        logger.warning(f"[HOT_INDEX] Failed to load source '{key[1]}': {str(e)}")
+    finally:
+        _loading.pop(key, None)
+
+
+def search(embedding, pgvector_filter: dict, k: int):
+    """
+    Answers a filtered top-k search from memory.
+
+    Returns (Document, cosine distance) pairs like PGVector, or None if any
+    selected document is not loaded yet. Missing documents are loaded in the
+    background, so the caller should fall back to Postgres this time.
+    """
+    selection = _source_list(pgvector_filter or {})
+    if selection is None:
+        return None
+    user_id, sources = selection
+    keys = [(user_id, source) for source in sources]
+
+    missing = [key for key in keys if key not in _segments]
+    if missing:
+        _stats["misses"] += 1
+        for key in missing:
+            if key not in _loading and key not in _too_large:
+                _loading[key] = asyncio.ensure_future(_load(key))
+        return None
+
+    query = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    if norm:
+        query = query / norm
+
+    candidates = []
+    for key in keys:
+        _segments.move_to_end(key)
+        segment = _segments[key]
+        if not segment.texts:
+            continue
+        similarities = segment.matrix @ query
+        top = min(k, len(similarities))
+        best = np.argpartition(-similarities, top - 1)[:top]
+        candidates.extend((float(similarities[i]), segment, int(i)) for i in best)
+
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    _stats["hits"] += 1
+    return [
+        (
+            Document(id=str(segment.ids[i]), page_content=segment.texts[i], metadata=segment.metadatas[i]),
+            1.0 - similarity,
+        )
+        for similarity, segment, i in candidates[:k]
+    ]
+
+
+def invalidate_document(user_id: str, source: str):
+    """Drops a document from the hot tier; it is reloaded on next use."""
+    global _size_bytes
+    key = (user_id, source)
+    _generations[key] = _generations.get(key, 0) + 1
+    _too_large.discard(key)
+    segment = _segments.pop(key, None)
+    if segment is not None:
+        _size_bytes -= segment.nbytes
+        _stats["invalidations"] += 1
+
+
+def clear():
+    """Drops every document from the hot tier, including loads still in flight."""
+    global _size_bytes
+    for key in list(_segments) + list(_loading):
+        _generations[key] = _generations.get(key, 0) + 1
+    _stats["invalidations"] += len(_segments)
+    _segments.clear()
+    _too_large.clear()
+    _size_bytes = 0
+
+
+register_document_listener(invalidate_document)
+register_reset_listener(clear)
+
+
+def get_stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_rate": (_stats["hits"] / lookups) if lookups else 0.0,
+        "documents": len(_segments),
+        "size_mb": round(_size_bytes / (1024 * 1024), 2),
+        "max_mb": Config.HOT_INDEX_MAX_MB,
+    }
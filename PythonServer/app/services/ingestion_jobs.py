@@ -0,0 +1,447 @@
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import uuid
+from collections import deque
+from app.config import Config
+import app.services.db_service as db
+import app.services.document_registry as registry
+from app.services.pdf_processing import upload_text
+from app.services.metrics import register_gauge
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+_COLUMNS = (
+    "job_id, user_id, source, filename, status, stage, file_path, pages_total, pages_processed, "
+    "chunks_embedded, error, created_at, updated_at"
+)
+
+# Jobs belong to the host whose spool dir holds their upload
+_OWNER = Config.INGESTION_OWNER or socket.gethostname()
+
+_table_ready = False
+_lock = asyncio.Lock()
+_queue = None
+_workers = []
+_recovery_task = None
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue is at INGESTION_QUEUE_MAX jobs."""
+
+
+class DuplicateDocumentError(Exception):
+    """Raised when the document is already registered or has a queued or running job."""
+
+
+class _FairQueue:
+    """
+    Job queue that serves users round-robin.
+
+    Each user has their own FIFO; workers take the next job from the next user
+    in turn, so one user uploading many PDFs cannot starve everyone else.
+    """
+
+    def __init__(self):
+        self._per_user = {}
+        self._users = deque()
+        self._size = 0
+        self._ready = asyncio.Condition()
+
+    def __len__(self):
+        return self._size
+
+    async def put(self, job_id: str, user_id: str):
+        async with self._ready:
+            if user_id not in self._per_user:
+                self._per_user[user_id] = deque()
+                self._users.append(user_id)
+            self._per_user[user_id].append(job_id)
+            self._size += 1
+            self._ready.notify()
+
+    async def get(self) -> str:
+        async with self._ready:
+            await self._ready.wait_for(lambda: self._size > 0)
+            user_id = self._users.popleft()
+            jobs = self._per_user[user_id]
+            job_id = jobs.popleft()
+            if jobs:
+                self._users.append(user_id)
+            else:
+                del self._per_user[user_id]
+            self._size -= 1
+            return job_id
+
+    def __contains__(self, job_id: str):
+        return any(job_id in jobs for jobs in self._per_user.values())
+
+
+def _get_queue() -> _FairQueue:
+    global _queue
+    if _queue is None:
+        _queue = _FairQueue()
+    return _queue
+
+
+async def ensure_jobs_table():
+    """Creates the ingestion_jobs table if it does not exist."""
+    global _table_ready
+
+    async with _lock:
+        if _table_ready:
+            return
+
+        async with db.acquire() as conn:
+            await conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    filename TEXT,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    file_path TEXT,
+                    pages_total INTEGER,
+                    pages_processed INTEGER NOT NULL DEFAULT 0,
+                    chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    owner TEXT
+                );
+                ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS owner TEXT;
+                CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_status ON ingestion_jobs (status, updated_at);
+                CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_source ON ingestion_jobs (user_id, source);
+                """
+            )
+        _table_ready = True
+
+
+def _spool_upload(file_obj, file_path: str):
+    file_obj.seek(0)
+    with open(file_path, "wb") as out:
+        shutil.copyfileobj(file_obj, out, 1024 * 1024)
+
+
+async def _is_duplicate(conn, user_id: str, source: str) -> bool:
+    return await conn.fetchval(
+        """
+        SELECT EXISTS (SELECT 1 FROM document_registry WHERE user_id = $1 AND source = $2)
+            OR EXISTS (SELECT 1 FROM ingestion_jobs WHERE user_id = $1 AND source = $2 AND status = ANY($3::text[]))
+        """,
+        user_id, source, [STATUS_QUEUED, STATUS_RUNNING]
+    )
+
+
+async def submit_job(file_obj, user_id: str, source: str, filename: str = None) -> dict:
+    """
+    Saves the upload to INGESTION_SPOOL_DIR, records a queued job and enqueues it.
+
+    Raises QueueFullError when INGESTION_QUEUE_MAX jobs are already waiting, and
+    DuplicateDocumentError when the document is already registered or queued.
+    """
+    queue = _get_queue()
+    if len(queue) >= Config.INGESTION_QUEUE_MAX:
+        raise QueueFullError()
+
+    await ensure_jobs_table()
+    await registry.ensure_registry_table()
+    async with db.acquire() as conn:
+        if await _is_duplicate(conn, user_id, source):
+            raise DuplicateDocumentError()
+
+    job_id = uuid.uuid4().hex
+    os.makedirs(Config.INGESTION_SPOOL_DIR, exist_ok=True)
+    file_path = os.path.join(Config.INGESTION_SPOOL_DIR, f"{job_id}.pdf")
+    await asyncio.to_thread(_spool_upload, file_obj, file_path)
+
+    try:
+        async with db.acquire() as conn:
+            async with conn.transaction():
+                # Serializes concurrent uploads of the same document across workers and instances
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1 || '/' || $2))", user_id, source)
+                if await _is_duplicate(conn, user_id, source):
+                    raise DuplicateDocumentError()
+                await conn.execute(
+                    """
+                    INSERT INTO ingestion_jobs (job_id, user_id, source, filename, status, stage, file_path, owner)
+                    VALUES ($1, $2, $3, $4, $5, $5, $6, $7)
+                    """,
+                    job_id, user_id, source, filename, STATUS_QUEUED, file_path, _OWNER
+                )
+    except Exception:
+        _remove_file(file_path)
+        raise
+
+    await queue.put(job_id, user_id)
+    logger.info(f"[INGESTION_JOBS] Queued job {job_id} for source '{source}', queue depth {len(queue)}")
+    return {"job_id": job_id, "status": STATUS_QUEUED, "queue_depth": len(queue)}
+
+
+async def has_active_job(user_id: str, source: str) -> bool:
+    """True while the document has a queued or running ingestion job."""
+    await ensure_jobs_table()
+    async with db.acquire() as conn:
+        return await conn.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM ingestion_jobs WHERE user_id = $1 AND source = $2 AND status = ANY($3::text[]))",
+            user_id, source, [STATUS_QUEUED, STATUS_RUNNING]
+        )
+
+
+async def get_job(job_id: str):
+    """Returns a job's persisted state, or None if there is no such job."""
+    await ensure_jobs_table()
+    async with db.acquire() as conn:
+        row = await conn.fetchrow(f"SELECT {_COLUMNS} FROM ingestion_jobs WHERE job_id = $1", job_id)
+        return dict(row) if row else None
+
+
+def _remove_file(file_path: str):
+    try:
+        os.unlink(file_path)
+    except FileNotFoundError:
+        pass
+
+
+async def _claim_job(job_id: str):
+    """Marks a queued job as running; returns None if another worker or process already took it."""
+    async with db.acquire() as conn:
+        row = await conn.fetchrow(
+            f"""
+            UPDATE ingestion_jobs SET status = $2, stage = 'starting', updated_at = now()
+            WHERE job_id = $1 AND status = $3
+            RETURNING {_COLUMNS}
+            """,
+            job_id, STATUS_RUNNING, STATUS_QUEUED
+        )
+        return dict(row) if row else None
+
+
+async def _save_progress(job_id: str, progress: dict):
+    async with db.acquire() as conn:
+        await conn.execute(
+            """
+            UPDATE ingestion_jobs
+            SET stage = $2, pages_total = $3, pages_processed = $4, chunks_embedded = $5, updated_at = now()
+            WHERE job_id = $1
+            """,
+            job_id,
+            progress.get("stage", "starting"),
+            progress.get("page_count"),
+            progress.get("pages_processed", 0),
+            progress.get("chunks_embedded", 0)
+        )
+
+
+async def _finish_job(job_id: str, status: str, progress: dict, error: str = None):
+    async with db.acquire() as conn:
+        await conn.execute(
+            """
+            UPDATE ingestion_jobs
+            SET status = $2, stage = $3, pages_total = $4, pages_processed = $5, chunks_embedded = $6,
+                error = $7, file_path = NULL, updated_at = now()
+            WHERE job_id = $1
+            """,
+            job_id,
+            status,
+            "done" if status == STATUS_SUCCEEDED else STATUS_FAILED,
+            progress.get("page_count"),
+            progress.get("pages_processed", 0),
+            progress.get("chunks_embedded", 0),
+            error
+        )
+
+
+async def _run_job(job: dict):
+    job_id = job["job_id"]
+    progress = {}
+
+    async def report_progress():
+        # Doubles as the heartbeat that tells recovery this job is still alive
+        while True:
+            await asyncio.sleep(Config.INGESTION_PROGRESS_INTERVAL_SECONDS)
+            try:
+                await _save_progress(job_id, progress)
+            except Exception as e:
+                logger.warning(f"[INGESTION_JOBS] Failed to save progress for job {job_id}: {str(e)}")
+
+    reporter = asyncio.create_task(report_progress())
+    try:
+        result = await upload_text(job["file_path"], {"user_id": job["user_id"], "source": job["source"]}, progress)
+        if result.get("skipped"):
+            await _finish_job(job_id, STATUS_FAILED, progress, error=result["message"])
+        else:
+            await _finish_job(job_id, STATUS_SUCCEEDED, progress)
+            logger.info(f"[INGESTION_JOBS] Job {job_id} succeeded with {progress.get('chunks_embedded', 0)} chunks")
+    except asyncio.CancelledError:
+        # Shutting down: clean up the partial document and leave the job for the next start
+        await asyncio.shield(_requeue_interrupted(job))
+        raise
+    except Exception as e:
+        # SECURITY: Log full error details server-side, but store a generic message on the job
+        logger.error(f"[INGESTION_JOBS] Job {job_id} failed: {str(e)}")
+        await _finish_job(job_id, STATUS_FAILED, progress, error="Failed to process PDF. Please try again.")
+    finally:
+        reporter.cancel()
+
+    _remove_file(job["file_path"])
+
+
+async def _requeue_interrupted(job: dict):
+    try:
+        document = await registry.get_document(job["user_id"], job["source"])
+        if document and document["status"] == registry.STATUS_PROCESSING:
+            await registry.delete_document(job["user_id"], job["source"])
+        async with db.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE ingestion_jobs
+                SET status = $2, stage = $2, pages_processed = 0, chunks_embedded = 0, updated_at = now()
+                WHERE job_id = $1 AND status = $3
+                """,
+                job["job_id"], STATUS_QUEUED, STATUS_RUNNING
+            )
+    except Exception as e:
+        logger.error(f"[INGESTION_JOBS] Failed to requeue interrupted job {job['job_id']}: {str(e)}")
+
+
+async def _worker(worker_id: int):
+    queue = _get_queue()
+    while True:
+        job_id = await queue.get()
+        try:
+            job = await _claim_job(job_id)
+            if job is not None:
+                await _run_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[INGESTION_JOBS] Worker {worker_id} failed on job {job_id}: {str(e)}")
+
+
+async def recover_jobs():
+    """
+    Resumes or fails jobs left behind by a restart or a crashed process.
+
+    Running jobs whose heartbeat is older than INGESTION_STALE_SECONDS have
+    their partial document removed and go back to the queue. This host's
+    queued jobs that are not in this process's queue are enqueued, or failed
+    if their file is gone, and their heartbeat is refreshed. Queued jobs of
+    another host are left to it until their heartbeat is twice as old; then
+    this host takes them over, and fails them if their file is not reachable
+    from here (no shared spool dir).
+
+    Only one worker per host recovers at a time; the others skip the pass.
+    """
+    await ensure_jobs_table()
+    # Held on a dedicated connection for the whole pass, which uses pooled ones
+    conn = await db.connect()
+    try:
+        if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext('ingestion_recovery/' || $1))", _OWNER):
+            return
+        try:
+            await _recover_jobs()
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext('ingestion_recovery/' || $1))", _OWNER)
+    finally:
+        await conn.close()
+
+
+async def _recover_jobs():
+    queue = _get_queue()
+    async with db.acquire() as conn:
+        stale = await conn.fetch(
+            f"""
+            UPDATE ingestion_jobs SET status = $1, stage = $1, pages_processed = 0, chunks_embedded = 0, updated_at = now()
+            WHERE status = $2 AND updated_at < now() - make_interval(secs => $3)
+            RETURNING {_COLUMNS}
+            """,
+            STATUS_QUEUED, STATUS_RUNNING, Config.INGESTION_STALE_SECONDS
+        )
+        owned = await conn.fetch(
+            f"""
+            UPDATE ingestion_jobs SET updated_at = now()
+            WHERE status = $1 AND owner = $2
+            RETURNING {_COLUMNS}
+            """,
+            STATUS_QUEUED, _OWNER
+        )
+        # Recovery runs every INGESTION_STALE_SECONDS on a live host, refreshing its queued jobs
+        abandoned = await conn.fetch(
+            f"""
+            UPDATE ingestion_jobs SET owner = $2, updated_at = now()
+            WHERE status = $1 AND owner IS DISTINCT FROM $2 AND updated_at < now() - make_interval(secs => $3)
+            RETURNING {_COLUMNS}
+            """,
+            STATUS_QUEUED, _OWNER, 2 * Config.INGESTION_STALE_SECONDS
+        )
+
+    for job in stale:
+        document = await registry.get_document(job["user_id"], job["source"])
+        if document and document["status"] == registry.STATUS_PROCESSING:
+            await registry.delete_document(job["user_id"], job["source"])
+
+    resumed = failed = 0
+    for job in sorted([*owned, *abandoned], key=lambda job: job["created_at"]):
+        if job["job_id"] in queue:
+            continue
+        if job["file_path"] and os.path.exists(job["file_path"]):
+            await queue.put(job["job_id"], job["user_id"])
+            resumed += 1
+        else:
+            await _finish_job(job["job_id"], STATUS_FAILED, {}, error="Upload file is no longer available. Please upload again.")
+            failed += 1
+
+    if resumed or failed or abandoned:
+        logger.info(f"[INGESTION_JOBS] Recovery resumed {resumed} jobs and failed {failed} jobs, {len(abandoned)} taken over from other hosts")
+
+
+async def start_workers():
+    """Recovers persisted jobs and starts the ingestion worker pool and periodic recovery."""
+    global _recovery_task
+    if _workers:
+        return
+
+    try:
+        await recover_jobs()
+    except Exception as e:
+        logger.error(f"[INGESTION_JOBS] Job recovery failed: {str(e)}")
+
+    for worker_id in range(max(1, Config.INGESTION_WORKERS)):
+        _workers.append(asyncio.create_task(_worker(worker_id)))
+
+    async def recover_periodically():
+        while True:
+            await asyncio.sleep(Config.INGESTION_STALE_SECONDS)
+            try:
+                await recover_jobs()
+            except Exception as e:
+                logger.error(f"[INGESTION_JOBS] Job recovery failed: {str(e)}")
+
+    _recovery_task = asyncio.create_task(recover_periodically())
+
+
+async def stop_workers():
+    global _recovery_task
+    tasks = _workers + ([_recovery_task] if _recovery_task else [])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _workers.clear()
+    _recovery_task = None
+
+
+def queue_depth() -> int:
+    return len(_get_queue())
+
+
+register_gauge("ingestion_queue_depth", "Ingestion jobs waiting for a worker in this process.", queue_depth)
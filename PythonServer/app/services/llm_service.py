@@ -1,10 +1,54 @@
-from langchain_aws import ChatBedrock
+from langchain_core.output_parsers import StrOutputParser
+from pydantic import BaseModel, Field
 from app.config import Config
+from app.services.bedrock_client import get_bedrock_client
+import app.services.prompts as PromptTemplate
+
+# Process-wide clients and chains, built once and reused by every request
+_llm = None
+_llm_with_tools = {}
+_grader_chain = None
+_generation_chain = None
+
+
+class Grade(BaseModel):
+    """Relevance grade returned by the document grader."""
+    binary_score: str = Field(description="Relevance score 'yes' or 'no'")
 
 
 def get_llm():
-    return ChatBedrock(
-        model_id=Config.LLM_MODEL,
-        temperature=0,
-        max_tokens=1024,
-        )
+    global _llm
+    if _llm is None:
+        from langchain_aws import ChatBedrock  # Deferred to first use or startup warmup
+
+        _llm = ChatBedrock(
+            client=get_bedrock_client(),
+            model_id=Config.LLM_MODEL,
+            temperature=0,
+            max_tokens=1024,
+            )
+    return _llm
+
+
+def get_llm_with_tools(tools: list):
+    """Returns the LLM bound to the given tools, binding each tool set only once."""
+    key = tuple(tool.name for tool in tools)
+    if key not in _llm_with_tools:
+        _llm_with_tools[key] = get_llm().bind_tools(tools)
+    return _llm_with_tools[key]
+
+
+def get_grader_chain():
+    """Returns the cached grader prompt | structured-output LLM chain."""
+    global _grader_chain
+    if _grader_chain is None:
+        _grader_chain = PromptTemplate.get_grader_prompt() | get_llm().with_structured_output(Grade)
+    return _grader_chain
+
+
+def get_generation_chain():
+    """Returns the cached generate prompt | LLM | string parser chain."""
+    global _generation_chain
+    if _generation_chain is None:
+        _generation_chain = PromptTemplate.get_generate_prompt() | get_llm() | StrOutputParser()
+    return _generation_chain
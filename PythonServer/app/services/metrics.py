@@ -0,0 +1,371 @@
+import asyncio
+import functools
+import glob
+import json
+import logging
+import os
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond cache hits to multi-second LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# How often each worker writes its snapshot to METRICS_MULTIPROC_DIR
+SNAPSHOT_INTERVAL_SECONDS = 5
+
+_metrics = []
+_gauges = []
+_snapshot_task = None
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally labelled."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+        _metrics.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "type": "counter",
+                "documentation": self.documentation,
+                "labelnames": self.labelnames,
+                "values": dict(self._values),
+            }
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally labelled. observe() is a bisect and a few additions."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = Lock()
+        _metrics.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "type": "histogram",
+                "documentation": self.documentation,
+                "labelnames": self.labelnames,
+                "buckets": self.buckets,
+                "series": {key: [list(counts), total, count] for key, (counts, total, count) in self._series.items()},
+            }
+
+
+def register_gauge(name: str, documentation: str, read, labelname: str = None):
+    """
+    Registers a gauge whose value is read at scrape time.
+
+    `read` returns a number, or a {label_value: number} dict when `labelname` is set.
+    """
+    _gauges.append((name, documentation, read, labelname))
+
+
+def _read_gauge(name: str, read, labelname: str):
+    try:
+        return read()
+    except Exception as e:
+        logger.debug(f"[METRICS] Gauge {name} failed: {str(e)}")
+        return None
+
+
+def _snapshot() -> dict:
+    """This process's metrics: counter and histogram samples by label values, and current gauge readings."""
+    snapshot = {metric.name: metric.snapshot() for metric in _metrics}
+    for name, documentation, read, labelname in _gauges:
+        value = _read_gauge(name, read, labelname)
+        if value is not None:
+            snapshot[name] = {"type": "gauge", "documentation": documentation, "labelname": labelname, "value": value}
+    return snapshot
+
+
+def _render_counter(name: str, metric: dict) -> list[str]:
+    lines = [f"# HELP {name} {metric['documentation']}", f"# TYPE {name} counter"]
+    for key, value in sorted(metric["values"].items()):
+        lines.append(f"{name}{_format_labels(metric['labelnames'], key)} {_format_value(value)}")
+    return lines
+
+
+def _render_histogram(name: str, metric: dict) -> list[str]:
+    lines = [f"# HELP {name} {metric['documentation']}", f"# TYPE {name} histogram"]
+    labelnames = metric["labelnames"]
+    for key, (counts, total, count) in sorted(metric["series"].items()):
+        cumulative = 0
+        for bound, bucket_count in zip(tuple(metric["buckets"]) + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, le)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {count}")
+    return lines
+
+
+def _render_gauge(name: str, readings: list[tuple]) -> list[str]:
+    """Renders a gauge from (worker, snapshot entry) pairs; `worker` is None outside multi-process mode."""
+    lines = [f"# HELP {name} {readings[0][1]['documentation']}", f"# TYPE {name} gauge"]
+    for worker, gauge in readings:
+        extra = f'worker="{worker}"' if worker is not None else ""
+        if gauge["labelname"] is None:
+            lines.append(f"{name}{_format_labels((), (), extra)} {_format_value(gauge['value'])}")
+        else:
+            for label, item in sorted(gauge["value"].items()):
+                lines.append(f"{name}{_format_labels((gauge['labelname'],), (label,), extra)} {_format_value(item)}")
+    return lines
+
+
+def _merge(snapshots: dict) -> dict:
+    """
+    Combines worker snapshots: counters and histograms are summed across
+    workers, gauges are kept per worker (a hit ratio or queue depth does not add up).
+    """
+    merged = {}
+    for worker, snapshot in snapshots.items():
+        for name, metric in snapshot.items():
+            if metric["type"] == "gauge":
+                merged.setdefault(name, {"type": "gauge", "readings": []})["readings"].append((worker, metric))
+            elif metric["type"] == "counter":
+                target = merged.setdefault(name, {**metric, "values": {}})
+                for key, value in metric["values"].items():
+                    target["values"][key] = target["values"].get(key, 0) + value
+            else:
+                target = merged.setdefault(name, {**metric, "series": {}})
+                for key, (counts, total, count) in metric["series"].items():
+                    series = target["series"].setdefault(key, [[0] * len(counts), 0.0, 0])
+                    series[0] = [a + b for a, b in zip(series[0], counts)]
+                    series[1] += total
+                    series[2] += count
+    return merged
+
+
+def _render_merged(merged: dict) -> str:
+    lines = []
+    for name, metric in merged.items():
+        if metric["type"] == "counter":
+            lines.extend(_render_counter(name, metric))
+        elif metric["type"] == "histogram":
+            lines.extend(_render_histogram(name, metric))
+        else:
+            lines.extend(_render_gauge(name, metric["readings"]))
+    return "\n".join(lines) + "\n"
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(Config.METRICS_MULTIPROC_DIR, f"{pid}.json")
+
+
+def _encode(snapshot: dict) -> dict:
+    """Turns label-value tuples into JSON-friendly lists."""
+    encoded = {}
+    for name, metric in snapshot.items():
+        if metric["type"] == "counter":
+            metric = {**metric, "values": [[list(key), value] for key, value in metric["values"].items()]}
+        elif metric["type"] == "histogram":
+            metric = {**metric, "series": [[list(key), *series] for key, series in metric["series"].items()]}
+        encoded[name] = metric
+    return encoded
+
+
+def _decode(snapshot: dict) -> dict:
+    decoded = {}
+    for name, metric in snapshot.items():
+        if metric["type"] == "counter":
+            metric = {**metric, "values": {tuple(key): value for key, value in metric["values"]}}
+        elif metric["type"] == "histogram":
+            metric = {**metric, "series": {tuple(key): [counts, total, count] for key, counts, total, count in metric["series"]}}
+        decoded[name] = metric
+    return decoded
+
+
+def _write_file(path: str, snapshot: dict):
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temporary, "w") as out:
+        json.dump(snapshot, out)
+    os.replace(temporary, path)
+
+
+def write_snapshot():
+    """Writes this worker's metrics to METRICS_MULTIPROC_DIR for the other workers' /metrics."""
+    if not Config.METRICS_MULTIPROC_DIR:
+        return
+    os.makedirs(Config.METRICS_MULTIPROC_DIR, exist_ok=True)
+    _write_file(_snapshot_path(os.getpid()), _encode(_snapshot()))
+
+
+def _read_snapshots() -> dict:
+    """Reads every worker's last snapshot, with this worker's taken now; keyed by worker pid."""
+    snapshots = {}
+    for path in sorted(glob.glob(os.path.join(Config.METRICS_MULTIPROC_DIR, "*.json"))):
+        try:
+            with open(path) as f:
+                snapshots[os.path.basename(path)[:-len(".json")]] = _decode(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"[METRICS] Skipping unreadable snapshot {path}: {str(e)}")
+    snapshots[str(os.getpid())] = _snapshot()
+    return snapshots
+
+
+def mark_process_dead(pid: int):
+    """
+    Keeps an exited worker's counters and histograms in the totals but drops its gauges.
+
+    Called by gunicorn's child_exit hook. The snapshot is renamed so a new
+    worker that gets the same pid does not overwrite it.
+    """
+    if not Config.METRICS_MULTIPROC_DIR:
+        return
+    path = _snapshot_path(pid)
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+    snapshot = {name: metric for name, metric in snapshot.items() if metric["type"] != "gauge"}
+    _write_file(os.path.join(Config.METRICS_MULTIPROC_DIR, f"dead-{pid}-{uuid.uuid4().hex[:8]}.json"), snapshot)
+    os.unlink(path)
+
+
+def render() -> str:
+    """
+    Renders every metric in the Prometheus text exposition format.
+
+    With METRICS_MULTIPROC_DIR set (gunicorn sets it when running several
+    workers), the output covers every worker, whichever one serves the scrape.
+    """
+    if not Config.METRICS_MULTIPROC_DIR:
+        return _render_merged(_merge({None: _snapshot()}))
+    return _render_merged(_merge(_read_snapshots()))
+
+
+def start_snapshot_task():
+    """Writes this worker's snapshot every SNAPSHOT_INTERVAL_SECONDS (no-op without METRICS_MULTIPROC_DIR)."""
+    global _snapshot_task
+    if _snapshot_task is not None or not Config.METRICS_MULTIPROC_DIR:
+        return
+
+    async def loop():
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL_SECONDS)
+            try:
+                await asyncio.to_thread(write_snapshot)
+            except Exception as e:
+                logger.warning(f"[METRICS] Failed to write metrics snapshot: {str(e)}")
+
+    _snapshot_task = asyncio.create_task(loop())
+
+
+async def stop_snapshot_task():
+    global _snapshot_task
+    if _snapshot_task is not None:
+        _snapshot_task.cancel()
+        await asyncio.gather(_snapshot_task, return_exceptions=True)
+        _snapshot_task = None
+        try:
+            write_snapshot()
+        except Exception as e:
+            logger.warning(f"[METRICS] Failed to write metrics snapshot: {str(e)}")
+
+
+def timed(histogram: Histogram, **labels):
+    """Decorator recording the duration of an async function in `histogram`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+
+### Application metrics
+
+GRAPH_NODE_SECONDS = Histogram("graph_node_seconds", "Duration of each LangGraph node and edge.", ("node",))
+GRADE_DECISIONS = Counter("graph_grade_decisions_total", "Document grading decisions by path.", ("path", "decision"))
+GRAPH_REWRITES = Counter("graph_rewrites_total", "Query rewrites performed.")
+SPECULATIVE_GENERATIONS = Counter(
+    "graph_speculative_generations_total", "Speculative generations by outcome: used, discarded or abandoned.", ("outcome",)
+)
+SPECULATIVE_HEAD_START_SECONDS = Histogram(
+    "graph_speculative_head_start_seconds", "How long a used speculative generation ran before the generate node took it over."
+)
+
+ASK_STREAM_REQUESTS = Counter("ask_stream_requests_total", "Streamed questions by outcome.", ("outcome",))
+ASK_STREAM_TTFT_SECONDS = Histogram("ask_stream_ttft_seconds", "Time from request to the first answer token frame.")
+ASK_STREAM_DURATION_SECONDS = Histogram("ask_stream_duration_seconds", "Time from request to the end of the stream.")
+ASK_STREAM_TOKENS_PER_SECOND = Histogram(
+    "ask_stream_tokens_per_second", "Answer tokens per second after the first token.",
+    buckets=(5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500),
+)
+
+ASK_BATCH_QUESTIONS = Counter("ask_batch_questions_total", "Batch questions by outcome.", ("outcome",))
+
+EMBEDDING_SECONDS = Histogram("embedding_request_seconds", "Embedding call latency.", ("kind",))
+CONTEXT_TOKENS = Counter(
+    "context_tokens_total", "Context tokens retrieved, and left after dedupe, merging and the token budget.", ("stage",)
+)
+VECTOR_SEARCH_SECONDS = Histogram("vector_search_seconds", "Similarity search latency by serving tier.", ("tier",))
+CHECKPOINT_SECONDS = Histogram("checkpoint_operation_seconds", "Checkpointer read and write latency.", ("operation",))
+
+PDF_EXTRACTION_SECONDS_PER_PAGE = Histogram(
+    "pdf_extraction_seconds_per_page", "PDF text extraction and splitting time per page, per shard.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+PDF_PAGES_EXTRACTED = Counter("pdf_pages_extracted_total", "PDF pages extracted.")
@@ -1,12 +1,25 @@
-import pymupdf
-import asyncio
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from app.services.pgvector_service import get_vector_store
+from app.services.extraction_engine import iter_pdf_chunks
+from app.services.embedding_writer import EmbeddingWriter
+import app.services.document_registry as registry
+from app.services.document_events import notify_document_changed
 import traceback
-import io
+from contextlib import aclosing
+import logging
 from langchain_core.documents import Document
+from app.services.embedding_cache import get_cache_stats
 
-async def upload_text(pdf_path, doc_metadata: dict):
+logger = logging.getLogger(__name__)
+
+async def upload_text(pdf_path, doc_metadata: dict, progress: dict = None):
+    """
+    Extracts, embeds and stores a PDF's chunks for (user_id, source).
+
+    `pdf_path` is an uploaded file object or the path of a PDF on disk. If
+    `progress` is given it is kept up to date with the stage, page counts and
+    chunks embedded, for ingestion jobs to report.
+    """
+    progress = {} if progress is None else progress
     try:
         vector_store = await get_vector_store()
         if vector_store is None:
@@ -15,78 +28,45 @@ async def upload_text(pdf_path, doc_metadata: dict):
         user_id = doc_metadata["user_id"]
         source = doc_metadata["source"]
 
-        # Check if document already exists by searching for any vector with matching metadata
-        existing_docs = await vector_store.asimilarity_search(
-            query="check_duplicate",
-            k=1,
-            filter={"user_id": user_id, "source": source}
-        )
-        if existing_docs:
-            return {"message": f"Document from source '{source}' already exists. Upload skipped."}
+        # Register the document up front; this also rejects duplicates with an indexed lookup
+        if not await registry.claim_document(user_id, source):
+            return {"message": f"Document from source '{source}' already exists. Upload skipped.", "skipped": True}
 
-        # Extract text chunks from the PDF
-        text_splits = await extract_text_from_pdf(pdf_path)
-        if not text_splits:
-            raise ValueError("Extracted text is empty. Ensure the PDF is not blank or encrypted.")
+        # Extraction fills in byte_size, content_hash, page_count and pages_processed
+        progress["stage"] = "extracting"
 
-        # Create Document objects with metadata for each chunk
-        documents = [
-            Document(page_content=text, metadata=doc_metadata.copy())
-            for text in text_splits
-        ]
+        async def iter_documents():
+            chunk_index = 0
+            async with aclosing(iter_pdf_chunks(pdf_path, progress)) as chunks:
+                async for text in chunks:
+                    progress["stage"] = "embedding"
+                    # Position in the document, so context assembly can merge neighbouring chunks
+                    yield Document(page_content=text, metadata={**doc_metadata, "chunk_index": chunk_index})
+                    chunk_index += 1
 
-        # Upload to vector store - pgvector handles ID generation internally
-        await vector_store.aadd_documents(documents)
+        # Embed and insert chunks in concurrent batches while extraction keeps running on the process pool
+        writer = EmbeddingWriter(vector_store, progress=progress)
+        try:
+            chunk_count = await writer.write(iter_documents())
+            if chunk_count == 0:
+                raise ValueError("Extracted text is empty. Ensure the PDF is not blank or encrypted.")
+        except Exception:
+            # Do not leave a partially embedded document or a stale registry entry behind
+            await registry.delete_document(user_id, source)
+            raise
 
-        return {"message": "Text uploaded successfully."}
+        progress["stage"] = "finalizing"
+        await registry.mark_ready(
+            user_id, source, chunk_count,
+            byte_size=progress.get("byte_size"),
+            content_hash=progress.get("content_hash"),
+        )
+        await notify_document_changed(user_id, source)
 
-    except Exception as e:
-        error_details = traceback.format_exc()
-        raise RuntimeError(f"Upload failed: {error_details}") from e
-    
-async def extract_text_from_pdf(pdf_path):
-    """
-    Extracts text from a PDF file asynchronously.
-    """
-    try:
-        # Run the blocking PDF operation in a separate thread
-        text_splits = await asyncio.to_thread(_sync_extract_text_from_pdf, pdf_path)
-        return text_splits
+        logger.info(f"[UPLOAD_TEXT] Stored {chunk_count} chunks for source '{source}', embedding cache: {get_cache_stats()}")
 
-    except Exception as e:
-        # print(pdf_path)
-        error_details = traceback.format_exc()
-        # print(f"Error extracting text from PDF {pdf_path}: {error_details}")
-        raise RuntimeError(f"Text extraction failed for {pdf_path}: {error_details}") from e
+        return {"message": "Text uploaded successfully."}
 
-def _sync_extract_text_from_pdf(pdf_input):
-    try:
-        # Reset pointer and read all bytes
-        pdf_input.seek(0)
-        file_bytes = pdf_input.read()
-        
-        # Wrap the bytes in a BytesIO stream
-        pdf_stream = io.BytesIO(file_bytes)
-        
-        # Open the PDF using PyMuPDF
-        doc = pymupdf.open(stream=pdf_stream, filetype="pdf")
-        
-        # Extract text from all pages
-        text = ""
-        for page in doc:
-            text += page.get_text() + "\n"
-        
-        # Check if text was extracted
-        if not text.strip():
-            raise ValueError("No text found in PDF. The document may be scanned or contain images instead of text.")
-        
-        # Use your text splitter to break text into chunks
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            chunk_size=512, chunk_overlap=20
-        )
-        return text_splitter.split_text(text)
-    
     except Exception as e:
         error_details = traceback.format_exc()
-        # print(f"Error extracting text with PyMuPDF from PDF {pdf_input}: {error_details}")
-        raise RuntimeError(f"Text extraction failed for {pdf_input}: {error_details}") from e
\ No newline at end of file
+        raise RuntimeError(f"Upload failed: {error_details}") from e
@@ -1,19 +1,38 @@
 import asyncio
-from urllib.parse import quote_plus
-from langchain_postgres import PGVector
+import json
+import logging
+import time
+import numpy as np
 from app.config import Config
+import app.services.db_service as db
 import app.services.embedding_service as embed
-from langchain_core.tools.retriever import create_retriever_tool
+import app.services.hot_vector_index as hot_index
+import app.services.vector_storage as vector_storage
+from app.services.cache_utils import LRUCache
+from app.services.context_assembly import assemble_context
+from app.services.embedding_writer import retry_throttled
+from app.services.document_events import is_listening, register_document_listener, register_reset_listener
+from app.services.metrics import EMBEDDING_SECONDS, VECTOR_SEARCH_SECONDS, register_gauge
+from app.services.vector_indexes import current_ef_search, ensure_vector_indexes, install_search_settings, use_exact_scan
+from typing import Annotated
+from langchain_core.tools import StructuredTool
+from langgraph.prebuilt import InjectedState
 import app.services.prompts as prompt_template
 
+logger = logging.getLogger(__name__)
+
 _vector_store = None
+_index_task = None
 _lock = asyncio.Lock()
 
-def get_connection_string():
-    """Build PostgreSQL connection string for pgvector with URL-encoded password."""
-    # URL-encode password to handle special characters like @, /, #, %
-    encoded_password = quote_plus(Config.RDS_PASSWORD) if Config.RDS_PASSWORD else ""
-    return f"postgresql+psycopg://{Config.RDS_USER}:{encoded_password}@{Config.RDS_HOST}:{Config.RDS_PORT}/{Config.RDS_DB}"
+# Query embeddings keyed by normalized query text, and recent search results
+# keyed by (query embedding, filter, k, ef_search)
+_query_embeddings = LRUCache(Config.QUERY_EMBEDDING_CACHE_SIZE)
+_pending_embeddings = {}
+_batch_embedding_slots = None
+_retrieval_cache = LRUCache(Config.RETRIEVAL_CACHE_SIZE, ttl_seconds=Config.RETRIEVAL_CACHE_TTL_SECONDS)
+# Bumped when a user's cached results are dropped (None: all users), so searches that started before do not cache theirs
+_retrieval_generations = {}
 
 async def initialize_pgvector():
     global _vector_store
@@ -23,13 +42,17 @@ async def initialize_pgvector():
             return  # Already initialized
 
         try:
-            connection_string = get_connection_string()
+            from langchain_postgres import PGVector  # Deferred: heavy import, only needed here
+
+            engine = await db.get_engine()  # Shared pool from db_service
+            install_search_settings(engine)  # Per-request hnsw.ef_search
 
             # Initialize PGVector store with async_mode=True for async operations
             _vector_store = PGVector(
                 embeddings=embed.get_embeddings(),
-                collection_name="document_vectors",
-                connection=connection_string,
+                collection_name=Config.VECTOR_COLLECTION,
+                connection=engine,
+                embedding_length=Config.EMBEDDING_DIMENSIONS,  # Fixed dimensions are required for ANN indexes
                 use_jsonb=True,  # Store metadata as JSONB for efficient filtering
                 async_mode=True,  # Enable async operations
             )
@@ -39,16 +62,27 @@ async def initialize_pgvector():
             await _vector_store.acreate_tables_if_not_exists()
             await _vector_store.acreate_collection()
 
+            if Config.VECTOR_INDEX_ON_STARTUP:
+                _start_index_build()
+
         except Exception as e:
             _vector_store = None  # Reset on failure
             raise RuntimeError(f"pgvector failed to initialize: {e}") from e
 
-async def get_retriever_tool(search_kwargs):
-    """Returns a retriever tool with dynamically assigned search_kwargs."""
-    if _vector_store is None:
-        await initialize_pgvector()
+def _start_index_build():
+    """Builds the ANN/metadata indexes in the background so a first-time build does not block requests."""
+    global _index_task
+
+    async def build():
+        try:
+            await ensure_vector_indexes()
+        except Exception as e:
+            logger.error(f"[VECTOR_INDEX] Index management failed: {e}")
+
+    _index_task = asyncio.create_task(build())
 
-    # Convert Pinecone-style filters to pgvector filters
+def to_pgvector_search_kwargs(search_kwargs: dict) -> dict:
+    """Converts request search_kwargs (Pinecone-style filters) to pgvector k/filter arguments."""
     filter_dict = search_kwargs.get("filter", {})
     pgvector_filter = {}
 
@@ -68,17 +102,188 @@ async def get_retriever_tool(search_kwargs):
     }
     if pgvector_filter:
         pgvector_search_kwargs["filter"] = pgvector_filter
+    return pgvector_search_kwargs
 
-    # Create a new retriever instance for each request
-    retriever = _vector_store.as_retriever(search_kwargs=pgvector_search_kwargs)
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).casefold()
 
-    # Create and return a new retriever tool instance
-    return create_retriever_tool(
-        retriever,
-        "retrieve_text",
-        prompt_template.get_retriever_prompt(),
+async def embed_query(query: str) -> list[float]:
+    """
+    Embeds a search query, reusing the embedding of an earlier identical query.
+
+    Concurrent calls for the same normalized query share one Bedrock request.
+    """
+    key = normalize_query(query)
+    embedding = _query_embeddings.get(key)
+    if embedding is not None:
+        return embedding
+
+    pending = _pending_embeddings.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    pending = asyncio.ensure_future(_timed_embed_query(query))
+    _pending_embeddings[key] = pending
+    try:
+        embedding = await asyncio.shield(pending)
+    finally:
+        _pending_embeddings.pop(key, None)
+    _query_embeddings.put(key, embedding)
+    return embedding
+
+async def embed_queries(queries: list[str]) -> list:
+    """
+    Embeds several search queries in one round, for batch requests.
+
+    Queries already in the query embedding cache are reused, and each distinct
+    remaining query is embedded once, with at most ASK_BATCH_EMBED_CONCURRENCY
+    calls running at once in this process. Throttled calls are retried with
+    backoff; a query that still fails gets None, so its question embeds on its
+    own instead of failing the batch. The results are added to the cache so
+    the searches that follow do not embed again.
+    """
+    global _batch_embedding_slots
+    if _batch_embedding_slots is None:
+        _batch_embedding_slots = asyncio.Semaphore(Config.ASK_BATCH_EMBED_CONCURRENCY)
+
+    keys = [normalize_query(query) for query in queries]
+    embeddings = {}
+    missing = {}
+    for key, query in zip(keys, queries):
+        embedding = _query_embeddings.get(key)
+        if embedding is not None:
+            embeddings[key] = embedding
+        elif key not in missing:
+            missing[key] = query
+
+    async def embed_missing(key: str, query: str):
+        try:
+            async with _batch_embedding_slots:
+                embedding = await retry_throttled(lambda: client.aembed_query(query))
+        except Exception as e:
+            logger.warning(f"[EMBED_QUERIES] Batch embedding failed, the question will be embedded on its own: {str(e)}")
+            return
+        _query_embeddings.put(key, embedding)
+        embeddings[key] = embedding
+
+    if missing:
+        client = embed.get_embeddings()
+        with EMBEDDING_SECONDS.time(kind="query_batch"):
+            await asyncio.gather(*(embed_missing(key, query) for key, query in missing.items()))
+    return [embeddings.get(key) for key in keys]
+
+async def _timed_embed_query(query: str) -> list[float]:
+    with EMBEDDING_SECONDS.time(kind="query"):
+        return await embed.get_embeddings().aembed_query(query)
+
+def _retrieval_key(embedding: list[float], pgvector_kwargs: dict) -> tuple:
+    source_filter = pgvector_kwargs.get("filter", {}).get("source")
+    if isinstance(source_filter, dict):
+        sources = tuple(sorted(source_filter.get("$in", [])))
+    else:
+        sources = (source_filter,)
+    return (
+        pgvector_kwargs.get("filter", {}).get("user_id"),
+        sources,
+        np.asarray(embedding, dtype=np.float32).tobytes(),
+        json.dumps(pgvector_kwargs, sort_keys=True),
+        current_ef_search(),
     )
 
+async def search_with_scores(query: str, search_kwargs: dict):
+    """
+    Runs a filtered similarity search and returns (Document, cosine distance) pairs.
+
+    Results are cached for RETRIEVAL_CACHE_TTL_SECONDS and dropped as soon as
+    one of the user's documents in the filter is uploaded or deleted.
+    """
+    pgvector_kwargs = to_pgvector_search_kwargs(search_kwargs)
+    embedding = await embed_query(query)
+    key = _retrieval_key(embedding, pgvector_kwargs)
+    start = time.perf_counter()
+    tier = "cache"
+    results = _retrieval_cache.get(key)
+    if results is None and Config.HOT_INDEX_ENABLED and is_listening():
+        # Exact search over the user's documents held in memory, once they are loaded; skipped
+        # while document changes made by other workers and instances cannot reach this process
+        tier = "hot_index"
+        results = hot_index.search(embedding, pgvector_kwargs.get("filter"), pgvector_kwargs["k"])
+        if results is not None:
+            _retrieval_cache.put(key, results)
+    if results is None:
+        tier = "postgres"
+        generation = _retrieval_generation(key[0])
+        vector_store = await get_vector_store()
+        # Before pgvector 0.8, selective filters are ranked exactly instead of post-filtering ANN results
+        exact = await use_exact_scan(pgvector_kwargs.get("filter"))
+        if Config.VECTOR_STORAGE == "full" and not exact:
+            results = await vector_store.asimilarity_search_with_score_by_vector(embedding, **pgvector_kwargs)
+            # Iterative index scans may return rows slightly out of distance order
+            results.sort(key=lambda result: result[1])
+        else:
+            # Compact ANN index re-ranked on the float32 vectors, or an exact scan
+            results = await vector_storage.search(embedding, pgvector_kwargs, exact=exact)
+        # Skip the results if one of the user's documents changed while the search ran
+        if _retrieval_generation(key[0]) == generation:
+            _retrieval_cache.put(key, results)
+    VECTOR_SEARCH_SECONDS.observe(time.perf_counter() - start, tier=tier)
+    return list(results)
+
+async def search(query: str, search_kwargs: dict):
+    """Runs a filtered similarity search for the request's search_kwargs."""
+    return [doc for doc, _ in await search_with_scores(query, search_kwargs)]
+
+def _retrieval_generation(user_id: str) -> tuple:
+    return _retrieval_generations.get(None, 0), _retrieval_generations.get(user_id, 0)
+
+def invalidate_document(user_id: str, source: str):
+    """Drops cached search results that may include (user_id, source)."""
+    _retrieval_generations[user_id] = _retrieval_generations.get(user_id, 0) + 1
+    _retrieval_cache.invalidate(lambda key: key[0] == user_id and (source in key[1] or key[1] == (None,)))
+
+def clear_retrieval_cache():
+    """Drops every cached search result, including searches still in flight."""
+    _retrieval_generations[None] = _retrieval_generations.get(None, 0) + 1
+    _retrieval_cache.clear()
+
+register_document_listener(invalidate_document)
+register_reset_listener(clear_retrieval_cache)
+
+register_gauge(
+    "retrieval_cache_hit_ratio", "Hit ratio of the query embedding, retrieval result and hot index caches.",
+    lambda: {name: stats["hit_rate"] for name, stats in get_retrieval_cache_stats().items()},
+    labelname="cache",
+)
+
+def get_retrieval_cache_stats() -> dict:
+    return {
+        "query_embeddings": _query_embeddings.stats(),
+        "retrieval_results": _retrieval_cache.stats(),
+        "hot_index": hot_index.get_stats(),
+    }
+
+async def _retrieve_text(
+    query: str,
+    search_kwargs: Annotated[dict, InjectedState("search_kwargs")],
+) -> tuple[str, list[float]]:
+    # search_kwargs is injected from the graph state at call time and hidden from the LLM
+    results = await search_with_scores(query, search_kwargs or {})
+    # The LLM sees the assembled text; the cosine similarities of every chunk travel as the ToolMessage artifact
+    similarities = [1.0 - distance for _, distance in results]
+    content, _ = assemble_context([(doc, similarity) for (doc, _), similarity in zip(results, similarities)])
+    return content, similarities
+
+_retriever_tool = StructuredTool.from_function(
+    coroutine=_retrieve_text,
+    name="retrieve_text",
+    description=prompt_template.get_retriever_prompt(),
+    response_format="content_and_artifact",
+)
+
+def get_retriever_tool():
+    """Returns the process-wide retriever tool; per-request filters come from the graph state."""
+    return _retriever_tool
+
 async def get_vector_store():
     if _vector_store is None:
         await initialize_pgvector()
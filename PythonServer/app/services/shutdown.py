@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import signal
+import time
+from contextlib import contextmanager
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+_draining = None
+_deadline = None
+_active_streams = 0
+
+
+def _get_event() -> asyncio.Event:
+    global _draining
+    if _draining is None:
+        _draining = asyncio.Event()
+    return _draining
+
+
+def start_draining():
+    """Stops taking new streams and gives in-flight ones SHUTDOWN_DRAIN_SECONDS to finish."""
+    global _deadline
+    if _deadline is not None:
+        return
+    _deadline = time.monotonic() + Config.SHUTDOWN_DRAIN_SECONDS
+    _get_event().set()
+    logger.info(f"[SHUTDOWN] Draining {_active_streams} streams for up to {Config.SHUTDOWN_DRAIN_SECONDS:.0f}s")
+
+
+def is_draining() -> bool:
+    return _deadline is not None
+
+
+def install_signal_handlers():
+    """
+    Starts draining on SIGTERM or SIGINT, then passes the signal on.
+
+    The server's own handlers (uvicorn, or the gunicorn worker) stay in place
+    behind ours, so they still stop accepting connections and wait for
+    in-flight requests to finish.
+    """
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(signum)
+
+        def handler(sig, frame, previous=previous):
+            loop.call_soon_threadsafe(start_draining)
+            if callable(previous):
+                previous(sig, frame)
+
+        try:
+            signal.signal(signum, handler)
+        except ValueError:
+            logger.warning("[SHUTDOWN] Not on the main thread; streams will not be drained on shutdown")
+            return
+
+
+@contextmanager
+def track_stream():
+    """Counts a stream as in flight for the drain log and stats."""
+    global _active_streams
+    _active_streams += 1
+    try:
+        yield
+    finally:
+        _active_streams -= 1
+
+
+async def cancel_on_drain(task: asyncio.Task) -> bool:
+    """Cancels `task` once a drain has run past SHUTDOWN_DRAIN_SECONDS. Returns True when it did."""
+    await _get_event().wait()
+    await asyncio.sleep(max(0.0, _deadline - time.monotonic()))
+    task.cancel()
+    return True
+
+
+def get_stats() -> dict:
+    return {
+        "draining": is_draining(),
+        "active_streams": _active_streams,
+        "drain_seconds_left": max(0.0, _deadline - time.monotonic()) if _deadline is not None else None,
+    }
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import logging
+from json.encoder import encode_basestring_ascii
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+STREAM_END = object()
+
+# Pre-encoded frames; token frames only escape the token text
+DONE_FRAME = 'data: {"done": true}\n\n'
+_TOKEN_PREFIX = 'data: {"token": '
+_FRAME_SUFFIX = '}\n\n'
+
+
+def token_frame(text: str) -> str:
+    """Encodes an SSE frame with the same bytes as json.dumps({'token': text}), without the generic encoder."""
+    return _TOKEN_PREFIX + encode_basestring_ascii(text) + _FRAME_SUFFIX
+
+
+def event_frame(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+async def coalesce_token_frames(queue: asyncio.Queue, flush_bytes: int = None, flush_ms: float = None):
+    """
+    Reads tokens from `queue` until STREAM_END and yields them as coalesced SSE frames.
+
+    The first token is sent on its own so time to first token is not delayed.
+    After that, tokens are merged into one frame until it holds `flush_bytes`
+    characters or `flush_ms` has passed since the frame was started.
+    """
+    flush_bytes = Config.SSE_FLUSH_BYTES if flush_bytes is None else flush_bytes
+    flush_seconds = (Config.SSE_FLUSH_MS if flush_ms is None else flush_ms) / 1000
+    loop = asyncio.get_running_loop()
+
+    token = await queue.get()
+    if token is STREAM_END:
+        return
+    yield token_frame(token)
+
+    while True:
+        token = await queue.get()
+        if token is STREAM_END:
+            return
+
+        parts = [token]
+        size = len(token)
+        deadline = loop.time() + flush_seconds
+        finished = False
+        while size < flush_bytes:
+            # Take whatever is already queued without waiting
+            if not queue.empty():
+                token = queue.get_nowait()
+            else:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    token = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if token is STREAM_END:
+                finished = True
+                break
+            parts.append(token)
+            size += len(token)
+
+        yield token_frame("".join(parts))
+        if finished:
+            return
+
+
+async def cancel_on_disconnect(request, task: asyncio.Task):
+    """
+    Waits for the client to disconnect and cancels `task` right away.
+
+    The request body must already have been read, so the only message left
+    on the ASGI receive channel is the disconnect.
+    """
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            task.cancel()
+            return
@@ -0,0 +1,390 @@
+import contextvars
+import json
+import logging
+from contextlib import contextmanager
+from app.config import Config
+import app.services.db_service as db
+import app.services.document_registry as registry
+
+logger = logging.getLogger(__name__)
+
+HNSW_INDEX = "ix_langchain_pg_embedding_hnsw"
+IVFFLAT_INDEX = "ix_langchain_pg_embedding_ivfflat"
+METADATA_INDEX = "ix_langchain_pg_embedding_user_source"
+
+# full indexes the float32 column; halfvec and binary index a compact expression
+# over it, and search re-ranks their candidates on the float32 vectors
+STORAGE_MODES = ("full", "halfvec", "binary")
+
+# Per-request ANN search settings, applied to retrieval queries on the PGVector engine
+_ef_search = contextvars.ContextVar("ef_search", default=None)
+# Whether pgvector can keep scanning the index until enough rows pass the filter (0.8.0+); checked once
+_iterative_scan = None
+
+
+def _index_name(base: str, storage: str) -> str:
+    return base if storage == "full" else f"{base}_{storage}"
+
+
+def _index_target(storage: str) -> str:
+    """Indexed column or expression, with its operator class, for a storage mode."""
+    dims = int(Config.EMBEDDING_DIMENSIONS)
+    if storage == "halfvec":
+        return f"(embedding::halfvec({dims})) halfvec_cosine_ops"
+    if storage == "binary":
+        return f"(binary_quantize(embedding)::bit({dims})) bit_hamming_ops"
+    return "embedding vector_cosine_ops"
+
+
+def candidate_order(storage: str = None, probe: str = "$1") -> str:
+    """ORDER BY expression the storage mode's index serves; `probe` is the float32 query vector parameter."""
+    storage = storage or Config.VECTOR_STORAGE
+    dims = int(Config.EMBEDDING_DIMENSIONS)
+    if storage == "halfvec":
+        # Cast through vector so the parameter has one type wherever the query uses it
+        return f"e.embedding::halfvec({dims}) <=> {probe}::vector::halfvec({dims})"
+    if storage == "binary":
+        return f"binary_quantize(e.embedding)::bit({dims}) <~> binary_quantize({probe}::vector)"
+    return f"e.embedding <=> {probe}::vector"
+
+
+def vector_index_names() -> list[str]:
+    """Every ANN index this module can create, for any index type and storage mode."""
+    return [_index_name(base, storage) for base in (HNSW_INDEX, IVFFLAT_INDEX) for storage in STORAGE_MODES]
+
+
+def _vector_index_ddl(storage: str = None):
+    storage = storage or Config.VECTOR_STORAGE
+    if Config.VECTOR_INDEX_TYPE == "hnsw":
+        name = _index_name(HNSW_INDEX, storage)
+        return name, (
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON langchain_pg_embedding "
+            f"USING hnsw ({_index_target(storage)}) "
+            f"WITH (m = {int(Config.HNSW_M)}, ef_construction = {int(Config.HNSW_EF_CONSTRUCTION)})"
+        )
+    if Config.VECTOR_INDEX_TYPE == "ivfflat":
+        name = _index_name(IVFFLAT_INDEX, storage)
+        return name, (
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON langchain_pg_embedding "
+            f"USING ivfflat ({_index_target(storage)}) WITH (lists = {int(Config.IVFFLAT_LISTS)})"
+        )
+    return None, None
+
+
+def _metadata_index_ddl():
+    return METADATA_INDEX, (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {METADATA_INDEX} ON langchain_pg_embedding "
+        f"((cmetadata->>'user_id'), (cmetadata->>'source'))"
+    )
+
+
+async def _ensure_dimensions(conn):
+    """ANN indexes need a fixed-dimension column; older tables were created as plain `vector`."""
+    typmod = await conn.fetchval(
+        """
+        SELECT atttypmod FROM pg_attribute
+        WHERE attrelid = 'langchain_pg_embedding'::regclass AND attname = 'embedding'
+        """
+    )
+    if typmod is not None and typmod < 0:
+        logger.info(f"[VECTOR_INDEX] Setting embedding column to vector({Config.EMBEDDING_DIMENSIONS})")
+        await conn.execute(
+            f"ALTER TABLE langchain_pg_embedding "
+            f"ALTER COLUMN embedding TYPE vector({int(Config.EMBEDDING_DIMENSIONS)})"
+        )
+
+
+async def _ensure_index(conn, name: str, ddl: str):
+    """Creates an index, rebuilding it if a previous concurrent build left it invalid."""
+    valid = await conn.fetchval(
+        """
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = $1
+        """,
+        name
+    )
+    if valid is False:
+        logger.warning(f"[VECTOR_INDEX] Index {name} is invalid, rebuilding")
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    elif valid:
+        return False
+
+    logger.info(f"[VECTOR_INDEX] Creating index {name}")
+    await conn.execute(ddl)
+    return True
+
+
+async def _check_hnsw_options(conn, name: str):
+    options = await conn.fetchval("SELECT reloptions FROM pg_class WHERE relname = $1", name)
+    expected = {f"m={int(Config.HNSW_M)}", f"ef_construction={int(Config.HNSW_EF_CONSTRUCTION)}"}
+    if options is not None and not expected.issubset(set(options)):
+        logger.warning(
+            f"[VECTOR_INDEX] {name} was built with {options}, configured {sorted(expected)}. "
+            f"Drop the index to rebuild it with the new parameters."
+        )
+
+
+async def _pgvector_version(conn):
+    """Installed pgvector (major, minor), or None if the extension is missing."""
+    version = await conn.fetchval("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+    return tuple(int(part) for part in version.split(".")[:2]) if version else None
+
+
+async def _check_storage_support(conn, storage: str):
+    """halfvec and binary_quantize need pgvector 0.7.0 or later."""
+    if storage == "full":
+        return
+    version = await _pgvector_version(conn)
+    if version is None or version < (0, 7):
+        raise RuntimeError(f"VECTOR_STORAGE={storage} needs pgvector 0.7.0 or later, found {version}")
+
+
+async def detect_iterative_scan(conn=None) -> bool:
+    """True if pgvector supports iterative index scans (0.8.0 or later)."""
+    global _iterative_scan
+    if _iterative_scan is None:
+        if conn is None:
+            async with db.acquire() as conn:
+                version = await _pgvector_version(conn)
+        else:
+            version = await _pgvector_version(conn)
+        _iterative_scan = version is not None and version >= (0, 8)
+        logger.info(f"[VECTOR_INDEX] pgvector {version}, iterative index scans: {_iterative_scan}")
+    return _iterative_scan
+
+
+async def index_sizes(conn) -> dict:
+    """On-disk size in bytes of langchain_pg_embedding and each of its indexes."""
+    rows = await conn.fetch(
+        """
+        SELECT c.relname, pg_relation_size(c.oid) AS bytes
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = 'langchain_pg_embedding'::regclass
+        """
+    )
+    return {
+        "table": await conn.fetchval("SELECT pg_table_size('langchain_pg_embedding')"),
+        "indexes": {row["relname"]: row["bytes"] for row in rows},
+    }
+
+
+async def ensure_vector_indexes():
+    """
+    Idempotently creates and validates the ANN and metadata indexes on langchain_pg_embedding.
+
+    Indexes are built CONCURRENTLY so writes keep flowing, and a session-level
+    advisory lock keeps several app instances from building them at once. A
+    dedicated connection is used so a long build does not hold a pool slot.
+    """
+    conn = await db.connect()
+    try:
+        await conn.execute("SELECT pg_advisory_lock(hashtext('vector_indexes'))")
+        try:
+            await _ensure_dimensions(conn)
+            await detect_iterative_scan(conn)
+
+            created = []
+            name, ddl = _metadata_index_ddl()
+            if await _ensure_index(conn, name, ddl):
+                created.append(name)
+
+            await _check_storage_support(conn, Config.VECTOR_STORAGE)
+            name, ddl = _vector_index_ddl()
+            if name and await _ensure_index(conn, name, ddl):
+                created.append(name)
+            if name and Config.VECTOR_INDEX_TYPE == "hnsw":
+                await _check_hnsw_options(conn, name)
+
+            if created:
+                await conn.execute("ANALYZE langchain_pg_embedding")
+            logger.info(f"[VECTOR_INDEX] Indexes ready, created: {created or 'none'}")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext('vector_indexes'))")
+    finally:
+        await conn.close()
+
+
+async def migrate_vector_storage(storage: str, drop_unused: bool = False) -> dict:
+    """
+    Builds the ANN index for `storage` over the existing embeddings.
+
+    The float32 column is kept for re-ranking, so no rows are rewritten. With
+    `drop_unused`, every other ANN index on the table is dropped afterwards;
+    only do that once the app runs with VECTOR_STORAGE set to `storage`, or
+    its searches fall back to sequential scans. Returns the index sizes.
+    """
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"Unknown storage mode {storage!r}; expected one of {STORAGE_MODES}")
+    name, ddl = _vector_index_ddl(storage)
+    if name is None:
+        raise ValueError("VECTOR_INDEX_TYPE is none; there is no index to build")
+
+    conn = await db.connect()
+    try:
+        await conn.execute("SELECT pg_advisory_lock(hashtext('vector_indexes'))")
+        try:
+            await _check_storage_support(conn, storage)
+            await _ensure_dimensions(conn)
+            created = await _ensure_index(conn, name, ddl)
+            dropped = []
+            if drop_unused:
+                existing = await index_sizes(conn)
+                for other in vector_index_names():
+                    if other != name and other in existing["indexes"]:
+                        logger.info(f"[VECTOR_INDEX] Dropping unused index {other}")
+                        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {other}")
+                        dropped.append(other)
+            await conn.execute("ANALYZE langchain_pg_embedding")
+            sizes = await index_sizes(conn)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext('vector_indexes'))")
+    finally:
+        await conn.close()
+
+    logger.info(f"[VECTOR_INDEX] Storage {storage} ready with {name} (created: {created}, dropped: {dropped or 'none'})")
+    return {"storage": storage, "index": name, "created": created, "dropped": dropped, **sizes}
+
+
+@contextmanager
+def vector_search_settings(ef_search: int = None):
+    """Sets hnsw.ef_search for retrieval queries issued inside this block."""
+    token = _ef_search.set(ef_search)
+    try:
+        yield
+    finally:
+        _ef_search.reset(token)
+
+
+def current_ef_search() -> int:
+    """The hnsw.ef_search that retrieval queries in this context will run with."""
+    return _ef_search.get() or Config.HNSW_EF_SEARCH
+
+
+def iterative_scan_sql():
+    """
+    SET LOCAL statement that makes a filtered ANN scan continue until LIMIT rows pass the filter.
+
+    Without it, the index returns its ef_search (or probes') nearest rows and
+    the filter is applied afterwards, so a selective filter returns fewer than
+    k rows. relaxed_order can return rows slightly out of distance order;
+    callers re-sort. None before pgvector 0.8.0 or without an ANN index.
+    """
+    if not _iterative_scan:
+        return None
+    if Config.VECTOR_INDEX_TYPE == "hnsw":
+        return "SET LOCAL hnsw.iterative_scan = relaxed_order"
+    if Config.VECTOR_INDEX_TYPE == "ivfflat":
+        return "SET LOCAL ivfflat.iterative_scan = relaxed_order"
+    return None
+
+
+async def use_exact_scan(pgvector_filter: dict) -> bool:
+    """
+    True when a filtered search should skip the ANN index and scan the matching rows exactly.
+
+    Only before pgvector 0.8.0, which cannot scan iteratively: filters that
+    match at most VECTOR_EXACT_SCAN_MAX_CHUNKS chunks (per the document
+    registry) are served by the (user_id, source) index and an exact sort.
+    """
+    if not pgvector_filter or not pgvector_filter.get("user_id") or Config.VECTOR_INDEX_TYPE == "none":
+        return False
+    if await detect_iterative_scan():
+        return False
+    source = pgvector_filter.get("source")
+    if isinstance(source, dict):
+        sources = list(source.get("$in", []))
+    else:
+        sources = [source] if source is not None else None
+    return await registry.count_chunks(pgvector_filter["user_id"], sources) <= Config.VECTOR_EXACT_SCAN_MAX_CHUNKS
+
+
+def rerank_candidates(k: int) -> int:
+    """Candidates a compact-storage search takes from the index before re-ranking down to `k`."""
+    return max(k, Config.VECTOR_RERANK_CANDIDATES)
+
+
+def install_search_settings(engine):
+    """
+    Hooks the PGVector engine so similarity queries run with the current ef_search, and scan iteratively when supported.
+
+    The setting is applied with SET LOCAL, so it only lasts for the retrieval
+    transaction and never leaks to other requests sharing the pooled connection.
+    """
+    from sqlalchemy import event
+
+    def apply_search_settings(conn, cursor, statement, parameters, context, executemany):
+        if "langchain_pg_embedding" not in statement or "<=>" not in statement:
+            return
+        ef_search = current_ef_search()
+        if ef_search and Config.VECTOR_INDEX_TYPE == "hnsw":
+            cursor.execute(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+        iterative_scan = iterative_scan_sql()
+        if iterative_scan:
+            cursor.execute(iterative_scan)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", apply_search_settings)
+
+
+def _collect_index_names(plan: dict, names: list):
+    if "Index Name" in plan:
+        names.append(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        _collect_index_names(child, names)
+    return names
+
+
+async def explain_retrieval(user_id: str, sources: list[str], k: int = 5, ef_search: int = None) -> dict:
+    """
+    EXPLAINs the filtered retrieval query and reports which indexes the planner uses.
+
+    An existing embedding is used as the probe vector so no Bedrock call is needed.
+    The query runs with the same filtered-search strategy as retrieval: an
+    iterative index scan on pgvector 0.8+, or an exact scan for selective filters before that.
+    """
+    exact = await use_exact_scan({"user_id": user_id, "source": {"$in": sources}})
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            ef_search = ef_search or Config.HNSW_EF_SEARCH
+            limit = k if Config.VECTOR_STORAGE == "full" or exact else rerank_candidates(k)
+            if exact:
+                # Bitmap scans of the metadata index stay enabled; the ANN index cannot serve them
+                await conn.execute("SET LOCAL enable_indexscan = off")
+            elif ef_search and Config.VECTOR_INDEX_TYPE == "hnsw":
+                # HNSW returns at most ef_search rows, so compact searches widen it to the candidate count
+                await conn.execute(f"SET LOCAL hnsw.ef_search = {max(int(ef_search), limit)}")
+            if not exact and iterative_scan_sql():
+                await conn.execute(iterative_scan_sql())
+            probe = await conn.fetchval("SELECT embedding::text FROM langchain_pg_embedding LIMIT 1")
+            if probe is None:
+                return {"error": "No embeddings stored yet; nothing to explain."}
+
+            # Compact storage modes are explained on their candidate query, which is what uses the index
+            rows = await conn.fetch(
+                f"""
+                EXPLAIN (FORMAT JSON)
+                SELECT e.id, {candidate_order("full" if exact else None)} AS distance
+                FROM langchain_pg_embedding e
+                JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+                WHERE c.name = $2
+                  AND e.cmetadata->>'user_id' = $3
+                  AND e.cmetadata->>'source' = ANY($4::text[])
+                ORDER BY distance
+                LIMIT $5
+                """,
+                probe, Config.VECTOR_COLLECTION, user_id, sources, limit
+            )
+
+    plan = json.loads(rows[0][0])[0]["Plan"]
+    indexes = _collect_index_names(plan, [])
+    vector_index, _ = _vector_index_ddl()
+    return {
+        "indexes_used": indexes,
+        "uses_vector_index": vector_index in indexes,
+        "uses_metadata_index": METADATA_INDEX in indexes,
+        "ef_search": ef_search,
+        "iterative_scan": bool(iterative_scan_sql()),
+        "exact_scan": exact,
+        "storage": Config.VECTOR_STORAGE,
+        "plan": plan,
+    }
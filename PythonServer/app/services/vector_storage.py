@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+from langchain_core.documents import Document
+from app.config import Config
+import app.services.db_service as db
+from app.services.vector_indexes import (
+    STORAGE_MODES, candidate_order, current_ef_search, iterative_scan_sql, migrate_vector_storage, rerank_candidates
+)
+
+logger = logging.getLogger(__name__)
+
+
+def to_vector_literal(embedding) -> str:
+    return "[" + ",".join(repr(float(x)) for x in embedding) + "]"
+
+
+def _filter_conditions(pgvector_filter: dict, args: list) -> list[str]:
+    """SQL conditions for the user_id and source filters built by to_pgvector_search_kwargs; appends their arguments."""
+    conditions = []
+    if "user_id" in pgvector_filter:
+        args.append(pgvector_filter["user_id"])
+        conditions.append(f"e.cmetadata->>'user_id' = ${len(args)}")
+    source = pgvector_filter.get("source")
+    if isinstance(source, dict):
+        args.append(list(source.get("$in", [])))
+        conditions.append(f"e.cmetadata->>'source' = ANY(${len(args)}::text[])")
+    elif source is not None:
+        args.append(source)
+        conditions.append(f"e.cmetadata->>'source' = ${len(args)}")
+    return conditions
+
+
+async def search(
+    embedding, pgvector_kwargs: dict, storage: str = None, candidates: int = None, exact: bool = False, iterative: bool = True
+) -> list[tuple[Document, float]]:
+    """
+    Similarity search through the compact ANN index, re-ranked on the float32 vectors.
+
+    The index for `storage` (VECTOR_STORAGE by default) returns `candidates`
+    rows (VECTOR_RERANK_CANDIDATES by default), and their exact cosine
+    distances to the query pick the top k. Filtered scans run iteratively
+    when pgvector supports it, unless `iterative` is off. With `exact`, the
+    ANN index is skipped and the filtered rows are ranked exactly (see
+    use_exact_scan). Returns (Document, cosine distance) pairs, like PGVector's
+    similarity search.
+    """
+    storage = "full" if exact else storage or Config.VECTOR_STORAGE
+    k = pgvector_kwargs["k"]
+    if exact:
+        candidates = k
+    else:
+        candidates = max(k, candidates) if candidates else rerank_candidates(k)
+    args = [to_vector_literal(embedding), Config.VECTOR_COLLECTION]
+    conditions = ["c.name = $2", *_filter_conditions(pgvector_kwargs.get("filter") or {}, args)]
+    args += [candidates, k]
+    sql = f"""
+        WITH candidates AS (
+            SELECT e.id, e.document, e.cmetadata, e.embedding
+            FROM langchain_pg_embedding e
+            JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+            WHERE {" AND ".join(conditions)}
+            ORDER BY {candidate_order(storage)}
+            LIMIT ${len(args) - 1}
+        )
+        SELECT id, document, cmetadata::text AS cmetadata, embedding <=> $1::vector AS distance
+        FROM candidates
+        ORDER BY distance
+        LIMIT ${len(args)}
+    """
+
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            if exact:
+                # Bitmap scans of the (user_id, source) index stay enabled; the ANN index cannot serve them
+                await conn.execute("SET LOCAL enable_indexscan = off")
+            else:
+                if Config.VECTOR_INDEX_TYPE == "hnsw":
+                    # HNSW returns at most ef_search rows, so it must be at least the candidate count
+                    await conn.execute(f"SET LOCAL hnsw.ef_search = {max(int(current_ef_search()), candidates)}")
+                if iterative and iterative_scan_sql():
+                    await conn.execute(iterative_scan_sql())
+            rows = await conn.fetch(sql, *args)
+
+    return [
+        (Document(id=str(row["id"]), page_content=row["document"], metadata=json.loads(row["cmetadata"])), row["distance"])
+        for row in rows
+    ]
+
+
+def main():
+    """
+    Builds the ANN index for a storage mode over the existing embeddings.
+
+    Run from PythonServer/ before switching VECTOR_STORAGE, then again with
+    --drop-unused once the app runs with the new mode:
+        python -m app.services.vector_storage --storage halfvec
+        python -m app.services.vector_storage --storage halfvec --drop-unused
+    Compare recall and latency first with python -m benchmarks.bench_vector_storage.
+    """
+    parser = argparse.ArgumentParser(description=inspect.cleandoc(main.__doc__), formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--storage", choices=STORAGE_MODES, required=True)
+    parser.add_argument("--drop-unused", action="store_true", help="Drop the ANN indexes of the other storage modes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    print(json.dumps(asyncio.run(migrate_vector_storage(args.storage, drop_unused=args.drop_unused)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
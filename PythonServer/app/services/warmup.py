@@ -0,0 +1,125 @@
+import asyncio
+import importlib
+import logging
+import time
+from app.config import Config
+from app.graph.graph_maker import get_graph
+import app.services.db_service as db
+import app.services.ingestion_jobs as ingestion_jobs
+from app.services.chunker import get_chunker
+from app.services.embedding_service import get_embeddings
+from app.services.extraction_engine import warm_extraction_pool
+from app.services.llm_service import get_llm
+from app.services.pgvector_service import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+# Modules whose imports are deferred out of app startup; warmup loads them off the event loop
+HEAVY_MODULES = ("sqlalchemy.ext.asyncio", "langchain_postgres", "boto3", "langchain_aws", "pymupdf")
+
+_components = {}
+_task = None
+_started = None
+_finished = None
+_import_seconds = None
+
+
+def record_import_time(seconds: float):
+    global _import_seconds
+    _import_seconds = seconds
+    logger.info(f"[WARMUP] App modules imported in {seconds:.2f}s")
+
+
+async def _component(name: str, warm):
+    """Runs one warmup step, retrying every WARMUP_RETRY_SECONDS until it succeeds. Each attempt is timed for /ready."""
+    state = _components[name] = {"status": "pending", "seconds": None, "attempts": 0, "error": None}
+    while True:
+        state["attempts"] += 1
+        start = time.perf_counter()
+        try:
+            await warm()
+        except Exception as e:
+            # SECURITY: Log full error details server-side, report only the error type
+            state.update(status="failed", seconds=round(time.perf_counter() - start, 3), error=type(e).__name__)
+            logger.error(f"[WARMUP] {name} failed (attempt {state['attempts']}): {str(e)}")
+            await asyncio.sleep(Config.WARMUP_RETRY_SECONDS)
+            continue
+        state.update(status="ready", seconds=round(time.perf_counter() - start, 3), error=None)
+        logger.info(f"[WARMUP] {name} ready in {state['seconds']:.2f}s")
+        return
+
+
+async def _import_heavy_modules():
+    for name in HEAVY_MODULES:
+        await asyncio.to_thread(importlib.import_module, name)
+
+
+def _create_bedrock_clients():
+    get_llm()
+    get_embeddings()
+
+
+async def warm_up():
+    """
+    Initializes everything the first request would otherwise pay for, in parallel.
+
+    Storage: pools, then the pgvector tables and collection, checkpointer
+    setup and graph compilation, and the ingestion workers. Bedrock: the boto
+    client, LLM and embeddings. Extraction: the tokenizer (downloaded on first
+    use), then every extraction pool worker.
+    """
+    global _started, _finished
+    _started = time.perf_counter()
+    for name in ("imports", "database", "vector_store", "graph", "ingestion_workers", "bedrock", "tokenizer", "extraction_pool"):
+        _components[name] = {"status": "pending", "seconds": None, "attempts": 0, "error": None}
+
+    imports = asyncio.create_task(_component("imports", _import_heavy_modules))
+
+    async def storage():
+        await imports  # SQLAlchemy and langchain_postgres are imported off the event loop first
+        await _component("database", db.open_pools)
+        await asyncio.gather(
+            _component("vector_store", get_vector_store),
+            _component("graph", get_graph),
+            _component("ingestion_workers", ingestion_jobs.start_workers),
+        )
+
+    async def bedrock():
+        await _component("bedrock", lambda: asyncio.to_thread(_create_bedrock_clients))
+
+    async def extraction():
+        await _component("tokenizer", lambda: asyncio.to_thread(get_chunker))
+        await _component("extraction_pool", warm_extraction_pool)
+
+    await asyncio.gather(imports, storage(), bedrock(), extraction())
+    _finished = time.perf_counter()
+    logger.info(f"[WARMUP] Ready in {_finished - _started:.2f}s: {get_report()['components']}")
+
+
+def start_warmup():
+    """Starts the warmup in the background so the server accepts probes while it runs."""
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(warm_up())
+
+
+async def stop_warmup():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+
+
+def is_ready() -> bool:
+    return _finished is not None
+
+
+def get_report() -> dict:
+    """Per-component readiness and timings for /ready."""
+    return {
+        "ready": is_ready(),
+        "import_seconds": round(_import_seconds, 3) if _import_seconds is not None else None,
+        "warmup_seconds": round(_finished - _started, 3) if _finished is not None else None,
+        "components": {name: dict(state) for name, state in _components.items()},
+    }
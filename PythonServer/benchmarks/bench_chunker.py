@@ -0,0 +1,80 @@
+"""
+Compares TokenChunker with RecursiveCharacterTextSplitter.from_tiktoken_encoder on the same pages.
+
+Both splitters run through iter_text_chunks, as extraction does, on generated
+pages or on the pages of a PDF.
+
+Run from PythonServer/:
+    python -m benchmarks.bench_chunker --pages 200
+    python -m benchmarks.bench_chunker --pdf path/to/document.pdf
+"""
+import argparse
+import random
+import time
+import pymupdf
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app.config import Config
+from app.services.chunker import TokenChunker, get_encoding
+from app.services.extraction_engine import iter_pdf_pages, iter_text_chunks
+from benchmarks.fakes import WORDS
+
+
+def make_pages(count: int, seed: int) -> list[str]:
+    """Generates pages of paragraphs made of sentences, roughly 500 words each."""
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(count):
+        paragraphs = []
+        for _ in range(rng.randint(4, 8)):
+            sentences = []
+            for _ in range(rng.randint(2, 6)):
+                words = [rng.choice(WORDS) for _ in range(rng.randint(6, 24))]
+                sentences.append(" ".join(words).capitalize() + rng.choice(".!?"))
+            paragraphs.append(" ".join(sentences))
+        pages.append("\n\n".join(paragraphs))
+    return pages
+
+
+def run(name: str, splitter, pages: list[str], repeat: int) -> float:
+    encoding = get_encoding()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = list(iter_text_chunks(pages, splitter))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    sizes = [len(encoding.encode_ordinary(chunk)) for chunk in chunks]
+    print(
+        f"{name:<10} {len(chunks) / best:>10.1f} {sum(map(len, pages)) / best / 1e6:>8.2f} {len(chunks):>7} "
+        f"{sum(sizes) / len(sizes):>9.1f} {max(sizes):>7}"
+    )
+    return len(chunks) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="Generated pages, when --pdf is not given")
+    parser.add_argument("--pdf", help="Split the pages of this PDF instead")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of this many runs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.pdf:
+        with pymupdf.open(args.pdf) as doc:
+            pages = list(iter_pdf_pages(doc))
+    else:
+        pages = make_pages(args.pages, args.seed)
+
+    recursive = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        chunk_size=Config.CHUNK_SIZE, chunk_overlap=Config.CHUNK_OVERLAP
+    )
+    print(f"{len(pages)} pages, chunk_size={Config.CHUNK_SIZE}, chunk_overlap={Config.CHUNK_OVERLAP}")
+    print(f"{'splitter':<10} {'chunks/s':>10} {'MB/s':>8} {'chunks':>7} {'avg tok':>9} {'max tok':>7}")
+    baseline = run("recursive", recursive, pages, args.repeat)
+    current = run("token", TokenChunker(), pages, args.repeat)
+    print(f"speedup: {current / baseline:.1f}x chunks/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Measures EmbeddingWriter throughput against FakeEmbeddings at increasing concurrency.
+
+Run from PythonServer/:
+    python -m benchmarks.bench_embedding_writer --chunks 2000 --latency 0.05
+"""
+import argparse
+import asyncio
+import time
+from langchain_core.documents import Document
+from app.services.embedding_writer import EmbeddingWriter
+from benchmarks.fakes import FakeEmbeddings, FakeVectorStore
+
+
+async def run_once(chunks: int, concurrency: int, batch_size: int, latency: float, throttle_at: int):
+    embeddings = FakeEmbeddings(dimensions=256, latency=latency, max_concurrent_calls=throttle_at)
+    store = FakeVectorStore(embeddings)
+    writer = EmbeddingWriter(store, batch_size=batch_size, max_concurrency=concurrency, backoff_seconds=latency)
+    documents = (Document(page_content=f"chunk {i}", metadata={"source": "bench"}) for i in range(chunks))
+
+    start = time.perf_counter()
+    written = await writer.write(documents)
+    elapsed = time.perf_counter() - start
+    return written, elapsed, writer.throttled, writer.batch_size
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--throttle-at", type=int, default=None,
+                        help="Fake Bedrock throttles when more calls than this are in flight")
+    args = parser.parse_args()
+
+    print(f"{'concurrency':>11} {'chunks/s':>10} {'seconds':>8} {'throttled':>9} {'batch':>6}")
+    for concurrency in args.concurrency:
+        written, elapsed, throttled, batch = await run_once(
+            args.chunks, concurrency, args.batch_size, args.latency, args.throttle_at
+        )
+        print(f"{concurrency:>11} {written / elapsed:>10.1f} {elapsed:>8.2f} {throttled:>9} {batch:>6}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
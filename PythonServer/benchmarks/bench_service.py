@@ -0,0 +1,341 @@
+"""
+End-to-end service benchmark against a local pgvector Postgres, with fake Bedrock models.
+
+Starts the app in-process with deterministic FakeSemanticEmbeddings and
+FakeChatModel, uploads generated PDFs of each size through /upload-pdf/ and
+waits for their ingestion jobs, then streams questions from /ask-stream/ at
+each concurrency level. Reports ingestion pages/s and chunks/s, TTFT and
+latency percentiles, request throughput and memory, and compares them with a
+stored baseline. Exits with status 1 when a metric regressed past --tolerance.
+
+The embedding and answer caches are off unless EMBEDDING_CACHE_ENABLED or
+ANSWER_CACHE_ENABLED is set, so repeated runs measure the uncached paths.
+
+Run from PythonServer/ with RDS_* pointing at a local pgvector (docker compose up postgres):
+    python -m benchmarks.bench_service --save-baseline
+    python -m benchmarks.bench_service --pages 5 50 200 --concurrency 1 4 16
+"""
+import os
+
+os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+os.environ.setdefault("ANSWER_CACHE_ENABLED", "false")
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import resource
+import sys
+import time
+import uuid
+import pymupdf
+import httpx
+import numpy as np
+import uvicorn
+from app.config import Config
+from benchmarks.fakes import WORDS, FakeChatModel, FakeSemanticEmbeddings, install_fakes
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+WORDS_PER_PARAGRAPH = 60
+PARAGRAPHS_PER_PAGE = 6
+
+
+def make_pdf(pages: int, seed: int) -> tuple[bytes, list[str]]:
+    """Builds a text PDF with `pages` pages and returns it with questions drawn from its paragraphs."""
+    rng = random.Random(seed)
+    questions = []
+    document = pymupdf.open()
+    for _ in range(pages):
+        paragraphs = [" ".join(rng.choice(WORDS) for _ in range(WORDS_PER_PARAGRAPH)) for _ in range(PARAGRAPHS_PER_PAGE)]
+        page = document.new_page()
+        page.insert_textbox(page.rect + (36, 36, -36, -36), "\n\n".join(paragraphs), fontsize=8)
+        words = rng.choice(paragraphs).split()
+        start = rng.randrange(len(words) - 10)
+        questions.append("What does the document say about " + " ".join(words[start:start + 10]) + "?")
+    data = document.tobytes()
+    document.close()
+    return data, questions
+
+
+def percentile(values: list[float], q: float):
+    return float(np.percentile(values, q)) if values else None
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    return resource.getrusage(who).ru_maxrss / 1024  # ru_maxrss is in KiB on Linux
+
+
+async def start_server(app) -> tuple[uvicorn.Server, asyncio.Task, str]:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="on"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+            raise RuntimeError("Server stopped during startup")
+        await asyncio.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 120):
+    """Waits for /ready so startup warmup is not counted against the first requests."""
+    deadline = time.perf_counter() + timeout
+    while True:
+        response = await client.get("/ready")
+        if response.status_code == 200:
+            return response.json()
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"App not ready after {timeout:.0f}s: {response.json()['components']}")
+        await asyncio.sleep(0.2)
+
+
+async def ingest(client: httpx.AsyncClient, user_id: str, source: str, pdf: bytes) -> dict:
+    """Uploads one PDF and polls its job until it finishes."""
+    start = time.perf_counter()
+    while True:
+        response = await client.post(
+            "/upload-pdf/",
+            files={"file": (f"{source}.pdf", pdf, "application/pdf")},
+            data={"user_id": user_id, "source": source},
+        )
+        if response.status_code != 429:
+            break
+        await asyncio.sleep(1)
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+
+    while True:
+        await asyncio.sleep(0.2)
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in ("succeeded", "failed"):
+            break
+    if job["status"] != "succeeded":
+        raise RuntimeError(f"Ingestion of {source} failed: {job['error']}")
+    return {"seconds": time.perf_counter() - start, "pages": job["pages_total"], "chunks": job["chunks_embedded"]}
+
+
+async def bench_ingestion(client: httpx.AsyncClient, user_id: str, sizes: list[int], uploads: int, seed: int):
+    """Uploads `uploads` PDFs of each size concurrently. Returns metrics and {source: questions}."""
+    metrics = {}
+    questions = {}
+    total_pages = total_chunks = total_seconds = 0
+    for pages in sizes:
+        pdfs = {f"bench-{pages}p-{i}": make_pdf(pages, seed * 1000 + pages * 10 + i) for i in range(uploads)}
+        start = time.perf_counter()
+        jobs = await asyncio.gather(*(ingest(client, user_id, source, pdf) for source, (pdf, _) in pdfs.items()))
+        elapsed = time.perf_counter() - start
+
+        size_pages = sum(job["pages"] for job in jobs)
+        size_chunks = sum(job["chunks"] for job in jobs)
+        metrics[f"ingest.{pages}p.pages_per_second"] = size_pages / elapsed
+        metrics[f"ingest.{pages}p.chunks_per_second"] = size_chunks / elapsed
+        metrics[f"ingest.{pages}p.job_p50_ms"] = percentile([job["seconds"] for job in jobs], 50) * 1000
+        total_pages += size_pages
+        total_chunks += size_chunks
+        total_seconds += elapsed
+        questions.update({source: doc_questions for source, (_, doc_questions) in pdfs.items()})
+        print(f"ingest {pages:>5} pages x{uploads}: {size_pages / elapsed:8.1f} pages/s {size_chunks / elapsed:8.1f} chunks/s")
+
+    metrics["ingest.pages_per_second"] = total_pages / total_seconds
+    metrics["ingest.chunks_per_second"] = total_chunks / total_seconds
+    return metrics, questions
+
+
+async def ask(client: httpx.AsyncClient, user_id: str, source: str, question: str) -> dict:
+    """Streams one answer and returns its TTFT, total latency and token frame count."""
+    body = {"query": question, "thread_id": f"bench-{uuid.uuid4().hex}", "user_id": user_id, "document_names": [source]}
+    start = time.perf_counter()
+    ttft = None
+    frames = 0
+    error = None
+    async with client.stream("POST", "/ask-stream/", json=body) as response:
+        if response.status_code != 200:
+            error = f"HTTP {response.status_code}"
+        else:
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                if "token" in event:
+                    frames += 1
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                elif "error" in event:
+                    error = event["error"]
+    return {"ttft": ttft, "latency": time.perf_counter() - start, "frames": frames, "error": error,
+            "thread_id": body["thread_id"]}
+
+
+async def bench_ask(client: httpx.AsyncClient, user_id: str, questions: dict, levels: list[int], requests: int):
+    metrics = {}
+    thread_ids = []
+    pairs = [(source, question) for source, doc_questions in questions.items() for question in doc_questions]
+    random.Random(0).shuffle(pairs)
+    for concurrency in levels:
+        count = max(requests, concurrency * 2)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            async with semaphore:
+                return await ask(client, user_id, *pairs[i % len(pairs)])
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(count)))
+        elapsed = time.perf_counter() - start
+        thread_ids.extend(result["thread_id"] for result in results)
+
+        ok = [result for result in results if result["error"] is None and result["ttft"] is not None]
+        prefix = f"ask.c{concurrency}"
+        for q in (50, 95, 99):
+            metrics[f"{prefix}.ttft_p{q}_ms"] = percentile([r["ttft"] * 1000 for r in ok], q)
+            metrics[f"{prefix}.latency_p{q}_ms"] = percentile([r["latency"] * 1000 for r in ok], q)
+        metrics[f"{prefix}.requests_per_second"] = len(ok) / elapsed
+        metrics[f"{prefix}.errors"] = count - len(ok)
+        print(
+            f"ask concurrency {concurrency:>3}: {len(ok) / elapsed:6.2f} req/s "
+            f"ttft p50/p95/p99 {metrics[f'{prefix}.ttft_p50_ms'] or 0:.0f}/{metrics[f'{prefix}.ttft_p95_ms'] or 0:.0f}/"
+            f"{metrics[f'{prefix}.ttft_p99_ms'] or 0:.0f} ms "
+            f"latency p50/p95/p99 {metrics[f'{prefix}.latency_p50_ms'] or 0:.0f}/{metrics[f'{prefix}.latency_p95_ms'] or 0:.0f}/"
+            f"{metrics[f'{prefix}.latency_p99_ms'] or 0:.0f} ms errors {count - len(ok)}"
+        )
+    return metrics, thread_ids
+
+
+async def cleanup(client: httpx.AsyncClient, user_id: str, sources: list[str], thread_ids: list[str]):
+    for source in sources:
+        await client.delete("/delete-doc/", params={"user_id": user_id, "doc_name": source})
+    for i in range(0, len(thread_ids), Config.MAX_BULK_DELETE_THREADS):
+        await client.post("/delete-states/", json={"thread_ids": thread_ids[i:i + Config.MAX_BULK_DELETE_THREADS]})
+
+
+def higher_is_better(name: str) -> bool:
+    return name.endswith("_per_second")
+
+
+def compare(metrics: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Prints current vs baseline metrics and returns the names that regressed by more than `tolerance`."""
+    regressions = []
+    print(f"\n{'metric':<34} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, current in metrics.items():
+        previous = baseline.get(name)
+        if previous is None or current is None:
+            print(f"{name:<34} {'-' if previous is None else f'{previous:.1f}':>12} {'-' if current is None else f'{current:.1f}':>12}")
+            continue
+        if previous:
+            change = (current - previous) / previous
+            regressed = -change > tolerance if higher_is_better(name) else change > tolerance
+        else:
+            change = 0.0 if current == previous else float("inf")
+            regressed = current > previous and not higher_is_better(name)
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<34} {previous:>12.1f} {current:>12.1f} {change:>+7.1%}{'  REGRESSED' if regressed else ''}")
+    return regressions
+
+
+async def run(args) -> dict:
+    if args.speculative:
+        Config.SPECULATIVE_GENERATION = True
+    install_fakes(
+        FakeSemanticEmbeddings(
+            dimensions=Config.EMBEDDING_DIMENSIONS,
+            latency=args.embed_latency_ms / 1000,
+            per_text_latency=args.embed_per_text_ms / 1000,
+        ),
+        FakeChatModel(
+            latency=args.llm_latency_ms / 1000,
+            first_token_latency=args.llm_first_token_ms / 1000,
+            tokens_per_second=args.llm_tokens_per_second,
+            answer_tokens=args.answer_tokens,
+        ),
+    )
+    from app.main import app
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    user_id = f"bench-{uuid.uuid4().hex[:12]}"
+    server, task, url = await start_server(app)
+    rss_start = rss_mb()
+    try:
+        async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+            readiness = await wait_ready(client)
+            print(f"ready after {readiness['warmup_seconds']:.2f}s warmup ({readiness['import_seconds']:.2f}s imports)")
+            ingest_metrics, questions = await bench_ingestion(client, user_id, args.pages, args.uploads, args.seed)
+            rss_ingested = rss_mb()
+            ask_metrics, thread_ids = await bench_ask(client, user_id, questions, args.concurrency, args.requests)
+            if not args.keep_data:
+                await cleanup(client, user_id, list(questions), thread_ids)
+    finally:
+        server.should_exit = True
+        await task
+
+    return {
+        **ingest_metrics,
+        **ask_metrics,
+        "memory.rss_start_mb": rss_start,
+        "memory.rss_after_ingest_mb": rss_ingested,
+        "memory.rss_end_mb": rss_mb(),
+        "memory.peak_rss_mb": peak_rss_mb(),
+        "memory.extraction_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 50, 200], help="PDF sizes to ingest")
+    parser.add_argument("--uploads", type=int, default=2, help="Concurrent uploads per PDF size")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=20, help="Questions per concurrency level (at least 2x the level)")
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--embed-per-text-ms", type=float, default=2)
+    parser.add_argument("--llm-latency-ms", type=float, default=400, help="Tool-call and grader latency")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=60)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--speculative", action="store_true", help="Generate while the LLM grader runs (SPECULATIVE_GENERATION)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression per metric")
+    parser.add_argument("--output", help="Also write this run's results to a JSON file")
+    parser.add_argument("--keep-data", action="store_true", help="Leave the benchmark documents and threads in Postgres")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    settings = {
+        name: value for name, value in vars(args).items()
+        if name not in ("baseline", "save_baseline", "tolerance", "output", "keep_data", "log_level")
+    }
+    settings["speculative"] = args.speculative or Config.SPECULATIVE_GENERATION
+    metrics = asyncio.run(run(args))
+    results = {"settings": settings, "metrics": metrics}
+
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as out:
+            json.dump(results, out, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; record one with --save-baseline")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("settings") != settings:
+        print("\nWARNING: baseline was recorded with different settings; the comparison is not like for like")
+    regressions = compare(metrics, baseline.get("metrics", {}), args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} metrics regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
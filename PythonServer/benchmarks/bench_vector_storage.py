@@ -0,0 +1,173 @@
+"""
+Compares recall and latency of the full, halfvec and binary vector storage modes on a live collection.
+
+Queries are stored embeddings with Gaussian noise added, searched with their
+own chunk's user_id and source filter, as the app does. Recall@k is measured
+against an exact search with index scans disabled. Each mode runs through
+vector_storage.search; full uses k candidates, as the app's PGVector search
+does, and the compact modes re-rank --candidates. Modes whose index has not
+been built run as sequential scans and are marked as such.
+
+Filtered recall is reported twice: with the app's filtered-search strategy
+(iterative index scans on pgvector 0.8+, exact scans for selective filters
+before that), and with a plain post-filtered index scan. "short" is the share
+of queries that got fewer than k rows although k matched the filter.
+
+Needs the database from .env. Run from PythonServer/:
+    python -m benchmarks.bench_vector_storage --queries 200 --k 10
+    python -m benchmarks.bench_vector_storage --build --output vector_storage_report.json
+"""
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+from app.config import Config
+import app.services.db_service as db
+from app.services.vector_indexes import (
+    STORAGE_MODES, _vector_index_ddl, detect_iterative_scan, index_sizes, migrate_vector_storage, use_exact_scan
+)
+from app.services.vector_storage import search, to_vector_literal
+from benchmarks.bench_service import percentile
+
+
+async def sample_queries(count: int, noise: float, seed: int) -> list[dict]:
+    """Stored embeddings with noise of relative size `noise`, each with its chunk's filter."""
+    async with db.acquire() as conn:
+        await conn.execute("SELECT setseed($1)", (seed % 1000) / 1000)
+        rows = await conn.fetch(
+            """
+            SELECT e.embedding::real[] AS embedding, e.cmetadata->>'user_id' AS user_id, e.cmetadata->>'source' AS source
+            FROM langchain_pg_embedding e
+            JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+            WHERE c.name = $1
+            ORDER BY random()
+            LIMIT $2
+            """,
+            Config.VECTOR_COLLECTION, count
+        )
+    rng = np.random.default_rng(seed)
+    queries = []
+    for row in rows:
+        vector = np.asarray(row["embedding"], dtype=np.float32)
+        vector = vector + rng.normal(size=vector.shape).astype(np.float32) * noise * np.linalg.norm(vector) / np.sqrt(vector.size)
+        queries.append({
+            "embedding": vector.tolist(),
+            "filter": {"user_id": row["user_id"], "source": {"$in": [row["source"]]}},
+        })
+    return queries
+
+
+async def exact_ids(query: dict, k: int) -> list[str]:
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("SET LOCAL enable_indexscan = off")
+            rows = await conn.fetch(
+                """
+                SELECT e.id
+                FROM langchain_pg_embedding e
+                JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+                WHERE c.name = $2
+                  AND e.cmetadata->>'user_id' = $3
+                  AND e.cmetadata->>'source' = ANY($4::text[])
+                ORDER BY e.embedding <=> $1::vector
+                LIMIT $5
+                """,
+                to_vector_literal(query["embedding"]), Config.VECTOR_COLLECTION,
+                query["filter"]["user_id"], query["filter"]["source"]["$in"], k
+            )
+    return [str(row["id"]) for row in rows]
+
+
+async def run_mode(storage: str, queries: list[dict], truth: list[list[str]], k: int, candidates: int, post_filter: bool = False) -> dict:
+    """Runs every query through one storage mode; `post_filter` turns off iterative and exact scans."""
+    latencies = []
+    recalls = []
+    short = 0
+    for query, expected in zip(queries, truth):
+        exact = False if post_filter else await use_exact_scan(query["filter"])
+        start = time.perf_counter()
+        results = await search(
+            query["embedding"], {"k": k, "filter": query["filter"]},
+            storage=storage, candidates=candidates, exact=exact, iterative=not post_filter
+        )
+        latencies.append(time.perf_counter() - start)
+        if expected:
+            found = {doc.id for doc, _ in results}
+            recalls.append(len(found.intersection(expected)) / len(expected))
+            short += len(results) < len(expected)
+    return {
+        "recall": float(np.mean(recalls)) if recalls else None,
+        "short": short / len(recalls) if recalls else None,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "mean_ms": float(np.mean(latencies)) * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=Config.VECTOR_RERANK_CANDIDATES,
+                        help="Index candidates re-ranked by the compact modes")
+    parser.add_argument("--noise", type=float, default=0.3, help="Query noise relative to the vector norm")
+    parser.add_argument("--storage", nargs="+", choices=STORAGE_MODES, default=list(STORAGE_MODES))
+    parser.add_argument("--build", action="store_true", help="Build missing indexes first (nothing is dropped)")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed queries per mode, to load the index")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    try:
+        if args.build:
+            for storage in args.storage:
+                await migrate_vector_storage(storage)
+
+        queries = await sample_queries(args.queries, args.noise, args.seed)
+        if not queries:
+            raise SystemExit(f"Collection {Config.VECTOR_COLLECTION!r} has no embeddings")
+        truth = [await exact_ids(query, args.k) for query in queries]
+        async with db.acquire() as conn:
+            sizes = await index_sizes(conn)
+
+        iterative_scan = await detect_iterative_scan()
+
+        report = {
+            "collection": Config.VECTOR_COLLECTION,
+            "iterative_scan": iterative_scan,
+            "queries": len(queries),
+            "k": args.k,
+            "candidates": args.candidates,
+            "noise": args.noise,
+            "table_bytes": sizes["table"],
+            "modes": {},
+        }
+        strategy = "iterative index scans" if iterative_scan else f"exact scans up to {Config.VECTOR_EXACT_SCAN_MAX_CHUNKS} chunks"
+        print(f"{len(queries)} queries, k={args.k}, candidates={args.candidates}, table {sizes['table'] / 2**20:.1f} MB, filtered search: {strategy}")
+        print(f"{'storage':<8} {'index MB':>9} {'search':<12} {'recall@k':>9} {'short':>6} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+        for storage in args.storage:
+            candidates = args.k if storage == "full" else args.candidates
+            await run_mode(storage, queries[:args.warmup], [[]] * min(args.warmup, len(queries)), args.k, candidates)
+            result = await run_mode(storage, queries, truth, args.k, candidates)
+            result["post_filter"] = await run_mode(storage, queries, truth, args.k, candidates, post_filter=True)
+            name, _ = _vector_index_ddl(storage)
+            result["index"] = name if name in sizes["indexes"] else None
+            result["index_bytes"] = sizes["indexes"].get(name)
+            report["modes"][storage] = result
+            index_mb = f"{result['index_bytes'] / 2**20:>9.1f}" if result["index_bytes"] is not None else f"{'seq scan':>9}"
+            for label, row in (("app", result), ("post-filter", result["post_filter"])):
+                print(
+                    f"{storage:<8} {index_mb} {label:<12} {row['recall']:>9.3f} {row['short']:>6.1%} "
+                    f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['mean_ms']:>8.2f}"
+                )
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        await db.close_pools()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# Vocabulary for generated answers and benchmark documents
+WORDS = (
+    "latency throughput vector index query answer document chunk embedding cache "
+    "retrieval graph stream token page batch worker queue thread checkpoint model "
+    "prompt context score grade rewrite generate search filter source user buffer "
+    "memory pool connection request response server client network storage table "
+    "column record schema update delete insert select commit rollback replica shard"
+).split()
+
+
+class FakeThrottlingException(Exception):
+    """Mimics the error langchain_aws raises when Bedrock throttles a request."""
+
+    def __init__(self):
+        super().__init__("Error raised by inference endpoint: ThrottlingException")
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic stand-in for BedrockEmbeddings.
+
+    Vectors are derived from a hash of the text, so the same text always gets
+    the same vector. Each call sleeps `latency + per_text_latency * len(texts)`
+    and, if `max_concurrent_calls` is set, raises a throttling error whenever
+    more calls than that are in flight.
+    """
+
+    def __init__(self, dimensions: int = 1536, latency: float = 0.05, per_text_latency: float = 0.002,
+                 max_concurrent_calls: int = None, seed: int = 0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.max_concurrent_calls = max_concurrent_calls
+        self.calls = 0
+        self.texts_embedded = 0
+        self.throttled = 0
+        self._in_flight = 0
+        self._seed = seed
+
+    def _vector(self, text: str) -> list[float]:
+        digest = hashlib.sha256(f"{self._seed}:{text}".encode("utf-8")).digest()
+        rng = random.Random(digest)
+        return [rng.uniform(-1.0, 1.0) for _ in range(self.dimensions)]
+
+    def _delay(self, count: int) -> float:
+        return self.latency + self.per_text_latency * count
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        time.sleep(self._delay(len(texts)))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        if self.max_concurrent_calls is not None and self._in_flight >= self.max_concurrent_calls:
+            self.throttled += 1
+            await asyncio.sleep(self.latency / 10)
+            raise FakeThrottlingException()
+
+        self._in_flight += 1
+        try:
+            await asyncio.sleep(self._delay(len(texts)))
+        finally:
+            self._in_flight -= 1
+        self.texts_embedded += len(texts)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeSemanticEmbeddings(FakeEmbeddings):
+    """
+    FakeEmbeddings whose vectors are hashed bags of words.
+
+    Texts that share words get similar vectors, so a question built from a
+    chunk's words retrieves that chunk with a realistic similarity score.
+    """
+
+    def _vector(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in re.findall(r"\w+", text.casefold()):
+            digest = hashlib.blake2b(f"{self._seed}:{word}".encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dimensions] += 1.0 if value >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+
+def _last_human_text(messages) -> str:
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message.content if isinstance(message.content, str) else str(message.content)
+    return ""
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for ChatBedrock.
+
+    Plain calls answer with `answer_tokens` words picked from a hash of the
+    prompt: the first token arrives after `first_token_latency` seconds and the
+    rest at `tokens_per_second`. With tools bound (the agent node) it calls the
+    first tool with the last human message after `latency` seconds, and
+    with_structured_output (the grader) fills every field with `structured_value`.
+    """
+
+    latency: float = 0.4
+    first_token_latency: float = 0.3
+    tokens_per_second: float = 60.0
+    answer_tokens: int = 120
+    structured_value: str = "yes"
+    seed: int = 0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-bedrock"
+
+    def _tokens(self, messages) -> list[str]:
+        prompt = "\n".join(str(message.content) for message in messages)
+        rng = random.Random(hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).digest())
+        words = [rng.choice(WORDS) for _ in range(max(1, self.answer_tokens))]
+        return [words[0]] + [" " + word for word in words[1:]]
+
+    def _tool_call(self, messages, tools: list[dict]) -> dict:
+        function = tools[0]["function"]
+        properties = function.get("parameters", {}).get("properties") or {"query": {}}
+        prompt = "\n".join(str(message.content) for message in messages)
+        return {
+            "name": function["name"],
+            "args": {next(iter(properties)): _last_human_text(messages)},
+            "id": "call_" + hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12],
+        }
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def with_structured_output(self, schema, **kwargs):
+        async def respond(_):
+            self.calls += 1
+            await asyncio.sleep(self.latency)
+            return schema(**{name: self.structured_value for name in schema.model_fields})
+        return RunnableLambda(respond)
+
+    def _generate(self, messages, stop=None, run_manager=None, tools=None, **kwargs):
+        self.calls += 1
+        if tools:
+            time.sleep(self.latency)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="", tool_calls=[self._tool_call(messages, tools)]))])
+        tokens = self._tokens(messages)
+        time.sleep(self.first_token_latency + (len(tokens) - 1) / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tools=None, **kwargs):
+        self.calls += 1
+        if tools:
+            await asyncio.sleep(self.latency)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="", tool_calls=[self._tool_call(messages, tools)]))])
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.first_token_latency + (len(tokens) - 1) / self.tokens_per_second)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, tools=None, **kwargs):
+        self.calls += 1
+        if tools:
+            await asyncio.sleep(self.latency)
+            call = self._tool_call(messages, tools)
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[{"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0}],
+            ))
+            return
+
+        await asyncio.sleep(self.first_token_latency)
+        for i, token in enumerate(self._tokens(messages)):
+            if i:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeVectorStore:
+    """In-memory sink with the parts of the PGVector interface used by the writer."""
+
+    def __init__(self, embeddings: Embeddings, insert_latency: float = 0.005):
+        self.embeddings = embeddings
+        self.insert_latency = insert_latency
+        self.rows = []
+
+    async def aadd_embeddings(self, texts, embeddings, metadatas=None, ids=None, **kwargs):
+        await asyncio.sleep(self.insert_latency)
+        metadatas = metadatas or [{} for _ in texts]
+        self.rows.extend(zip(texts, embeddings, metadatas))
+        return ids or []
+
+
+def install_fakes(embeddings: Embeddings, llm: BaseChatModel):
+    """
+    Makes the app use the given fakes instead of Bedrock.
+
+    Must run before the first request, since the app builds its clients once.
+    The embeddings are wrapped in CachedEmbeddings when the cache is enabled,
+    as embedding_service does for BedrockEmbeddings.
+    """
+    from app.config import Config
+    import app.services.embedding_service as embedding_service
+    import app.services.llm_service as llm_service
+    from app.services.embedding_cache import CachedEmbeddings
+
+    if Config.EMBEDDING_CACHE_ENABLED:
+        embeddings = CachedEmbeddings(embeddings, model_id=embedding_service.EMBEDDING_MODEL_ID)
+    embedding_service._embeddings = embeddings
+    llm_service._llm = llm
+    llm_service._llm_with_tools.clear()
+    llm_service._grader_chain = None
+    llm_service._generation_chain = None
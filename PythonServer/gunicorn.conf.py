@@ -0,0 +1,60 @@
+"""
+Production serving configuration: gunicorn running N Uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Each worker is a separate process with its own event loop, pools, caches and
+metrics; module-level singletons are created lazily inside each worker. The
+app is preloaded in the master, along with the tokenizer and the heavy
+libraries, so forked workers share those pages instead of loading them N times.
+"""
+import glob
+import importlib
+import os
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+workers = int(os.getenv("WEB_WORKERS") or os.cpu_count() or 1)
+# Config reads this to size per-worker pools, caches and extraction processes
+os.environ["WEB_WORKERS"] = str(workers)
+if workers > 1 and not os.getenv("METRICS_MULTIPROC_DIR"):
+    # Each worker writes its metrics here so /metrics can report all of them
+    os.environ["METRICS_MULTIPROC_DIR"] = os.path.join(tempfile.gettempdir(), "rag_metrics")
+
+from app.config import Config  # noqa: E402
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+# For UvicornWorker this is not a per-request limit: it is how long a worker's
+# heartbeat may go silent (event loop blocked, e.g. during startup warm-up)
+# before the arbiter kills and restarts it. Long SSE answers are unaffected.
+timeout = 120
+graceful_timeout = Config.SHUTDOWN_DRAIN_SECONDS + 5
+keepalive = 5
+
+
+def on_starting(server):
+    import app.services.warmup as warmup
+    from app.services.chunker import get_chunker
+
+    if Config.METRICS_MULTIPROC_DIR:
+        # Snapshots from a previous run would be counted again
+        for path in glob.glob(os.path.join(Config.METRICS_MULTIPROC_DIR, "*.json")):
+            os.unlink(path)
+    for name in warmup.HEAVY_MODULES:
+        importlib.import_module(name)
+    try:
+        get_chunker()
+    except Exception as e:
+        # Each worker's warmup retries the download
+        server.log.warning(f"[SERVER] Tokenizer not preloaded: {str(e)}")
+    server.log.info(f"[SERVER] Preloaded shared modules for {workers} workers")
+
+
+def child_exit(server, worker):
+    import app.services.metrics as metrics
+
+    metrics.mark_process_dead(worker.pid)